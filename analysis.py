@@ -3,98 +3,109 @@
 import duckdb
 import polars as pl
 from datetime import datetime, timedelta
+from rollups import daily_stats_sql
+from rolling import parse_window, rolling_stats_sql, pressure_tendency_sql, cumulative_precipitation_sql
+from archive import observation_source
+from queries import execute
 
 # Connect to your existing DuckDB database
 conn = duckdb.connect('data/weather_data.duckdb')
 
 # Example 1: Basic query to fetch recent records
+# newest rows are in the hot table; the archive is only read if it runs short
 def get_recent_observations(limit=10):
     query = """
     SELECT 
-        observation_time,
-        station_id,
-        neighborhood,
-        temp_f,
-        humidity,
-        wind_mph,
-        precip_today_in
-    FROM weather_observations
-    ORDER BY observation_time DESC
-    LIMIT ?
+        o.observation_time,
+        o.station_id,
+        s.neighborhood,
+        o.temp_f,
+        o.humidity,
+        o.wind_mph,
+        o.precip_today_in
+    FROM (SELECT * FROM {source} ORDER BY observation_time DESC LIMIT ?) o
+    LEFT JOIN stations s ON o.station_id = s.station_id
+    ORDER BY o.observation_time DESC
     """
     
     # Execute query and convert to Polars DataFrame
-    result = conn.execute(query, [limit]).pl()
+    result = execute(conn, "recent_observations", query.format(source="weather_observations"), [limit]).pl()
+    if result.height < limit and observation_source(conn) != "weather_observations":
+        result = execute(conn, "recent_observations", query.format(source="all_observations"), [limit]).pl()
     return result
 
 # Example 2: Get daily temperature averages for the past week
+# whole days come from the daily rollup, the partial first/last day from raw rows
 def get_daily_temperature_averages(days=7):
     end_date = datetime.now()
     start_date = end_date - timedelta(days=days)
     
-    query = """
+    daily_sql, params = daily_stats_sql(start_date, end_date, source=observation_source(conn, start_date))
+    query = f"""
+    WITH daily AS ({daily_sql})
     SELECT 
-        CAST(observation_time AS DATE) AS date,
-        AVG(temp_f) AS avg_temp,
-        MIN(temp_f) AS min_temp,
-        MAX(temp_f) AS max_temp,
-        AVG(humidity) AS avg_humidity
-    FROM weather_observations
-    WHERE observation_time BETWEEN ? AND ?
-    GROUP BY CAST(observation_time AS DATE)
+        bucket AS date,
+        SUM(temp_f_sum) / SUM(temp_f_count) AS avg_temp,
+        MIN(temp_f_min) AS min_temp,
+        MAX(temp_f_max) AS max_temp,
+        SUM(humidity_sum) / SUM(humidity_count) AS avg_humidity
+    FROM daily
+    GROUP BY bucket
     ORDER BY date
     """
     
-    result = conn.execute(query, [start_date, end_date]).pl()
+    result = execute(conn, "daily_temperature_averages", query, params).pl()
     return result
 
 # Example 3: Get observations by neighborhood
+# names are kept per station in the stations table
 def get_neighborhood_stats():
     query = """
     SELECT 
-        neighborhood,
+        s.neighborhood,
         COUNT(*) AS observation_count,
-        AVG(temp_f) AS avg_temp,
-        AVG(humidity) AS avg_humidity,
-        AVG(wind_mph) AS avg_wind,
-        MAX(precip_today_in) AS max_precip
-    FROM weather_observations
-    WHERE neighborhood IS NOT NULL
-    GROUP BY neighborhood
-    ORDER BY neighborhood
+        AVG(o.temp_f) AS avg_temp,
+        AVG(o.humidity) AS avg_humidity,
+        AVG(o.wind_mph) AS avg_wind,
+        MAX(o.precip_today_in) AS max_precip
+    FROM all_observations o
+    JOIN stations s ON o.station_id = s.station_id
+    WHERE s.neighborhood IS NOT NULL
+    GROUP BY s.neighborhood
+    ORDER BY s.neighborhood
     """
     
-    result = conn.execute(query).pl()
+    result = execute(conn, "neighborhood_stats", query).pl()
     return result
 
 # Example 4: Find extreme weather events
-def find_extreme_weather():
+# detected per station as observations are ingested (events.py), so this reads weather_events only
+def find_extreme_weather(days=30):
     query = """
     SELECT 
-        observation_time,
         station_id,
-        neighborhood,
-        temp_f,
-        wind_mph,
-        wind_gust_mph,
-        precip_rate_in,
-        humidity
-    FROM weather_observations
-    WHERE 
-        temp_f > 95 OR
-        temp_f < 32 OR
-        wind_mph > 20 OR
-        wind_gust_mph > 30 OR
-        precip_rate_in > 0.5
-    ORDER BY observation_time DESC
+        rule,
+        metric,
+        start_time,
+        end_time,
+        peak_time,
+        peak_value,
+        threshold
+    FROM weather_events
+    WHERE end_time >= ?
+    ORDER BY start_time DESC
     """
     
-    result = conn.execute(query).pl()
+    result = execute(conn, "extreme_weather", query, [datetime.now() - timedelta(days=days)]).pl()
     return result
 
 # Example 5: Compare current conditions to historical averages
+# the historical window is whole days, so it reads the daily rollup only
 def compare_to_historical_averages(days_back=30):
-    query = """
+    today = datetime.combine(datetime.now().date(), datetime.min.time())
+    historical_sql, params = daily_stats_sql(today - timedelta(days=days_back), today)
+
+    query = f"""
     WITH current_conditions AS (
         SELECT 
             AVG(temp_f) AS current_avg_temp,
@@ -105,13 +116,10 @@ def compare_to_historical_averages(days_back=30):
     ),
     historical AS (
         SELECT 
-            AVG(temp_f) AS historical_avg_temp,
-            AVG(humidity) AS historical_avg_humidity,
-            AVG(wind_mph) AS historical_avg_wind
-        FROM weather_observations
-        WHERE 
-            observation_time < CURRENT_DATE AND
-            observation_time >= date_add(-?, CURRENT_DATE)
+            SUM(temp_f_sum) / SUM(temp_f_count) AS historical_avg_temp,
+            SUM(humidity_sum) / SUM(humidity_count) AS historical_avg_humidity,
+            SUM(wind_mph_sum) / SUM(wind_mph_count) AS historical_avg_wind
+        FROM ({historical_sql})
     )
     SELECT 
         current_avg_temp,
@@ -126,7 +134,31 @@ def compare_to_historical_averages(days_back=30):
     FROM current_conditions, historical
     """
     
-    result = conn.execute(query, [days_back]).pl()
+    result = execute(conn, "historical_comparison", query, params).pl()
+    return result
+
+# Example 6: Rolling 24-hour temperature stats per station over the past month
+# window functions over sorted rows; spans beyond a few days read the hourly rollup
+def get_rolling_stats(metric="temp_f", window="24h", days=30, station_id=None):
+    start = datetime.now() - timedelta(days=days)
+    sql, params, meta = rolling_stats_sql(metric, window, start, station_id=station_id,
+                                          source=observation_source(conn, start - parse_window(window)))
+    result = execute(conn, "rolling_stats", sql, params).pl()
+    return result
+
+# Example 7: Pressure tendency over 3-hour windows, flagging fast falls (storms)
+def get_pressure_tendency(window="3h", days=7, station_id=None):
+    start = datetime.now() - timedelta(days=days)
+    sql, params, meta = pressure_tendency_sql(window, start, station_id=station_id,
+                                              source=observation_source(conn, start - parse_window(window)))
+    result = execute(conn, "pressure_tendency", sql, params).pl()
+    return result
+
+# Example 8: Daily, running and rolling 7-day precipitation totals for the past year
+def get_cumulative_precipitation(days=365, window="7d", station_id=None):
+    start = datetime.now() - timedelta(days=days)
+    sql, params, meta = cumulative_precipitation_sql(start, station_id=station_id, window=window)
+    result = execute(conn, "cumulative_precipitation", sql, params).pl()
     return result
 
 # Example usage
@@ -150,6 +182,16 @@ if __name__ == "__main__":
     print("\nComparison to historical averages:")
     comparison = compare_to_historical_averages()
     print(comparison)
+
+    print("\nRolling 24-hour temperature:")
+    print(get_rolling_stats())
+
+    print("\nPressure tendency (storm flags):")
+    tendency = get_pressure_tendency()
+    print(tendency.filter(pl.col("falling_fast")))
+
+    print("\nPrecipitation totals:")
+    print(get_cumulative_precipitation())
     
     # Close connection when done
     conn.close()
\ No newline at end of file
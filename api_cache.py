@@ -0,0 +1,120 @@
+# api_cache.py
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+from flask import request, make_response
+from config import DB_PATH, API_CACHE_SIZE, API_CACHE_TTL
+
+
+def data_version():
+    """
+    Cheap change marker for the database file
+    DuckDB appends every commit to the .wal and folds it into the main file on checkpoint,
+    so the newest mtime of the two moves whenever any process commits.
+    """
+    version = 0
+    for path in (DB_PATH, DB_PATH + ".wal"):
+        try:
+            version = max(version, os.stat(path).st_mtime_ns)
+        except FileNotFoundError:
+            pass
+    return version
+
+
+class CachedResponse:
+    """Body and validators of one rendered response"""
+
+    def __init__(self, response, version):
+        self.body = response.get_data()
+        self.mimetype = response.mimetype
+        self.headers = {k: v for k, v in response.headers.items() if k.startswith("X-")}
+        self.version = version
+        self.created = time.monotonic()
+        self.etag = hashlib.blake2b(self.body, digest_size=12).hexdigest()
+        # last change to the data this response was built from
+        self.last_modified = datetime.fromtimestamp(version / 1e9, tz=timezone.utc) if version else datetime.now(timezone.utc)
+
+    def to_response(self):
+        response = make_response(self.body)
+        response.mimetype = self.mimetype
+        response.headers.update(self.headers)
+        response.set_etag(self.etag)
+        response.last_modified = self.last_modified
+        # browsers revalidate every time and get a 304 while the data is unchanged
+        response.headers["Cache-Control"] = "no-cache"
+        # the same URL renders differently per Accept header (see formats.py)
+        response.headers["Vary"] = "Accept"
+        return response
+
+
+class ResponseCache:
+    """Bounded LRU of rendered responses with a TTL, dropped when new data is committed"""
+
+    def __init__(self, max_entries=API_CACHE_SIZE, ttl=API_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            if time.monotonic() - entry.created > self.ttl or entry.version != version:
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *args):
+        """Drop every entry (registered as a db_utils commit hook)"""
+        with self._lock:
+            self._entries.clear()
+
+
+cache = ResponseCache()
+
+
+def cached_response(view):
+    """
+    Serve a GET route from the cache, keyed by path + query string + Accept header
+    Only 200 responses are stored. Every response carries an ETag and Last-Modified,
+    and conditional requests are answered with 304 without running the view.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = (request.path, tuple(sorted(request.args.items(multi=True))), request.headers.get("Accept", ""))
+        version = data_version()
+
+        entry = cache.get(key, version)
+        if entry is None:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+
+            entry = CachedResponse(response, version)
+            cache.put(key, entry)
+
+        return entry.to_response().make_conditional(request)
+
+    return wrapper
@@ -1,22 +1,87 @@
 # app.py
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, g
 from flask_cors import CORS
-import duckdb
 import os
+import time
+import duckdb
 from datetime import datetime, timedelta
-from config import DB_PATH
+from config import (
+    DB_PATH, TABLE_NAME, OBSERVATIONS_VIEW, LATEST_TABLE, EVENTS_TABLE, STATIONS_TABLE, EVENT_GAP_MINUTES,
+    API_READ_ONLY, RECENT_WINDOW_HOURS,
+    CUSTOM_QUERY_TIMEOUT, CUSTOM_QUERY_MAX_ROWS, CUSTOM_QUERY_THREADS, CUSTOM_QUERY_MEMORY_LIMIT,
+    API_PROFILING, COLLECTOR_METRICS_PATH, SERIES_DEFAULT_POINTS
+)
+from rollups import daily_stats_sql
+from rolling import parse_window, rolling_stats_sql, pressure_tendency_sql, cumulative_precipitation_sql
+from series import series_sql
+from archive import observation_source
+from connections import ConnectionManager
+from api_cache import cached_response, cache
+from db_utils import on_commit
+from live import Broadcaster
+from formats import negotiate_format, table_response, stream_response, STREAMING_FORMATS, JSONProvider
+from pagination import KEYSET_ORDER, keyset_filter, window_start, next_cursor
+from guardrails import QueryRejected, check_query, cap_rows, bounded_cursor
+from queries import execute, get_query_stats
+import metrics
 
 app = Flask(__name__, static_folder='static')
+app.json = JSONProvider(app)     # times as ISO 8601 with offset, like /api/stream
 CORS(app)  # Enable CORS for all routes
 
-def get_db_connection():
-    """Get a connection to the DuckDB database"""
+# one shared (read-only) handle, a cursor per request thread
+db = ConnectionManager()
+
+# /api/custom runs on its own DuckDB instance (file attached read-only) with its own thread and
+# memory caps, so a heavy query can't starve the dashboard; shares `db` when the writer is in-process
+if API_READ_ONLY:
+    custom_db = ConnectionManager(sandbox=True, config={
+        "threads": CUSTOM_QUERY_THREADS,
+        "memory_limit": CUSTOM_QUERY_MEMORY_LIMIT
+    })
+else:
+    custom_db = db
+custom_cursor = bounded_cursor(custom_db.cursor)
+
+# commits from this process drop cached responses at once; other writers are caught by data_version()
+on_commit(cache.invalidate)
+
+# one watcher fans new observations out to every /api/stream client
+broadcaster = Broadcaster(db.cursor)
+on_commit(broadcaster.notify)
+
+
+### request timing, and ?profile=cprofile|sql when API_PROFILING is on
+
+@app.before_request
+def start_request():
+    g.request_start = time.perf_counter()
+
+    mode = request.args.get("profile")
+    if mode and API_PROFILING:
+        try:
+            metrics.start_profile(mode)
+        except ValueError as e:
+            return jsonify({
+                "status": "ERROR",
+                "error": str(e),
+                "timestamp": datetime.now().isoformat()
+            }), 400
+
+
+@app.after_request
+def finish_request(response):
+    endpoint = request.endpoint or "unmatched"
+    # streamed responses (/api/stream, arrow/ndjson) are timed up to their first chunk
+    metrics.observe("http_request_seconds", time.perf_counter() - g.request_start,
+                    endpoint=endpoint, method=request.method, status=response.status_code)
+
+    profile = metrics.stop_profile(endpoint)
+    if profile:
+        response.headers["X-Profile-File"] = profile
+    return response
 
-    if not os.path.exists(DB_PATH):
-        raise FileNotFoundError(f"Databise file not found: {DB_PATH}")
-    
-    return duckdb.connect(DB_PATH)
 
 @app.route('/')
 def index():
@@ -25,37 +90,37 @@ def index():
 
 
 @app.route('/api/stations', methods=['GET'])
+@cached_response
 def get_stations():
     """Get list of all stations in the database"""
     try:
-        conn = get_db_connection()
-        query = """
-        SELECT DISTINCT 
-            station_id,
-            neighborhood,
-            latitude,
-            longitude,
-            MAX(observation_time) as last_observation
-        FROM weather_observations
-        GROUP BY station_id, neighborhood, latitude, longitude
-        ORDER BY station_id
-        """
-        
-        result = conn.execute(query).fetchall()
+        fmt = negotiate_format()
+
+        with db.cursor() as conn:
+            # one row per station, kept current by every ingest batch
+            query = f"""
+            SELECT
+                l.station_id,
+                s.neighborhood,
+                s.latitude,
+                s.longitude,
+                l.observation_time as last_observation
+            FROM {LATEST_TABLE} l
+            LEFT JOIN {STATIONS_TABLE} s ON l.station_id = s.station_id
+            ORDER BY l.station_id
+            """
         
-        # Convert to list of dictionaries
-        columns = ["station_id", "neighborhood", "latitude", "longitude", "last_observation"]
-        stations = []
-        for row in result:
-            stations.append(dict(zip(columns, row)))
+            result = execute(conn, "stations", query).fetch_arrow_table()
             
-        conn.close()
+            return table_response(conn, result, fmt, key="stations")
+        
+    except ValueError as e:
         return jsonify({
-            "stations": stations,
-            "count": len(stations),
+            "status": "ERROR",
+            "error": str(e),
             "timestamp": datetime.now().isoformat()
-        })
-        
+        }), 400
+
     except Exception as e:
         return jsonify({
             "status": "ERROR",
@@ -68,9 +133,8 @@ def get_stations():
 def health_check():
     """Simple health check endpoint"""
     try:
-        conn = get_db_connection()
-        result = conn.execute("SELECT 'OK' as status").fetchone()[0]
-        conn.close()
+        with db.cursor() as conn:
+            result = conn.execute("SELECT 'OK' as status").fetchone()[0]
         return jsonify({
             "status": result,
             "timestamp": datetime.now().isoformat(),
@@ -83,56 +147,106 @@ def health_check():
             "timestamp": datetime.now().isoformat()
         }), 500
     
+@app.route('/api/query-stats', methods=['GET'])
+def query_stats():
+    """Timing of the named queries behind the API, slowest average first"""
+    stats = sorted(get_query_stats().items(), key=lambda item: item[1]["avg_s"], reverse=True)
+    return jsonify({
+        "queries": [dict(s, name=name) for name, s in stats],
+        "timestamp": datetime.now().isoformat()
+    })
+
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Prometheus text metrics of this process and of the collector's last export (process label)
+    ?format=json returns count/sum/max/p50/p95/p99 per histogram instead.
+    """
+    sources = {"api": metrics.registry.state()}
+    collector = metrics.load(COLLECTOR_METRICS_PATH)
+    if collector:
+        sources["collector"] = collector
+
+    if request.args.get("format") == "json":
+        return jsonify({
+            "metrics": {process: metrics.snapshot(state) for process, state in sources.items()},
+            "timestamp": datetime.now().isoformat()
+        })
+
+    return Response(metrics.render_prometheus(sources), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.route('/api/recent', methods = ['GET'])
+@cached_response
 def get_recent_data():
-    """Get recent weather observations"""
+    """Get recent weather observations, newest first; pass back next_cursor for the following page"""
     try:
         limit = int(request.args.get('limit', 10))
         station_id = request.args.get('station_id')
+        fmt = negotiate_format()
+        cursor = request.args.get('cursor')
+        condition, params = keyset_filter(cursor)
+        since = window_start(cursor, timedelta(hours=RECENT_WINDOW_HOURS))
 
-        conn = get_db_connection()
-        query = """
-        SELECT
-            observation_time,
-            station_id,
-            neighborhood,
-            temp_f,
-            humidity,
-            wind_mph,
-            pressure_hg
-            precip_today_in,
-            collection_time
-        FROM weather_observations
-        """
+        with db.cursor() as conn:
+            query = """
+            SELECT
+                observation_time,
+                station_id,
+                temp_f,
+                humidity,
+                wind_mph,
+                pressure_hg,
+                precip_today_in,
+                collection_time
+            FROM {source}
+            WHERE """ + condition
 
-        params = []
-        if station_id:
-            query += " WHERE station_id = ?"
-            params.append(station_id)
+            if station_id:
+                query += " AND station_id = ?"
+                params.append(station_id)
 
-        query += """
-        ORDER BY observation_time DESC
-        LIMIT ?
-        """
+            order = f"""
+            ORDER BY {KEYSET_ORDER}
+            LIMIT ?
+            """
 
-        params.append(limit)
+            # the page is cut first, then joined to the stations table for its names
+            named = f"""
+            SELECT
+                observation_time, station_id, s.neighborhood, temp_f, humidity, wind_mph,
+                pressure_hg, precip_today_in, collection_time
+            FROM ({{page}}) p
+            LEFT JOIN {STATIONS_TABLE} s USING (station_id)
+            ORDER BY {KEYSET_ORDER}
+            """
 
-        result = conn.execute(query, params).fetchall()
+            # widen step by step: the last few hours of the hot table (zonemaps skip the rest),
+            # the whole hot table, then the archive
+            attempts = [(TABLE_NAME, since), (TABLE_NAME, None)]
+            if observation_source(conn) != TABLE_NAME:
+                attempts.append((OBSERVATIONS_VIEW, None))
 
-        columns = ["observation_time", "station_id", "neighborhood", "temp_f", "humidity", "wind_mph", "pressure_hg", "precip_today_in", "collection_time"]
+            for source, lower in attempts:
+                if lower is None:
+                    page = query.format(source=source) + order
+                    result = execute(conn, "recent", named.format(page=page), params + [limit])
+                else:
+                    page = query.format(source=source) + " AND observation_time >= ?" + order
+                    result = execute(conn, "recent", named.format(page=page), params + [lower, limit])
+                result = result.fetch_arrow_table()
+                if result.num_rows >= limit:
+                    break
 
-        data = []
-        for row in result:
-            data.append(dict(zip(columns, row)))
-
-        conn.close()
+            return table_response(conn, result, fmt, next_cursor=next_cursor(result, limit))
 
+    except ValueError as e:
         return jsonify({
-            "data": data,
-            "count": len(data),
+            "status": "ERROR",
+            "error": str(e),
             "timestamp": datetime.now().isoformat()
-        })
-    
+        }), 400
     except Exception as e:
         return jsonify({
             "status": "ERROR",
@@ -141,7 +255,17 @@ def get_recent_data():
         }), 500
     
 
+@app.route('/api/stream', methods=['GET'])
+def stream_observations():
+    """Server-Sent Events: latest observation per station, then each new one as it is committed"""
+    return Response(broadcaster.stream(), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"   # don't let a proxy buffer the stream
+    })
+
+
 @app.route('/api/summary', methods=['GET'])
+@cached_response
 def get_summary():
     """Get summary statistics for a time period"""
     try:
@@ -151,47 +275,117 @@ def get_summary():
         # Get optional station_id parameter
         station_id = request.args.get('station_id')
         
-        conn = get_db_connection()
-        
-        # Build the WHERE clause
-        where_clause = "WHERE observation_time >= ?"
-        params = [datetime.now() - timedelta(days=days)]
-        
-        if station_id:
-            where_clause += " AND station_id = ?"
-            params.append(station_id)
+        with db.cursor() as conn:
+            # Per-day stats: daily rollup for whole days, raw rows for the partial edge days
+            start = datetime.now() - timedelta(days=days)
+            daily_sql, params = daily_stats_sql(start, station_id=station_id, source=observation_source(conn, start))
             
-        query = f"""
-        SELECT 
-            AVG(temp_f) as avg_temp,
-            MIN(temp_f) as min_temp,
-            MAX(temp_f) as max_temp,
-            AVG(humidity) as avg_humidity,
-            AVG(wind_mph) as avg_wind,
-            MAX(wind_gust_mph) as max_wind_gust,
-            MAX(precip_today_in) as max_precip,
-            COUNT(DISTINCT CAST(observation_time AS DATE)) as days_covered
-        FROM weather_observations
-        {where_clause}
-        """
+            query = f"""
+            WITH daily AS ({daily_sql})
+            SELECT 
+                SUM(temp_f_sum) / SUM(temp_f_count) as avg_temp,
+                MIN(temp_f_min) as min_temp,
+                MAX(temp_f_max) as max_temp,
+                SUM(humidity_sum) / SUM(humidity_count) as avg_humidity,
+                SUM(wind_mph_sum) / SUM(wind_mph_count) as avg_wind,
+                MAX(wind_gust_mph_max) as max_wind_gust,
+                MAX(precip_today_in_max) as max_precip,
+                COUNT(DISTINCT bucket) as days_covered
+            FROM daily
+            """
         
-        result = conn.execute(query, params).fetchone()
+            result = execute(conn, "summary", query, params).fetchone()
         
-        # Convert to dictionary
-        columns = ["avg_temp", "min_temp", "max_temp", "avg_humidity", 
-                  "avg_wind", "max_wind_gust", "max_precip", "days_covered"]
-        summary = dict(zip(columns, result))
+            # Convert to dictionary
+            columns = ["avg_temp", "min_temp", "max_temp", "avg_humidity", 
+                      "avg_wind", "max_wind_gust", "max_precip", "days_covered"]
+            summary = dict(zip(columns, result))
         
-        # Add query parameters to response
-        summary["period_days"] = days
-        summary["station_id"] = station_id if station_id else "all"
+            # Add query parameters to response
+            summary["period_days"] = days
+            summary["station_id"] = station_id if station_id else "all"
             
-        conn.close()
         return jsonify({
             "summary": summary,
             "timestamp": datetime.now().isoformat()
         })
         
+    except ValueError as e:
+        return jsonify({
+            "status": "ERROR",
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 400
+
+    except Exception as e:
+        return jsonify({
+            "status": "ERROR",
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
+
+
+@app.route('/api/events', methods=['GET'])
+@cached_response
+def get_events():
+    """
+    Extreme-weather events (threshold and rate-of-change rules), newest first
+    ?days= (default 30) or ?since= (ISO) keeps events that ended after it; ?station_id=, ?rule=,
+    ?active=1 (only events still going on) and ?limit= (default 1000) narrow it down.
+    """
+    try:
+        fmt = negotiate_format()
+        if request.args.get('since'):
+            since = datetime.fromisoformat(request.args['since'])
+        else:
+            since = datetime.now() - timedelta(days=float(request.args.get('days', 30)))
+        limit = int(request.args.get('limit', 1000))
+
+        with db.cursor() as conn:
+            # an event is active while its station hasn't reported a normal reading for longer than the gap
+            query = f"""
+            SELECT * FROM (
+                SELECT
+                    e.station_id,
+                    e.rule,
+                    e.metric,
+                    e.direction,
+                    e.threshold,
+                    e.start_time,
+                    e.end_time,
+                    e.peak_time,
+                    e.peak_value,
+                    e.end_time >= l.observation_time - INTERVAL {int(EVENT_GAP_MINUTES)} MINUTE AS active
+                FROM {EVENTS_TABLE} e
+                LEFT JOIN {LATEST_TABLE} l ON l.station_id = e.station_id
+                WHERE e.end_time >= ?
+            )
+            WHERE TRUE"""
+            params = [since]
+
+            for column in ('station_id', 'rule'):
+                if request.args.get(column):
+                    query += f" AND {column} = ?"
+                    params.append(request.args[column])
+            if request.args.get('active') in ('1', 'true'):
+                query += " AND active"
+
+            query += """
+            ORDER BY start_time DESC, station_id, rule
+            LIMIT ?
+            """
+            result = execute(conn, "events", query, params + [limit]).fetch_arrow_table()
+
+            return table_response(conn, result, fmt, key="events")
+
+    except ValueError as e:
+        return jsonify({
+            "status": "ERROR",
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 400
+
     except Exception as e:
         return jsonify({
             "status": "ERROR",
@@ -200,10 +394,161 @@ def get_summary():
         }), 500
 
 
+def _rolling_range():
+    """[start, end] of a /api/rolling or /api/series request: ?start=&end= (ISO) or the last ?days= (default 7)"""
+    end = datetime.fromisoformat(request.args['end']) if request.args.get('end') else datetime.now()
+    if request.args.get('start'):
+        return datetime.fromisoformat(request.args['start']), end
+    return end - timedelta(days=float(request.args.get('days', 7))), end
+
+
+@app.route('/api/rolling', methods=['GET'])
+@cached_response
+def get_rolling_stats():
+    """Rolling mean/min/max/std of ?metric= over a trailing ?window= (1h, 24h, 7d...), per station"""
+    try:
+        fmt = negotiate_format()
+        start, end = _rolling_range()
+        window = parse_window(request.args.get('window', '24h'))
+
+        with db.cursor() as conn:
+            sql, params, meta = rolling_stats_sql(
+                request.args.get('metric', 'temp_f'), window, start, end,
+                station_id=request.args.get('station_id'), step=request.args.get('step'),
+                source=observation_source(conn, start - window)
+            )
+            result = execute(conn, "rolling_stats", sql, params).fetch_arrow_table()
+
+            return table_response(conn, result, fmt, **meta)
+
+    except ValueError as e:
+        return jsonify({
+            "status": "ERROR",
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 400
+
+    except Exception as e:
+        return jsonify({
+            "status": "ERROR",
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
+
+@app.route('/api/rolling/pressure', methods=['GET'])
+@cached_response
+def get_pressure_tendency():
+    """Pressure change and rate per hour over a trailing ?window= (default 3h), with a falling_fast storm flag"""
+    try:
+        fmt = negotiate_format()
+        start, end = _rolling_range()
+        window = parse_window(request.args.get('window', '3h'))
+
+        with db.cursor() as conn:
+            sql, params, meta = pressure_tendency_sql(
+                window, start, end,
+                station_id=request.args.get('station_id'), step=request.args.get('step'),
+                source=observation_source(conn, start - window)
+            )
+            result = execute(conn, "pressure_tendency", sql, params).fetch_arrow_table()
+
+            return table_response(conn, result, fmt, **meta)
+
+    except ValueError as e:
+        return jsonify({
+            "status": "ERROR",
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 400
+
+    except Exception as e:
+        return jsonify({
+            "status": "ERROR",
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
+
+@app.route('/api/rolling/precipitation', methods=['GET'])
+@cached_response
+def get_cumulative_precipitation():
+    """Daily precipitation per station: day total, running total and trailing ?window= total (default 7d)"""
+    try:
+        fmt = negotiate_format()
+        start, end = _rolling_range()
+
+        with db.cursor() as conn:
+            sql, params, meta = cumulative_precipitation_sql(
+                start, end, station_id=request.args.get('station_id'),
+                window=request.args.get('window', '7d'), step=request.args.get('step')
+            )
+            result = execute(conn, "cumulative_precipitation", sql, params).fetch_arrow_table()
+
+            return table_response(conn, result, fmt, **meta)
+
+    except ValueError as e:
+        return jsonify({
+            "status": "ERROR",
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 400
+
+    except Exception as e:
+        return jsonify({
+            "status": "ERROR",
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
+
+@app.route('/api/series', methods=['GET'])
+@cached_response
+def get_series():
+    """
+    Chart data for ?metric= (default temp_f): at most ?points= rows per station for any range
+    (?days= or ?start=/?end=, optional ?station_id=). ?method=bucket (default) returns time
+    buckets with mean/min/max/count, ?method=lttb the rows that best keep the line's shape.
+    """
+    try:
+        fmt = negotiate_format()
+        start, end = _rolling_range()
+
+        with db.cursor() as conn:
+            sql, params, meta = series_sql(
+                request.args.get('metric', 'temp_f'), start, end,
+                points=int(request.args.get('points', SERIES_DEFAULT_POINTS)),
+                station_id=request.args.get('station_id'), method=request.args.get('method', 'bucket'),
+                source=observation_source(conn, start)
+            )
+            result = execute(conn, f"series_{meta['method']}", sql, params).fetch_arrow_table()
+
+            return table_response(conn, result, fmt, **meta)
+
+    except ValueError as e:
+        return jsonify({
+            "status": "ERROR",
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 400
+
+    except Exception as e:
+        return jsonify({
+            "status": "ERROR",
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
 
 @app.route('/api/custom', methods=['POST'])
 def custom_query():
-    """Run a custom query with parameters (with some safety restrictions)"""
+    """
+    Run a custom query with parameters (with some safety restrictions)
+    Optional "page_size"/"cursor" page the result by (observation_time, station_id), which the
+    query must return. Without them, format=arrow/ndjson streams the whole result.
+    Queries are checked before running (single SELECT, allowed tables only, no cross products),
+    interrupted after CUSTOM_QUERY_TIMEOUT seconds and capped at CUSTOM_QUERY_MAX_ROWS rows.
+    """
     try:
         # Get JSON data from request
         data = request.get_json()
@@ -217,32 +562,62 @@ def custom_query():
         query = data["query"]
         params = data.get("params", [])
         
-        # Basic security check - only allow SELECT queries
-        if not query.strip().upper().startswith("SELECT"):
-            return jsonify({
-                "status": "ERROR",
-                "error": "Only SELECT queries are allowed"
-            }), 403
+        fmt = negotiate_format()
+        page_size = data.get("page_size")
+
+        with custom_db.cursor() as conn:
+            check_query(conn, query, params)
+
+        if page_size is None and fmt in STREAMING_FORMATS:
+            return stream_response(custom_cursor, cap_rows(query), params, fmt)
+
+        meta = {}
+        if page_size is not None:
+            page_size = min(int(page_size), CUSTOM_QUERY_MAX_ROWS)
+            condition, keyset_params = keyset_filter(data.get("cursor"))
+            query = f"""
+            SELECT * FROM ({query.strip().rstrip(';')}) AS q
+            WHERE {condition}
+            ORDER BY {KEYSET_ORDER}
+            LIMIT ?
+            """
+            params = list(params) + keyset_params + [page_size]
+        else:
+            # one extra row tells us whether the cap cut the result short
+            query = cap_rows(query, CUSTOM_QUERY_MAX_ROWS + 1)
+
+        with custom_cursor() as conn:
+            result = conn.execute(query, params).fetch_arrow_table()
+
+            if page_size is not None:
+                meta["next_cursor"] = next_cursor(result, page_size)
+            elif result.num_rows > CUSTOM_QUERY_MAX_ROWS:
+                result = result.slice(0, CUSTOM_QUERY_MAX_ROWS)
+                meta["truncated"] = True
             
-        conn = get_db_connection()
-        result = conn.execute(query, params).fetchall()
+            return table_response(conn, result, fmt, columns=result.column_names, **meta)
         
-        # Get column names
-        column_names = [desc[0] for desc in conn.description]
-        
-        # Convert results to list of dictionaries
-        rows = []
-        for row in result:
-            rows.append(dict(zip(column_names, row)))
-            
-        conn.close()
+    except QueryRejected as e:
         return jsonify({
-            "data": rows,
-            "count": len(rows),
-            "columns": column_names,
+            "status": "ERROR",
+            "error": str(e),
             "timestamp": datetime.now().isoformat()
-        })
-        
+        }), 403
+
+    except duckdb.InterruptException:
+        return jsonify({
+            "status": "ERROR",
+            "error": f"Query cancelled after {CUSTOM_QUERY_TIMEOUT} seconds",
+            "timestamp": datetime.now().isoformat()
+        }), 504
+
+    except ValueError as e:
+        return jsonify({
+            "status": "ERROR",
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 400
+
     except Exception as e:
         return jsonify({
             "status": "ERROR",
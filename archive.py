@@ -0,0 +1,148 @@
+# archive.py
+
+import glob
+import os
+import uuid
+from datetime import datetime, timedelta
+import duckdb
+from config import DB_PATH, TABLE_NAME, OBSERVATIONS_VIEW, ARCHIVE_PATH, ARCHIVE_AFTER_DAYS
+
+ARCHIVE_STATE_TABLE = "archive_state"
+
+# hive layout: station_id=.../year=.../month=.../*.parquet
+ARCHIVE_GLOB = f"{ARCHIVE_PATH}/*/*/*/*.parquet"
+
+
+### archive state
+
+def table_exists(conn, name):
+    result = conn.execute("SELECT COUNT(*) FROM duckdb_tables() WHERE table_name = ?", [name]).fetchone()
+    return result[0] > 0
+
+
+def archive_cutoff(conn):
+    """Observations before this timestamp live in Parquet (None if nothing is archived)"""
+    if not table_exists(conn, ARCHIVE_STATE_TABLE):
+        return None
+
+    return conn.execute(f"SELECT MAX(cutoff) FROM {ARCHIVE_STATE_TABLE}").fetchone()[0]
+
+
+def observation_source(conn, since=None):
+    """
+    Relation to read raw observations from, given the oldest time a query needs
+    Queries that stay above the archive cutoff read the hot table only, everything
+    else goes through the unified view.
+    """
+    cutoff = archive_cutoff(conn)
+    if cutoff is None or (since is not None and since >= cutoff):
+        return TABLE_NAME
+
+    return OBSERVATIONS_VIEW
+
+
+### unified view
+
+def create_observations_view(conn):
+    """
+    (Re)create the view spanning the hot table and the Parquet archive
+    Files are matched by column name, so exports made before a storage migration still read.
+    """
+    columns = [row[:2] for row in conn.execute(f"DESCRIBE {TABLE_NAME}").fetchall()]
+    select_list = ", ".join(name for name, _ in columns)
+
+    if glob.glob(ARCHIVE_GLOB):
+        archive = f"read_parquet('{ARCHIVE_GLOB}', hive_partitioning = 1, union_by_name = 1)"
+        archived = {row[0] for row in conn.execute(f"DESCRIBE SELECT * FROM {archive}").fetchall()}
+        # columns no archived file has (the table changed layout since) read as NULL
+        archive_list = ", ".join(name if name in archived else f"CAST(NULL AS {type_}) AS {name}"
+                                 for name, type_ in columns)
+        conn.execute(f"""
+            CREATE OR REPLACE VIEW {OBSERVATIONS_VIEW} AS
+            SELECT {select_list} FROM {TABLE_NAME}
+            UNION ALL
+            SELECT {archive_list} FROM {archive}
+        """)
+    else:
+        conn.execute(f"""
+            CREATE OR REPLACE VIEW {OBSERVATIONS_VIEW} AS
+            SELECT {select_list} FROM {TABLE_NAME}
+        """)
+
+
+def ensure_observations_view(conn):
+    """Create the unified view if this database doesn't have it yet"""
+    exists = conn.execute("SELECT COUNT(*) FROM duckdb_views() WHERE view_name = ?",
+                          [OBSERVATIONS_VIEW]).fetchone()[0]
+    if not exists:
+        create_observations_view(conn)
+
+
+### move cold rows to Parquet
+
+def archive_observations(days=ARCHIVE_AFTER_DAYS):
+    """
+    Export observations older than `days` (whole days) to Hive-partitioned Parquet and
+    delete them from the hot table
+    Files are written sorted by observation_time so row-group min/max stats prune time
+    ranges; the station_id/year/month directories prune by partition. Rollups keep
+    covering archived days. Returns the number of rows moved.
+    """
+    cutoff = datetime.combine(datetime.now().date() - timedelta(days=days), datetime.min.time())
+    run_id = uuid.uuid4().hex[:12]
+
+    os.makedirs(ARCHIVE_PATH, exist_ok=True)
+    conn = duckdb.connect(DB_PATH)
+
+    try:
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {ARCHIVE_STATE_TABLE} (cutoff TIMESTAMP, archived_at TIMESTAMP, rows BIGINT)")
+
+        rows = conn.execute(f"SELECT COUNT(*) FROM {TABLE_NAME} WHERE observation_time < ?", [cutoff]).fetchone()[0]
+        if rows == 0:
+            print(f"Nothing older than {cutoff} to archive")
+            create_observations_view(conn)
+            return 0
+
+        columns = [row[0] for row in conn.execute(f"DESCRIBE {TABLE_NAME}").fetchall()]
+        conn.execute(f"""
+            COPY (
+                SELECT {", ".join(columns)},
+                    year(observation_time) AS year,
+                    month(observation_time) AS month
+                FROM {TABLE_NAME}
+                WHERE observation_time < '{cutoff.isoformat(sep=" ")}'
+                ORDER BY station_id, observation_time
+            ) TO '{ARCHIVE_PATH}' (
+                FORMAT PARQUET,
+                PARTITION_BY (station_id, year, month),
+                FILENAME_PATTERN 'obs_{run_id}_{{i}}',
+                OVERWRITE_OR_IGNORE 1,
+                COMPRESSION ZSTD
+            )
+        """)
+
+        conn.execute("BEGIN TRANSACTION")
+        try:
+            conn.execute(f"DELETE FROM {TABLE_NAME} WHERE observation_time < ?", [cutoff])
+            conn.execute(f"INSERT INTO {ARCHIVE_STATE_TABLE} VALUES (?, ?, ?)", [cutoff, datetime.now(), rows])
+            create_observations_view(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            # rows are still in the hot table: drop this run's files so nothing is counted twice
+            for path in glob.glob(f"{ARCHIVE_PATH}/**/obs_{run_id}_*.parquet", recursive=True):
+                os.remove(path)
+            raise
+
+        conn.execute("CHECKPOINT")
+    finally:
+        conn.close()
+
+    print(f"Archived {rows} observations older than {cutoff} to {ARCHIVE_PATH}")
+
+    return rows
+
+
+def archive_size():
+    """Bytes used by the Parquet archive"""
+    return sum(os.path.getsize(path) for path in glob.glob(ARCHIVE_GLOB))
@@ -0,0 +1,171 @@
+# backfill.py
+
+import threading
+import time
+import pyarrow as pa
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+from config import CHECKPOINT_TABLE, BACKFILL_WORKERS, BACKFILL_BATCH_ROWS
+from db_utils import connect, initialize_db, bulk_insert, notify_commit
+from weather_api import STATIONS, get_historical_data
+
+
+### checkpoints: one row per finished (station, day)
+
+def initialize_checkpoints(conn):
+    """Create the checkpoint table if needed"""
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} (
+            station_id VARCHAR,
+            day DATE,
+            rows INTEGER,
+            completed_at TIMESTAMP,
+            PRIMARY KEY (station_id, day)
+        )
+    """)
+
+
+def completed_windows(conn, station_ids, start_date, end_date):
+    """Set of (station_id, day) pairs already backfilled in the range"""
+    result = conn.execute(f"""
+        SELECT station_id, day FROM {CHECKPOINT_TABLE}
+        WHERE day BETWEEN ? AND ?
+        AND list_contains(?, station_id)
+    """, [start_date, end_date, list(station_ids)]).fetchall()
+
+    return set(result)
+
+
+### planning
+
+def _as_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+def plan_windows(station_ids, start_date, end_date):
+    """All (station_id, day) windows in the inclusive range, oldest day first"""
+    start_date, end_date = _as_date(start_date), _as_date(end_date)
+
+    windows = []
+    day = start_date
+    while day <= end_date:
+        for station_id in station_ids:
+            windows.append((station_id, day))
+        day += timedelta(days=1)
+
+    return windows
+
+
+def _fetch_window(window):
+    station_id, day = window
+    return window, get_historical_data(station_id, day.strftime("%Y%m%d"))
+
+
+### writer
+
+def _flush(conn, buffered, write_lock):
+    """Write buffered windows (Arrow tables from get_historical_data) and their checkpoints in one transaction"""
+    records = pa.concat_tables([rows for _, rows in buffered])
+    now = datetime.now()
+    # today's history is still growing: store its rows but leave it open for the next gap fill
+    finished = [[station_id, day, len(rows), now] for (station_id, day), rows in buffered if day < now.date()]
+
+    with write_lock:
+        conn.execute("BEGIN TRANSACTION")
+        try:
+            if records.num_rows:
+                bulk_insert(records, conn, transaction=False)
+            if finished:
+                conn.executemany(
+                    f"""
+                    INSERT INTO {CHECKPOINT_TABLE} VALUES (?, ?, ?, ?)
+                    ON CONFLICT (station_id, day) DO UPDATE SET rows = excluded.rows, completed_at = excluded.completed_at
+                    """,
+                    finished
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    if records.num_rows:
+        notify_commit()
+
+    return records.num_rows
+
+
+### run
+
+def run_backfill(start_date, end_date, station_ids=None, workers=None, write_lock=None):
+    """
+    Backfill history for every station and day in [start_date, end_date]
+    Windows are fetched concurrently (paced by the shared per-host rate limit in http_client),
+    streamed into the bulk writer, and checkpointed in the same transaction as their rows,
+    so rerunning after an interruption only fetches the windows that are still missing.
+    `write_lock` is held around each write only, never while fetching, so other writers in
+    the process (e.g. the collector's ingest pipeline) are not held up by slow requests.
+    """
+    if station_ids is None:
+        station_ids = [station["id"] for station in STATIONS if station["id"]]
+    start_date, end_date = _as_date(start_date), _as_date(end_date)
+    write_lock = write_lock or threading.Lock()
+
+    with write_lock:
+        initialize_db()
+        conn = connect()
+        initialize_checkpoints(conn)
+
+    done = completed_windows(conn, station_ids, start_date, end_date)
+    pending = [w for w in plan_windows(station_ids, start_date, end_date) if w not in done]
+
+    print(f"Backfill {start_date} to {end_date}: {len(pending)} windows to fetch, "
+          f"{len(done)} already complete")
+
+    summary = {"windows": len(pending), "written": 0, "failed": [], "rows": 0}
+    started = time.perf_counter()
+
+    workers = workers or BACKFILL_WORKERS
+    buffered, buffered_rows = [], 0
+    queue = iter(pending)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="backfill") as pool:
+            # keep a bounded number of windows in flight so memory stays flat
+            in_flight = set()
+            for window in queue:
+                in_flight.add(pool.submit(_fetch_window, window))
+                if len(in_flight) >= workers * 2:
+                    break
+
+            while in_flight:
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+
+                for future in finished:
+                    window, rows = future.result()
+                    if rows is None:
+                        summary["failed"].append(window)
+                    else:
+                        buffered.append((window, rows))
+                        buffered_rows += len(rows)
+
+                    next_window = next(queue, None)
+                    if next_window is not None:
+                        in_flight.add(pool.submit(_fetch_window, next_window))
+
+                if buffered and (buffered_rows >= BACKFILL_BATCH_ROWS or not in_flight):
+                    batch, buffered, buffered_rows = buffered, [], 0
+                    summary["rows"] += _flush(conn, batch, write_lock)
+                    summary["written"] += len(batch)
+                    print(f"  {summary['written']}/{summary['windows']} windows, {summary['rows']} rows")
+    finally:
+        # keep whatever finished if we are interrupted mid-run
+        if buffered:
+            summary["rows"] += _flush(conn, buffered, write_lock)
+            summary["written"] += len(buffered)
+        conn.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"Backfill finished in {elapsed:.1f}s: {summary['rows']} rows from {summary['written']} windows, "
+          f"{len(summary['failed'])} failed (rerun to retry)")
+
+    return summary
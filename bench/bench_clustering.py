@@ -0,0 +1,131 @@
+# bench/bench_clustering.py
+#
+# Query latency on a synthetic weather_observations table as it grows: in append order
+# (collection plus a late backfill of older history), then after cluster_observations()
+# in station-major and in time-major order.
+#
+#   python bench/bench_clustering.py --rows 1000000,5000000,20000000
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("API_READ_ONLY", "0")     # the benchmark writes in-process
+
+import app
+from config import TABLE_NAME
+from db_utils import cluster_observations
+from queries import execute
+from synthetic import build
+
+STATION = "S007"
+
+# physical orders compared against the append order
+LAYOUTS = ["station_id, observation_time", "observation_time, station_id"]
+
+
+### scenarios
+
+def _route(client, url):
+    def run():
+        app.cache.invalidate()
+        response = client.get(url)
+        assert response.status_code == 200, response.get_data(as_text=True)
+    return run
+
+
+def _range_summary(start, end, station_id=None):
+    station_filter = " AND station_id = ?" if station_id else ""
+    params = [start, end] + ([station_id] if station_id else [])
+
+    def run():
+        with app.db.cursor() as conn:
+            execute(conn, "bench_range", f"""
+                SELECT station_id, AVG(temp_f), MIN(temp_f), MAX(temp_f), COUNT(*)
+                FROM {TABLE_NAME}
+                WHERE observation_time >= ? AND observation_time < ?{station_filter}
+                GROUP BY station_id
+            """, params).fetchall()
+    return run
+
+
+def scenarios(client, end):
+    start = end - timedelta(days=20)
+    return {
+        "recent?station_id": _route(client, f"/api/recent?station_id={STATION}&limit=50"),
+        "recent": _route(client, "/api/recent?limit=50"),
+        "summary?days=7&station_id": _route(client, f"/api/summary?days=7&station_id={STATION}"),
+        "raw 6h range, one station": _range_summary(start, start + timedelta(hours=6), STATION),
+        "raw 6h range, all stations": _range_summary(start, start + timedelta(hours=6)),
+    }
+
+
+def measure(fn, repeat):
+    fn()    # warm up: loads the blocks
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+### main
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark hot queries before/after clustering")
+    parser.add_argument("--rows", default="1000000,5000000,20000000", help="Comma-separated table sizes")
+    parser.add_argument("--stations", type=int, default=20)
+    parser.add_argument("--backfill", type=float, default=0.3, help="Share of history inserted last, out of order")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--json", metavar="FILE", help="Also write the results as JSON")
+    args = parser.parse_args()
+
+    client = app.app.test_client()
+    results = []
+    home = os.getcwd()
+
+    for rows in [int(float(r)) for r in args.rows.split(",")]:
+        with tempfile.TemporaryDirectory(prefix="bench_") as workdir:
+            # DB_PATH is relative: point it at a scratch database
+            os.chdir(workdir)
+            os.makedirs("data")
+
+            start = time.perf_counter()
+            end = build(args.stations, rows // args.stations, args.backfill)
+            print(f"\n{rows:,} rows, {args.stations} stations: built in {time.perf_counter() - start:.1f}s")
+
+            timings = {name: {"append order": measure(fn, args.repeat)} for name, fn in scenarios(client, end).items()}
+
+            cluster_seconds = {}
+            for order in LAYOUTS:
+                app.db.close()
+                report = cluster_observations(force=True, order=order)
+                cluster_seconds[order] = report["seconds"]
+                for name, fn in scenarios(client, end).items():
+                    timings[name][order] = measure(fn, args.repeat)
+
+            app.db.close()
+            os.chdir(home)
+
+        layouts = ["append order"] + LAYOUTS
+        print(f"{'query (median ms)':30}" + "".join(f"{layout:>34}" for layout in layouts))
+        for name, t in timings.items():
+            print(f"{name:30}" + "".join(f"{t[layout]:>34.2f}" for layout in layouts))
+
+        results.append({"rows": rows, "stations": args.stations, "cluster_seconds": cluster_seconds,
+                        "queries_ms": timings})
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,391 @@
+# bench/run_benchmarks.py
+#
+# Benchmark suite: ingest throughput, every analysis.py function, every app.py route (through
+# the Flask test client) and end-to-end collection cycles against a local stub of the Weather
+# Underground API, on a synthetic database of N stations x M years at a 5-minute cadence.
+# Results are printed and, with --json, written to a file a later run can be compared to.
+#
+#   python bench/run_benchmarks.py --stations 10 --years 1 --json bench-results.json
+#   python bench/run_benchmarks.py --compare bench-results.json
+
+import argparse
+import contextlib
+import inspect
+import io
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# config is read at import: the suite writes in-process and talks to the stub, unthrottled
+STUB_PORT = _free_port()
+os.environ.setdefault("API_READ_ONLY", "0")
+os.environ["WU_API_HOST"] = f"http://127.0.0.1:{STUB_PORT}"
+os.environ.setdefault("API_RATE_LIMIT", "1000")
+os.environ.setdefault("API_RATE_BURST", "1000")
+os.environ.setdefault("STATION_ID", "S001")
+
+import duckdb
+import polars
+import pyarrow
+import stub_server
+from synthetic import build, observation_batch, history_payload, station_id, STEPS_PER_YEAR
+from config import TABLE_NAME
+from db_utils import connect, observation_layout, storage_report
+
+SECTIONS = ("ingest", "analysis", "api", "collection")
+
+
+### timing
+
+def measure(fn, repeat, warmup=1, quiet=True):
+    """Run fn warmup + repeat times; timings in ms of the repeat runs"""
+    out = io.StringIO() if quiet else sys.stdout
+    with contextlib.redirect_stdout(out):
+        for _ in range(warmup):
+            fn()
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            times.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "median_ms": statistics.median(times),
+        "min_ms": min(times),
+        "p95_ms": statistics.quantiles(times, n=20)[18] if len(times) > 1 else times[0],
+        "runs": repeat,
+    }
+
+
+def _throughput(result, rows):
+    result["rows"] = rows
+    result["rows_per_sec"] = rows / (result["median_ms"] / 1000) if result["median_ms"] else 0.0
+    return result
+
+
+### ingest
+
+def bench_ingest(args, end):
+    from db_utils import save_weather_data
+    from parsing import parse_observations
+
+    # every run gets rows the table doesn't hold yet, so the insert really happens; they go
+    # before the synthetic history so later sections query the same data
+    first = end - timedelta(days=args.years * 365 + 1)
+
+    def fresh_batches(rows):
+        nonlocal first
+        span = timedelta(minutes=5 * (rows // args.stations + 1))
+        batches = []
+        for _ in range(args.repeat + 1):
+            batches.append(observation_batch(args.stations, rows, first))
+            first -= span
+        return batches
+
+    results = {}
+    for rows in (1, 100, 10_000, 100_000):
+        batches = fresh_batches(rows)
+        if rows <= 100:
+            batches = [batch.to_pylist() for batch in batches]     # collectors hand over dicts
+
+        pending = iter(batches)
+        results[f"save_weather_data {rows:,} rows"] = _throughput(
+            measure(lambda: save_weather_data(next(pending)), args.repeat), rows)
+
+    # re-ingesting stored rows: the dedup path, nothing inserted
+    stored = observation_batch(args.stations, 10_000, end)
+    results["save_weather_data 10,000 rows (already stored)"] = _throughput(
+        measure(lambda: save_weather_data(stored), args.repeat), 10_000)
+
+    payload = history_payload(station_id(0), end.date() - timedelta(days=1))
+    results["parse_observations 1 station-day"] = _throughput(
+        measure(lambda: parse_observations(payload), args.repeat * 10), 288)
+
+    return results
+
+
+### analysis.py
+
+def bench_analysis(args, end):
+    import analysis
+
+    # every public function of the module that runs with its defaults
+    functions = [(name, fn) for name, fn in inspect.getmembers(analysis, inspect.isfunction)
+                 if fn.__module__ == "analysis" and not name.startswith("_")
+                 and all(p.default is not p.empty for p in inspect.signature(fn).parameters.values())]
+
+    return {f"{name}()": measure(fn, args.repeat) for name, fn in functions}
+
+
+### app.py routes
+
+def _first_event(client):
+    response = client.get("/api/stream")
+    try:
+        next(iter(response.response))
+    finally:
+        response.close()
+
+
+def route_requests(client, end):
+    """endpoint -> {label: request fn}; every app.py route should have an entry"""
+    station = station_id(7)
+    since = (end - timedelta(days=1)).isoformat()
+    first_page = client.get("/api/recent?limit=100").get_json()
+
+    def get(url):
+        return lambda: client.get(url)
+
+    def post(body, fmt=None):
+        return lambda: client.post("/api/custom", json=body, query_string={"format": fmt} if fmt else None)
+
+    aggregate = {"query": "SELECT station_id, AVG(temp_f) AS avg_temp FROM weather_observations "
+                          "WHERE observation_time >= ? GROUP BY station_id", "params": [since]}
+    raw_day = {"query": "SELECT * FROM weather_observations WHERE observation_time >= ?", "params": [since]}
+
+    return {
+        "index": {"/": get("/")},
+        "get_stations": {"/api/stations": get("/api/stations"),
+                         "/api/stations format=arrow": get("/api/stations?format=arrow")},
+        "health_check": {"/api/health": get("/api/health")},
+        "query_stats": {"/api/query-stats": get("/api/query-stats")},
+        "get_metrics": {"/api/metrics": get("/api/metrics"),
+                        "/api/metrics format=json": get("/api/metrics?format=json")},
+        "get_recent_data": {
+            "/api/recent limit=100": get("/api/recent?limit=100"),
+            "/api/recent limit=100 station_id": get(f"/api/recent?limit=100&station_id={station}"),
+            "/api/recent limit=100 next page": get(f"/api/recent?limit=100&cursor={first_page['next_cursor']}"),
+            "/api/recent limit=10000 format=arrow": get("/api/recent?limit=10000&format=arrow"),
+        },
+        "get_summary": {
+            "/api/summary days=7": get("/api/summary?days=7"),
+            "/api/summary days=30 station_id": get(f"/api/summary?days=30&station_id={station}"),
+        },
+        "get_events": {
+            "/api/events days=30": get("/api/events?days=30"),
+            "/api/events days=3650 station_id": get(f"/api/events?days=3650&station_id={station}"),
+        },
+        "get_rolling_stats": {
+            "/api/rolling window=1h days=1": get("/api/rolling?window=1h&days=1"),
+            "/api/rolling window=24h days=365": get("/api/rolling?window=24h&days=365"),
+            "/api/rolling window=7d all history station_id": get(f"/api/rolling?window=7d&days=36500&station_id={station}"),
+        },
+        "get_pressure_tendency": {
+            "/api/rolling/pressure window=3h days=7": get("/api/rolling/pressure?window=3h&days=7"),
+            "/api/rolling/pressure window=3h days=365": get("/api/rolling/pressure?window=3h&days=365"),
+        },
+        "get_cumulative_precipitation": {
+            "/api/rolling/precipitation days=365": get("/api/rolling/precipitation?days=365"),
+        },
+        "get_series": {
+            "/api/series days=1 station_id": get(f"/api/series?days=1&station_id={station}"),
+            "/api/series days=365 station_id": get(f"/api/series?days=365&station_id={station}"),
+            "/api/series days=365 method=lttb station_id": get(f"/api/series?days=365&method=lttb&station_id={station}"),
+            "/api/series days=3650 points=1000 format=columns": get("/api/series?days=3650&points=1000&format=columns"),
+        },
+        "custom_query": {
+            "/api/custom aggregate": post(aggregate),
+            "/api/custom 1 day raw format=arrow": post(raw_day, "arrow"),
+            "/api/custom 1 day raw page_size=1000": post(dict(raw_day, page_size=1000)),
+        },
+        "stream_observations": {"/api/stream first event": lambda: _first_event(client)},
+    }
+
+
+def bench_api(args, end):
+    import app
+
+    client = app.app.test_client()
+    requests = route_requests(client, end)
+
+    for rule in app.app.url_map.iter_rules():
+        if rule.endpoint != "static" and rule.endpoint not in requests:
+            print(f"  no benchmark for route {rule.rule} ({rule.endpoint})")
+
+    def uncached(send):
+        def run():
+            app.cache.invalidate()
+            response = send()
+            if response is not None:
+                assert response.status_code == 200, response.get_data(as_text=True)[:200]
+                response.get_data()
+        return run
+
+    results = {}
+    for endpoint, labelled in requests.items():
+        for label, send in labelled.items():
+            results[label] = measure(uncached(send), args.repeat)
+
+    # the same request again, answered from the response cache
+    summary = requests["get_summary"]["/api/summary days=7"]
+    results["/api/summary days=7 (cached)"] = measure(summary, args.repeat)
+
+    app.db.close()
+    return results
+
+
+### collection cycles against the stub API
+
+def bench_collection(args, end):
+    import weather_api
+    from scheduler_orig import collect_weather_data_multiple
+    from weather_collector import collect_and_store_weather
+    from backfill import run_backfill
+
+    stations = [station_id(i) for i in range(args.stations)]
+    weather_api.STATIONS = [{"id": s, "name": f"Bench {s}"} for s in stations]
+
+    results = {
+        f"collect_weather_data_multiple {len(stations)} stations": _throughput(
+            measure(collect_weather_data_multiple, args.repeat), len(stations)),
+        "collect_and_store_weather 1day": measure(collect_and_store_weather, args.repeat),
+    }
+
+    # each run backfills days nothing has checkpointed yet
+    days = 7
+    first = (end - timedelta(days=args.years * 365 + 400)).date()
+    ranges = iter([(first - timedelta(days=days * (run + 1)), first - timedelta(days=days * run + 1))
+                   for run in range(args.repeat + 1)])
+    backfill_stations = stations[:4]
+    results[f"run_backfill {len(backfill_stations)} stations x {days} days"] = _throughput(
+        measure(lambda: run_backfill(*next(ranges), station_ids=backfill_stations), args.repeat),
+        len(backfill_stations) * days * 288)
+
+    return results
+
+
+### reporting
+
+def report(results, baseline=None, threshold=0.2):
+    """Print results (with the change from `baseline`); returns the regressions found"""
+    regressions = []
+    for section, entries in results.items():
+        print(f"\n{section}")
+        print(f"  {'benchmark':58}{'median ms':>12}{'p95 ms':>12}{'rows/sec':>14}{'vs baseline':>14}")
+        for name, r in entries.items():
+            rate = f"{r['rows_per_sec']:,.0f}" if "rows_per_sec" in r else ""
+            change = ""
+            old = (baseline or {}).get(section, {}).get(name)
+            if old and old["median_ms"]:
+                ratio = r["median_ms"] / old["median_ms"]
+                change = f"{ratio:.2f}x"
+                if ratio > 1 + threshold:
+                    change += " !"
+                    regressions.append((section, name, ratio))
+            print(f"  {name:58}{r['median_ms']:>12.2f}{r['p95_ms']:>12.2f}{rate:>14}{change:>14}")
+    return regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+### main
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingest, queries, API routes and collection")
+    parser.add_argument("--stations", type=int, default=10)
+    parser.add_argument("--years", type=float, default=1.0, help="History per station at 5-minute cadence")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--sections", default=",".join(SECTIONS), help="Comma-separated subset of: " + ", ".join(SECTIONS))
+    parser.add_argument("--api-latency", type=float, default=0, help="Milliseconds the stub API adds per request")
+    parser.add_argument("--json", metavar="FILE", help="Write the results as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="Earlier --json output to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    sections = [s.strip() for s in args.sections.split(",") if s.strip()]
+    unknown = set(sections) - set(SECTIONS)
+    if unknown:
+        parser.error(f"unknown sections: {', '.join(sorted(unknown))}")
+
+    steps = int(args.years * STEPS_PER_YEAR)
+    stub = stub_server.start(STUB_PORT, latency=args.api_latency / 1000)
+    results = {}
+    home = os.getcwd()
+
+    with tempfile.TemporaryDirectory(prefix="bench_") as workdir:
+        # DB_PATH, ARCHIVE_PATH and SPOOL_PATH are relative: everything lands in the scratch dir
+        os.chdir(workdir)
+        os.makedirs("data")
+        try:
+            start = time.perf_counter()
+            end = build(args.stations, steps)
+            build_seconds = time.perf_counter() - start
+            with connect() as conn:
+                layout = observation_layout(conn)
+                bytes_per_row = storage_report(conn)[TABLE_NAME]["bytes_per_row"]
+            print(f"{args.stations * steps:,} rows ({args.stations} stations x {args.years:g} years) "
+                  f"built in {build_seconds:.1f}s, {layout} layout, {bytes_per_row:.1f} bytes/row")
+
+            for section in SECTIONS:
+                if section in sections:
+                    print(f"Running {section} benchmarks...")
+                    results[section] = globals()[f"bench_{section}"](args, end)
+        finally:
+            os.chdir(home)
+
+    stub.shutdown()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+
+    regressions = report(results, baseline, args.threshold)
+
+    if args.json:
+        output = {
+            "meta": {
+                "timestamp": datetime.now().isoformat(),
+                "commit": _git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "duckdb": duckdb.__version__,
+                "polars": polars.__version__,
+                "pyarrow": pyarrow.__version__,
+                "stations": args.stations,
+                "years": args.years,
+                "rows": args.stations * steps,
+                "build_seconds": build_seconds,
+                "storage_layout": layout,
+                "bytes_per_row": bytes_per_row,
+                "repeat": args.repeat,
+                "api_latency_ms": args.api_latency,
+                "stub_requests": stub.requests,
+            },
+            "results": results,
+        }
+        with open(args.json, "w") as f:
+            json.dump(output, f, indent=2)
+        print(f"\nWrote {args.json}")
+
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) more than {args.threshold:.0%} slower than {args.compare}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# bench/stub_server.py
+#
+# Local stand-in for the Weather Underground endpoints the collectors call, serving synthetic
+# observations in the requested units. Point the project at it with WU_API_HOST.
+#
+#   python bench/stub_server.py --port 8765 --latency 50
+#   WU_API_HOST=http://127.0.0.1:8765 python main.py --collect
+
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import current_payload, history_payload
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive, like the real API
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        server = self.server
+
+        if server.latency:
+            time.sleep(server.latency)
+        with server.lock:
+            server.requests += 1
+
+        if random.random() < server.failure_rate:
+            return self._send(503, b"")
+
+        station, units = query.get("stationId", "S000"), query.get("units", "e")
+        if url.path == "/v2/pws/observations/current":
+            body = current_payload(station, units)
+        elif url.path == "/v2/pws/history/all":
+            body = history_payload(station, datetime.strptime(query["date"], "%Y%m%d").date(), units)
+        elif url.path == "/v2/pws/observations/all/1day":
+            now = datetime.now()
+            body = history_payload(station, now.date(), units, end=now)
+        else:
+            return self._send(404, b"")
+
+        self._send(200, body)
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start(port=0, latency=0.0, failure_rate=0.0):
+    """Serve on a background thread; returns the server (server.server_port, server.requests)"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.failure_rate = failure_rate
+    server.requests = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, name="wu-stub", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Weather Underground stub server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0, help="Milliseconds added to every response")
+    parser.add_argument("--failure-rate", type=float, default=0, help="Share of requests answered with 503")
+    args = parser.parse_args()
+
+    server = start(args.port, args.latency / 1000, args.failure_rate)
+    print(f"Stub Weather Underground API on http://127.0.0.1:{server.server_port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
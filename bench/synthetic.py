@@ -0,0 +1,166 @@
+# bench/synthetic.py
+#
+# Synthetic weather_observations rows (N stations at a 5-minute cadence) and Weather Underground
+# payloads, shared by the benchmarks and the stub server.
+
+import json
+import math
+from datetime import datetime, timedelta
+import duckdb
+from config import TABLE_NAME
+from db_utils import OBSERVATION_SCHEMA, connect, initialize_db, observation_columns
+from rollups import rebuild_rollups
+from latest import rebuild_latest
+from stations import refresh_stations
+
+INTERVAL_MINUTES = 5
+STEPS_PER_YEAR = 365 * 24 * 60 // INTERVAL_MINUTES
+
+
+def station_id(index):
+    return f"S{index:03d}"
+
+
+### rows
+
+def observations_sql(stations, steps, first_step, last_step, end):
+    """
+    SELECT of rows first_step..last_step (exclusive) of a `steps`-long history ending at `end`,
+    all stations per step; returns (sql, params)
+    """
+    sql = f"""
+        SELECT
+            ?::TIMESTAMP - to_minutes(CAST((? - i // ?) * {INTERVAL_MINUTES} AS BIGINT)) AS observation_time,
+            'S' || lpad(CAST(i % ? AS VARCHAR), 3, '0') AS station_id,
+            -122.3 + (i % ?) * 0.01, 47.6 + (i % ?) * 0.01, 'Bench ' || CAST(i % ? % 5 AS VARCHAR),
+            50 + 20 * sin(i / 3000.0) + (i % 7), NULL, NULL, 40 + (i % 11),
+            60 + (i % 30), (i * 37) % 360, (i % 23) * 0.5, (i % 31) * 0.7,
+            29.9 + (i % 5) * 0.01, (i % 13) * 0.01, (i % 3) * 0.02,
+            ?::TIMESTAMP AS collection_time
+        FROM range(?, ?) t(i)
+    """
+    params = [end, steps, stations, stations, stations, stations, stations, end,
+              first_step * stations, last_step * stations]
+    return sql, params
+
+
+def insert_observations(conn, stations, steps, first_step, last_step, end):
+    """Append a slice of the synthetic history straight into weather_observations (either storage layout)"""
+    sql, params = observations_sql(stations, steps, first_step, last_step, end)
+    columns = ", ".join(observation_columns(conn))
+    conn.execute(f"""
+        INSERT INTO {TABLE_NAME} ({columns})
+        SELECT {columns} FROM ({sql}) t({", ".join(OBSERVATION_SCHEMA.names)})
+    """, params)
+
+
+def observation_batch(stations, rows, end=None):
+    """Arrow table of `rows` synthetic observations laid out like weather_observations"""
+    end = end or datetime.now().replace(second=0, microsecond=0)
+    steps = math.ceil(rows / stations)
+    sql, params = observations_sql(stations, steps, 0, steps, end)
+
+    conn = duckdb.connect(":memory:")
+    try:
+        table = conn.execute(f"{sql} LIMIT {int(rows)}", params).arrow()
+    finally:
+        conn.close()
+    return table.rename_columns(OBSERVATION_SCHEMA.names).cast(OBSERVATION_SCHEMA)
+
+
+def build(stations, steps, backfill=0.0, end=None):
+    """
+    Fresh database with `stations` x `steps` rows ending now: collected rows in time order,
+    then the oldest `backfill` share appended last (a late history backfill). Returns `end`.
+    """
+    initialize_db()
+    conn = connect()
+    end = end or datetime.now().replace(second=0, microsecond=0)
+    split = int(steps * backfill)
+
+    try:
+        conn.execute("BEGIN TRANSACTION")
+        insert_observations(conn, stations, steps, split, steps, end)    # regular collection
+        if split:
+            insert_observations(conn, stations, steps, 0, split, end)    # late backfill of older history
+        rebuild_rollups(conn)
+        rebuild_latest(conn)
+
+        # names and coordinates, from the newest step
+        sql, params = observations_sql(stations, steps, steps - 1, steps, end)
+        conn.execute(f"""
+            CREATE TEMP TABLE _synthetic_stations AS
+            SELECT * FROM ({sql}) t({", ".join(OBSERVATION_SCHEMA.names)})
+        """, params)
+        refresh_stations(conn, "_synthetic_stations")
+        conn.execute("DROP TABLE _synthetic_stations")
+        conn.execute("COMMIT")
+        conn.execute("CHECKPOINT")
+    finally:
+        conn.close()
+
+    return end
+
+
+### Weather Underground payloads
+
+UNIT_BLOCKS = {"e": "imperial", "m": "metric", "h": "uk_hybrid"}
+
+
+def _unit_block(units, temp, speed, pressure, precip, rate, prefix_fields):
+    if units in ("m", "h"):
+        temp = (temp - 32) / 1.8
+        pressure = pressure / 0.02953
+        precip, rate = precip * 25.4, rate * 25.4
+    if units == "m":
+        speed = speed / 0.621371
+
+    names = prefix_fields
+    return {names[0]: round(temp, 1), names[1]: round(temp + 1, 1), names[2]: round(temp - 1, 1),
+            names[3]: round(temp - 15, 1), names[4]: round(speed, 1), names[5]: round(speed * 1.4, 1),
+            names[6]: round(pressure, 2), names[7]: round(precip, 2), names[8]: round(rate, 2)}
+
+
+CURRENT_BLOCK = ("temp", "heatIndex", "windChill", "dewpt", "windSpeed", "windGust", "pressure",
+                 "precipTotal", "precipRate")
+HISTORY_BLOCK = ("tempAvg", "heatindexAvg", "windchillAvg", "dewptAvg", "windspeedAvg", "windgustAvg",
+                 "pressureMax", "precipTotal", "precipRate")
+
+
+def _values(station, when):
+    i = int(when.timestamp() // 60 // INTERVAL_MINUTES) + sum(map(ord, station))
+    return 50 + 20 * math.sin(i / 3000.0) + i % 7, (i % 23) * 0.5, 29.9 + (i % 5) * 0.01, (i % 13) * 0.01, (i % 3) * 0.02
+
+
+def current_payload(station, units="e", when=None):
+    """Body of /v2/pws/observations/current for one station"""
+    when = (when or datetime.now()).replace(microsecond=0)
+    temp, speed, pressure, precip, rate = _values(station, when)
+    observation = {
+        "stationID": station, "obsTimeLocal": when.strftime("%Y-%m-%d %H:%M:%S"),
+        "obsTimeUtc": when.strftime("%Y-%m-%dT%H:%M:%SZ"), "epoch": int(when.timestamp()),
+        "neighborhood": f"Bench {station}", "lat": 47.6, "lon": -122.3,
+        "humidity": 60, "winddir": 200, "uv": 1.0, "solarRadiation": 100.0, "qcStatus": 1,
+        UNIT_BLOCKS[units]: _unit_block(units, temp, speed, pressure, precip, rate, CURRENT_BLOCK),
+    }
+    return json.dumps({"observations": [observation]}).encode()
+
+
+def history_payload(station, day, units="e", end=None):
+    """Body of /v2/pws/history/all (and observations/all/1day): one row per 5 minutes of `day`"""
+    start = datetime.combine(day, datetime.min.time())
+    observations = []
+    for step in range(24 * 60 // INTERVAL_MINUTES):
+        when = start + timedelta(minutes=step * INTERVAL_MINUTES)
+        if end is not None and when > end:
+            break
+        temp, speed, pressure, precip, rate = _values(station, when)
+        observations.append({
+            "stationID": station, "tz": "America/Los_Angeles",
+            "obsTimeLocal": when.strftime("%Y-%m-%d %H:%M:%S"),
+            "obsTimeUtc": when.strftime("%Y-%m-%dT%H:%M:%SZ"), "epoch": int(when.timestamp()),
+            "lat": 47.6, "lon": -122.3, "humidityAvg": 60, "humidityHigh": 70, "humidityLow": 50,
+            "winddirAvg": 200, "uvHigh": 1.0, "solarRadiationHigh": 100.0, "qcStatus": 1,
+            UNIT_BLOCKS[units]: _unit_block(units, temp, speed, pressure, precip, rate, HISTORY_BLOCK),
+        })
+    return json.dumps({"observations": observations}).encode()
@@ -7,14 +7,125 @@ load_dotenv()
 # API
 API_KEY = os.getenv("WUNDERGOUND_API_KEY")
 STATION_ID = os.getenv("STATION_ID")
-BASE_URL = "https://api.weather.com/v2/pws/observations/all/1day"
+API_HOST = os.getenv("WU_API_HOST", "https://api.weather.com")  # point at a stub server for testing
+BASE_URL = f"{API_HOST}/v2/pws/observations/all/1day"
+CURRENT_URL = f"{API_HOST}/v2/pws/observations/current"
+HISTORY_URL = f"{API_HOST}/v2/pws/history/all"
+API_UNITS = os.getenv("WU_API_UNITS", "e")     # e, m or h; converted to imperial when parsed
+
+# fetch concurrency & rate limiting (per host)
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", 8))
+API_RATE_LIMIT = float(os.getenv("API_RATE_LIMIT", 0.5))    # requests per second (WU allows 30/min)
+API_RATE_BURST = int(os.getenv("API_RATE_BURST", 10))       # requests allowed back to back
+
+# http client (seconds)
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 20))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", 3))
+HTTP_BACKOFF_BASE = 0.5
+HTTP_BACKOFF_MAX = 30
 
 
 # Data storage
 DB_PATH = "data/weather_data.duckdb"
 TABLE_NAME = "weather_observations"
+CHECKPOINT_TABLE = "backfill_checkpoints"
+HOURLY_TABLE = "observations_hourly"
+DAILY_TABLE = "observations_daily"
+OBSERVATIONS_VIEW = "all_observations"     # hot table + Parquet archive
+LATEST_TABLE = "station_latest"             # newest observation per station, kept by bulk_insert
+EVENTS_TABLE = "weather_events"             # extreme-weather events, detected by bulk_insert
+STATIONS_TABLE = "stations"                 # neighborhood and coordinates per station, kept by bulk_insert
+
+# layout new databases create weather_observations in: "standard" (FLOAT measurements, station name and
+# coordinates on every row) or "compact" (scaled DECIMAL measurements, names/coordinates in STATIONS_TABLE).
+# Existing tables keep theirs until `main.py --migrate-storage`
+STORAGE_LAYOUT = os.getenv("STORAGE_LAYOUT", "standard")
+
+
+# API database access
+API_READ_ONLY = os.getenv("API_READ_ONLY", "1") == "1"     # set 0 if the writer runs in the same process
+API_CONNECTION_MAX_AGE = 5          # seconds a read-only handle is held, however busy the API (new commits show up after)
+API_CONNECTION_RELEASE_GAP = 0.5    # seconds it then stays closed, so a writer in another process gets the file lock
+API_CONNECTION_IDLE_RELEASE = 2.0   # seconds idle before the file lock is released for writers
+API_CONNECT_RETRIES = 4
+WRITER_LOCK_WAIT = 10               # seconds a writer waits for read-only API handles to let go of the file
+
+# /api/recent looks at this many hours before the cursor first, the whole table only if that runs short
+RECENT_WINDOW_HOURS = 6
+
+# API response cache
+API_CACHE_SIZE = 256    # entries
+API_CACHE_TTL = 300     # seconds; commits invalidate sooner
+
+# /api/stream (server-sent events)
+STREAM_POLL_INTERVAL = 2.0  # seconds between checks for commits from other processes
+STREAM_HEARTBEAT = 15       # seconds between keep-alive comments
+STREAM_CLIENT_QUEUE = 100   # messages buffered per client before it is dropped
+
+# /api/custom limits
+CUSTOM_QUERY_TIMEOUT = 10           # seconds before the query is interrupted
+CUSTOM_QUERY_MAX_ROWS = 1_000_000
+CUSTOM_QUERY_THREADS = 2            # shared by all custom queries (separate DuckDB instance)
+CUSTOM_QUERY_MEMORY_LIMIT = "1GB"
+
+
+# metrics & profiling
+API_PROFILING = os.getenv("API_PROFILING", "0") == "1"     # allow ?profile=cprofile|sql on API requests
+PROFILE_DIR = "data/profiles"
+COLLECTOR_METRICS_PATH = "data/metrics/collector.json"    # the scheduler exports here, /api/metrics reads it
+METRICS_EXPORT_INTERVAL = 15    # seconds
+
+
+# archive tier: observations older than this move to Parquet
+ARCHIVE_PATH = "data/archive"
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", 90))
+
+
+# clustering: rewrite the table once this share of rows is out of (observation_time, station_id) order
+CLUSTER_MAX_UNSORTED = 0.10
+
+
+# ingest pipeline: fetchers queue records, one writer thread stores them in micro-batches
+INGEST_QUEUE_SIZE = 1000        # batches waiting for the writer before put() blocks
+INGEST_BATCH_ROWS = 5_000       # rows combined into one write
+INGEST_BATCH_WAIT = 1.0         # seconds the writer waits for more records before writing
+INGEST_PUT_TIMEOUT = 5          # seconds put() blocks on a full queue before spooling instead
+INGEST_RETRY_INTERVAL = 30      # seconds between write attempts while the database is unavailable
+SPOOL_PATH = "data/spool/ingest.ndjson"     # records waiting for the database, replayed in order
+
+
+# historical backfill
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", 4))
+BACKFILL_BATCH_ROWS = 50_000    # rows buffered before a write
 
 
 # schedule (days)
 COLLECTION_INTERVAL = 15
-COLLECTION_TIME = "minutes"
\ No newline at end of file
+COLLECTION_TIME = "minutes"
+COLLECTION_STAGGER = 60         # seconds across which station runs are spread
+COLLECTION_JITTER = 5           # random extra delay per run, seconds
+COLLECTION_GAP_TOLERANCE = 1.5  # intervals without an observation before a gap fill is queued
+
+# rolling analytics (/api/rolling)
+ROLLING_RAW_MAX_SPAN = 3        # days computed from raw rows; longer spans read the hourly rollup
+ROLLING_MAX_POINTS = 2_000      # per station; longer series are thinned to one row per step
+PRESSURE_FALL_RATE = 0.02       # inHg per hour (0.06 in 3 hours): falling this fast flags a storm
+
+
+# extreme-weather events: rule -> metric and the bound it crosses ("above"/"below"); rules with a
+# "window" compare the metric's change per hour over that trailing window instead of its value
+EVENT_RULES = {
+    "heat": {"metric": "temp_f", "above": 95},
+    "freeze": {"metric": "temp_f", "below": 32},
+    "high_wind": {"metric": "wind_mph", "above": 20},
+    "wind_gust": {"metric": "wind_gust_mph", "above": 30},
+    "heavy_rain": {"metric": "precip_rate_in", "above": 0.5},
+    "pressure_fall": {"metric": "pressure_hg", "below": -PRESSURE_FALL_RATE, "window": "3h"},
+}
+EVENT_GAP_MINUTES = 30      # matches of a rule closer together than this belong to one event
+
+
+# chart series (/api/series): downsampled to at most this many points per station
+SERIES_DEFAULT_POINTS = 500
+SERIES_MAX_POINTS = 5_000
@@ -0,0 +1,226 @@
+# connections.py
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+import duckdb
+import metrics
+from config import (
+    DB_PATH, API_READ_ONLY, API_CONNECTION_MAX_AGE, API_CONNECTION_RELEASE_GAP, API_CONNECTION_IDLE_RELEASE,
+    API_CONNECT_RETRIES, WRITER_LOCK_WAIT
+)
+
+# catalog name of the attached database in sandbox mode
+SANDBOX_CATALOG = "weather"
+
+
+### writers waiting for the file lock
+
+def writer_marker(path=DB_PATH):
+    """File a writer keeps fresh while it waits for the database lock"""
+    return f"{path}.writer-waiting"
+
+
+def writer_waiting(path=DB_PATH):
+    """True while a writer in some process is waiting for the lock (a marker left by a dead one goes stale)"""
+    try:
+        return time.time() - os.path.getmtime(writer_marker(path)) < 1.0
+    except OSError:
+        return False
+
+
+def connect_writer(path=DB_PATH, wait=WRITER_LOCK_WAIT):
+    """
+    Open `path` for writing, waiting up to `wait` seconds while read-only handles hold the lock
+    The marker file it refreshes meanwhile makes ConnectionManagers in other processes close
+    their handle as soon as their requests finish, and hold off reopening until it is gone.
+    """
+    try:
+        return duckdb.connect(path)
+    except duckdb.IOException:
+        if wait <= 0:
+            raise
+
+    marker = writer_marker(path)
+    deadline = time.monotonic() + wait
+    delay = 0.02
+    try:
+        while True:
+            with open(marker, "a"):
+                os.utime(marker)
+            try:
+                return duckdb.connect(path)
+            except duckdb.IOException:
+                if time.monotonic() + delay > deadline:
+                    raise
+                time.sleep(delay)
+                delay = min(delay * 2, 0.25)
+    finally:
+        try:
+            os.remove(marker)
+        except OSError:
+            pass
+
+
+class ConnectionManager:
+    """
+    Process-wide DuckDB handle with per-thread cursors
+    One database handle is shared by every request; each thread gets its own cursor from it,
+    reused across requests. In read-only mode the handle never holds the file lock for long,
+    so a writer in another process can take it: it is closed after `max_age` seconds however
+    busy the API is (new checkouts wait for the ones in flight, then `release_gap` seconds with
+    the file free), once the API has been idle for `idle_release` seconds, and as soon as a
+    writer signals it is waiting (connect_writer). Reopening also makes new commits visible.
+    Use read_only=False when the writer runs in the same process: DuckDB refuses to open
+    one file with two different configurations.
+    With sandbox=True the file is ATTACHed read-only to a private in-memory instance instead,
+    so `config` (threads, memory_limit) applies to these cursors only.
+    """
+
+    def __init__(self, path=DB_PATH, read_only=API_READ_ONLY, max_age=API_CONNECTION_MAX_AGE,
+                 idle_release=API_CONNECTION_IDLE_RELEASE, release_gap=API_CONNECTION_RELEASE_GAP,
+                 config=None, sandbox=False):
+        self.path = path
+        self.read_only = read_only or sandbox
+        self.max_age = max_age
+        self.idle_release = idle_release
+        self.release_gap = release_gap
+        self.config = config or {}
+        self.sandbox = sandbox
+
+        self._lock = threading.Condition()
+        self._local = threading.local()
+        self._handle = None
+        self._opened_at = 0.0
+        self._closed_at = 0.0
+        self._generation = 0
+        self._cursors = []      # every cursor handed out for the current handle
+        self._active = 0        # cursors currently checked out
+        self._last_used = 0.0
+        self._reaper = None
+
+    ### handle lifecycle (call with self._lock held)
+
+    def _connect(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"Database file not found: {self.path}")
+
+        mode = "sandbox" if self.sandbox else "api_read_only" if self.read_only else "api"
+        for attempt in range(API_CONNECT_RETRIES + 1):
+            try:
+                with metrics.timer("db_connect_seconds", mode=mode):
+                    if not self.sandbox:
+                        return duckdb.connect(self.path, read_only=self.read_only, config=self.config)
+
+                    handle = duckdb.connect(":memory:", config=self.config)
+                    try:
+                        handle.execute(f"ATTACH '{self.path}' AS {SANDBOX_CATALOG} (READ_ONLY)")
+                    except duckdb.Error:
+                        handle.close()
+                        raise
+                    return handle
+            except duckdb.IOException:
+                # the writer holds the lock: wait briefly for it to finish its batch
+                if attempt == API_CONNECT_RETRIES:
+                    raise
+                time.sleep(0.05 * 2 ** attempt)
+
+    def _close_handle(self):
+        for cursor in self._cursors:
+            try:
+                cursor.close()
+            except duckdb.Error:
+                pass
+        self._cursors = []
+
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+            self._closed_at = time.monotonic()
+
+    def _must_release(self):
+        # read-only handles give the file lock up when they're old or a writer is waiting
+        if not self.read_only or self._handle is None:
+            return False
+        return time.monotonic() - self._opened_at > self.max_age or writer_waiting(self.path)
+
+    def _ensure_handle(self):
+        while True:
+            if self._must_release():
+                if self._active:
+                    # no new checkouts until the requests in flight are done
+                    self._lock.wait(0.05)
+                    continue
+                self._close_handle()
+
+            if self._handle is None and self.read_only:
+                hold_off = self._closed_at + self.release_gap - time.monotonic()
+                if hold_off > 0 or writer_waiting(self.path):
+                    # leave the file to the writer for a moment
+                    self._lock.wait(max(hold_off, 0.05))
+                    continue
+
+            if self._handle is None:
+                self._handle = self._connect()
+                self._opened_at = time.monotonic()
+                self._generation += 1
+            return
+
+    def _reap(self):
+        # background thread: drop the handle once the API goes quiet or a writer is waiting
+        while True:
+            time.sleep(min(self.idle_release / 2, 0.25))
+            with self._lock:
+                idle = time.monotonic() - self._last_used > self.idle_release
+                if self._handle is not None and self._active == 0 and (idle or self._must_release()):
+                    self._close_handle()
+
+    ### public API
+
+    @contextmanager
+    def cursor(self):
+        """Check out this thread's cursor for the duration of a `with` block"""
+        with self._lock:
+            self._ensure_handle()
+
+            if self.read_only and self.idle_release and self._reaper is None:
+                self._reaper = threading.Thread(target=self._reap, name="db-reaper", daemon=True)
+                self._reaper.start()
+
+            cursor = getattr(self._local, "cursor", None)
+            if cursor is None or getattr(self._local, "generation", None) != self._generation:
+                cursor = self._handle.cursor()
+                if self.sandbox:
+                    cursor.execute(f"USE {SANDBOX_CATALOG}")
+                self._cursors.append(cursor)
+                self._local.cursor = cursor
+                self._local.generation = self._generation
+
+            self._active += 1
+
+        failed = False
+        try:
+            yield cursor
+        except Exception:
+            failed = True
+            raise
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._last_used = time.monotonic()
+                self._lock.notify_all()
+
+                # don't hand a cursor in an unknown state to the next request
+                if failed and cursor in self._cursors:
+                    self._cursors.remove(cursor)
+                    self._local.cursor = None
+                    try:
+                        cursor.close()
+                    except duckdb.Error:
+                        pass
+
+    def close(self):
+        """Close the handle and every cursor (the next cursor() reopens)"""
+        with self._lock:
+            self._close_handle()
@@ -2,21 +2,115 @@
 
 import duckdb
 import polars as pl
+import pyarrow as pa
+import pyarrow.compute as pc
 import os
-from config import DB_PATH, TABLE_NAME
-from datetime import datetime
+import time
+from config import DB_PATH, TABLE_NAME, OBSERVATIONS_VIEW, LATEST_TABLE, STATIONS_TABLE, CLUSTER_MAX_UNSORTED, STORAGE_LAYOUT
+from datetime import datetime, timedelta
+from rollups import initialize_rollups, refresh_rollups, rebuild_rollups, daily_stats_sql
+from archive import create_observations_view, observation_source
+from latest import initialize_latest, refresh_latest, rebuild_latest
+from events import initialize_events, refresh_events
+from stations import STATION_COLUMNS, initialize_stations, refresh_stations
+from queries import execute
+from connections import connect_writer
+import metrics
+
+
+### column layout of weather_observations, in table order
+
+OBSERVATION_SCHEMA = pa.schema([
+    ("observation_time", pa.timestamp("us")),
+    ("station_id", pa.string()),
+    ("longitude", pa.float32()),
+    ("latitude", pa.float32()),
+    ("neighborhood", pa.string()),
+    ("temp_f", pa.float32()),
+    ("heat_index", pa.float32()),
+    ("wind_chill", pa.float32()),
+    ("dew_point", pa.float32()),
+    ("humidity", pa.float32()),
+    ("wind_degrees", pa.int32()),
+    ("wind_mph", pa.float32()),
+    ("wind_gust_mph", pa.float32()),
+    ("pressure_hg", pa.float32()),
+    ("precip_today_in", pa.float32()),
+    ("precip_rate_in", pa.float32()),
+    ("collection_time", pa.timestamp("us")),
+])
+
+KEY_COLUMNS = ("station_id", "observation_time")
+
+# weather_observations layouts (config.STORAGE_LAYOUT); db_utils.migrate_storage converts between them
+STORAGE_LAYOUTS = ("standard", "compact")
+
+# physical row order kept by compaction and clustering: each row group then covers a narrow time
+# range, so zonemaps skip everything outside a query's window (see bench/bench_clustering.py;
+# station-major order made the all-station queries slower without helping the per-station ones)
+CLUSTER_ORDER = "observation_time, station_id"
+
+# older collectors (weather_collector) use these names
+COLUMN_ALIASES = {
+    "precip_total": "precip_today_in",
+    "precip_rate": "precip_rate_in",
+}
+
+
+def connect(read_only=False):
+    """
+    Open a connection to the weather DB (caller closes, or use it as a context manager)
+    Writers wait up to WRITER_LOCK_WAIT seconds for read-only API handles to release the file.
+    """
+    with metrics.timer("db_connect_seconds", mode="read_only" if read_only else "write"):
+        if read_only:
+            return duckdb.connect(DB_PATH, read_only=True)
+        return connect_writer(DB_PATH)
+
+
+### commit hooks: called after a batch of observations is committed
+
+_commit_hooks = []
+
+
+def on_commit(hook):
+    """Register hook(batch) to run after each committed ingest; batch is an Arrow table or None"""
+    _commit_hooks.append(hook)
+    return hook
+
+
+def notify_commit(batch=None):
+    """Run the commit hooks (bulk_insert does this itself unless the caller owns the transaction)"""
+    for hook in _commit_hooks:
+        try:
+            hook(batch)
+        except Exception as e:
+            print(f"Commit hook {getattr(hook, '__name__', hook)} failed: {e}")
+
+
+def has_observation_key(conn, name=TABLE_NAME):
+    """True if the table carries the (station_id, observation_time) primary key"""
+    result = conn.execute("""
+        SELECT COUNT(*) FROM duckdb_constraints()
+        WHERE table_name = ? AND constraint_type = 'PRIMARY KEY'
+    """, [name]).fetchone()
+
+    return result[0] > 0
 
 
 ### set up DB, table
 
-def initialize_db():
-    """initialize the DuckDB database with the required schema"""
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    conn = duckdb.connect(DB_PATH)
+def create_observations_table(conn, name=TABLE_NAME, layout=STORAGE_LAYOUT):
+    """Create an observations table keyed on (station_id, observation_time), in `layout` (see STORAGE_LAYOUTS)"""
+    if layout not in STORAGE_LAYOUTS:
+        raise ValueError(f"Unknown storage layout '{layout}', expected one of {', '.join(STORAGE_LAYOUTS)}")
+
+    if layout == "compact":
+        _create_compact_table(conn, name)
+        return
 
-# Create weather_observations table
     conn.execute(f"""
-        CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
+        CREATE TABLE IF NOT EXISTS {name} (
                  
                 --date and metadata
                 observation_time TIMESTAMP,
@@ -43,14 +137,110 @@ def initialize_db():
                 precip_rate_in FLOAT,
                  
                 -- system fields
-                collection_time TIMESTAMP
+                collection_time TIMESTAMP,
+
+                -- one row per station per observation
+                PRIMARY KEY (station_id, observation_time)
             )
     """
     )
 
+
+def _create_compact_table(conn, name):
+    # measurements as scaled integers at the precision the stations report (0.1 °F / mph / %,
+    # 0.01 inHg / in); DuckDB bit-packs them into a few bits per value where FLOAT takes 4 bytes.
+    # The generous widths cost nothing (the packed width follows the values) and keep odd
+    # readings from failing a batch. Names and coordinates live in the stations table.
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {name} (
+
+                --date and metadata
+                observation_time TIMESTAMP,
+                station_id VARCHAR,             -- dictionary-compressed per row group
+
+                -- temp data
+                temp_f DECIMAL(9, 1),
+                heat_index DECIMAL(9, 1),
+                wind_chill DECIMAL(9, 1),
+                dew_point DECIMAL(9, 1),
+
+                -- air data
+                humidity DECIMAL(9, 1),
+                wind_degrees SMALLINT,
+                wind_mph DECIMAL(9, 1),
+                wind_gust_mph DECIMAL(9, 1),
+                pressure_hg DECIMAL(9, 2),
+
+                -- rain data
+                precip_today_in DECIMAL(9, 2),
+                precip_rate_in DECIMAL(9, 2),
+
+                -- system fields
+                collection_time TIMESTAMP,
+
+                -- one row per station per observation
+                PRIMARY KEY (station_id, observation_time)
+            )
+    """
+    )
+
+
+def observation_columns(conn, name=TABLE_NAME):
+    """Columns of OBSERVATION_SCHEMA the table stores, in schema order"""
+    stored = {row[0] for row in conn.execute(
+        "SELECT column_name FROM duckdb_columns() WHERE table_name = ?", [name]
+    ).fetchall()}
+    return [column for column in OBSERVATION_SCHEMA.names if column in stored]
+
+
+def observation_layout(conn, name=TABLE_NAME):
+    """'compact' if the table leaves station attributes to the stations table, else 'standard'"""
+    return "standard" if STATION_COLUMNS[0] in observation_columns(conn, name) else "compact"
+
+
+def initialize_db():
+    """initialize the DuckDB database with the required schema"""
+    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+    conn = connect()
+
+# Create weather_observations table
+    create_observations_table(conn)
+
+    # view over the hot table + Parquet archive
+    create_observations_view(conn)
+
+    # rollups, latest, events and stations, maintained by bulk_insert
+    _initialize_derived(conn)
+
     conn.close()
 
 
+# databases (absolute DB_PATH) whose derived tables this process has set up
+_initialized = set()
+
+
+def _initialize_derived(conn):
+    # hourly / daily rollups
+    initialize_rollups(conn)
+
+    # newest observation per station
+    initialize_latest(conn)
+
+    # extreme-weather events
+    initialize_events(conn)
+
+    # neighborhood and coordinates per station
+    initialize_stations(conn)
+
+    _initialized.add(os.path.abspath(DB_PATH))
+
+
+def _ensure_derived(conn):
+    """Set up the derived tables once per process and database, so a batch doesn't check the catalog"""
+    if os.path.abspath(DB_PATH) not in _initialized:
+        _initialize_derived(conn)
+
+
 ''' removing to revert to current observation api
     # Create weather_observations table
     conn.execute(f"""
@@ -91,59 +281,430 @@ def initialize_db():
 
 ### save data to table. table defined in-line
 
-def save_weather_data(weather_data):
+def to_arrow(weather_data):
+    """
+    Normalize observations to an Arrow table laid out like weather_observations
+    Accepts a dict, a list of dicts, a Polars DataFrame or an Arrow table.
+    Missing columns become nulls, collection_time defaults to now.
+    """
+    if isinstance(weather_data, dict):
+        weather_data = [weather_data]
+
+    if isinstance(weather_data, pa.Table):
+        table = weather_data
+    elif isinstance(weather_data, pl.DataFrame):
+        table = weather_data.to_arrow()
+    else:
+        table = pa.Table.from_pylist(list(weather_data))
+
+    table = table.rename_columns([COLUMN_ALIASES.get(name, name) for name in table.column_names])
+
+    columns = []
+    for field in OBSERVATION_SCHEMA:
+        if field.name in table.column_names:
+            column = table[field.name]
+            if column.type != field.type:
+                column = column.cast(field.type)
+        elif field.name == "collection_time":
+            column = pa.array([datetime.now()] * table.num_rows, type=field.type)
+        else:
+            column = pa.nulls(table.num_rows, type=field.type)
+        columns.append(column)
+
+    table = pa.Table.from_arrays(columns, schema=OBSERVATION_SCHEMA)
+
+    # fill gaps in collection_time (e.g. rows from a frame that lacked it)
+    if table["collection_time"].null_count:
+        filled = table["collection_time"].fill_null(pa.scalar(datetime.now(), type=pa.timestamp("us")))
+        table = table.set_column(table.schema.get_field_index("collection_time"), "collection_time", filled)
+
+    return table
+
+
+def _insert_batch(conn, mode, source=TABLE_NAME):
+    """
+    Copy the registered _ingest_batch view into the table, return rows written
+    The batch is first deduplicated on the key (latest collection_time wins). Keyed tables
+    resolve conflicts through the primary key index, legacy tables through an anti-join.
+    When the batch reaches into archived days (`source` is the unified view) rows already
+    in the archive are skipped; archived rows are never replaced.
+    """
+    stored = observation_columns(conn)
+    columns = ", ".join(stored)
+
+    if mode == "append":
+        return conn.execute(f"""
+            INSERT INTO {TABLE_NAME} ({columns}) SELECT {columns} FROM _ingest_batch
+        """).fetchone()[0]
+
+    batch = f"""
+        SELECT {columns} FROM _ingest_batch
+        WHERE station_id IS NOT NULL AND observation_time IS NOT NULL
+        QUALIFY row_number() OVER (
+            PARTITION BY station_id, observation_time ORDER BY collection_time DESC
+        ) = 1
+    """
+    if source != TABLE_NAME:
+        batch = f"""
+            SELECT * FROM ({batch}) b
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {source} a
+                WHERE a.station_id = b.station_id AND a.observation_time = b.observation_time
+                AND a.observation_time < (SELECT MAX(cutoff) FROM archive_state)
+            )
+        """
+    keys = ", ".join(KEY_COLUMNS)
+    updates = ", ".join(f"{c} = excluded.{c}" for c in stored if c not in KEY_COLUMNS)
+    matches_batch = f"""
+        {TABLE_NAME}.station_id = b.station_id AND {TABLE_NAME}.observation_time = b.observation_time
+    """
+
+    if has_observation_key(conn):
+        conflict = f"DO UPDATE SET {updates}" if mode == "replace" else "DO NOTHING"
+        return conn.execute(f"""
+            INSERT INTO {TABLE_NAME} ({columns}) {batch}
+            ON CONFLICT ({keys}) {conflict}
+        """).fetchone()[0]
+
+    # legacy table without a key (run compact_observations to add one)
+    if mode == "replace":
+        conn.execute(f"DELETE FROM {TABLE_NAME} USING ({batch}) b WHERE {matches_batch}")
+        return conn.execute(f"INSERT INTO {TABLE_NAME} ({columns}) {batch}").fetchone()[0]
+
+    return conn.execute(f"""
+        INSERT INTO {TABLE_NAME} ({columns})
+        SELECT * FROM ({batch}) b
+        WHERE NOT EXISTS (SELECT 1 FROM {TABLE_NAME} WHERE {matches_batch})
+    """).fetchone()[0]
+
+
+def bulk_insert(weather_data, conn=None, transaction=True, mode="ignore"):
+    """
+    Write a batch of observations in a single transaction
+    The batch is registered as an Arrow view and copied with one INSERT ... SELECT,
+    so DuckDB reads the columns directly instead of binding row by row.
+    mode: "ignore" keeps rows already stored (re-ingesting is a no-op), "replace" overwrites
+    them with the incoming values, "append" skips deduplication entirely.
+    transaction=False leaves BEGIN/COMMIT (and notify_commit) to a caller that writes more in
+    the same transaction. The derived tables (rollups, latest, events, stations) are set up
+    once per process, not checked per batch.
+    Returns {"rows", "inserted", "seconds", "rows_per_sec"}.
     """
-    Save weather data to DuckDB using Polars
+    if mode not in ("ignore", "replace", "append"):
+        raise ValueError(f"Unknown ingest mode: {mode}")
+
+    start = time.perf_counter()
+    table = to_arrow(weather_data)
+
+    stats = {"rows": table.num_rows, "inserted": 0, "seconds": 0.0, "rows_per_sec": 0.0}
+    if table.num_rows == 0:
+        return stats
+
+    owns_conn = conn is None
+    if owns_conn:
+        conn = connect()
+
+    try:
+        _ensure_derived(conn)
+        conn.register("_ingest_batch", table)
+        source = observation_source(conn, pc.min(table["observation_time"]).as_py())
+        if transaction:
+            conn.execute("BEGIN TRANSACTION")
+        try:
+            stats["inserted"] = _insert_batch(conn, mode, source)
+            if stats["inserted"]:
+                refresh_rollups(conn, source=source)
+                refresh_latest(conn, mode=mode)
+                refresh_events(conn, source=source)
+                refresh_stations(conn)
+            if transaction:
+                conn.execute("COMMIT")
+        except Exception:
+            if transaction:
+                conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.unregister("_ingest_batch")
+        if owns_conn:
+            conn.close()
+
+    stats["seconds"] = time.perf_counter() - start
+    stats["rows_per_sec"] = stats["rows"] / stats["seconds"] if stats["seconds"] else 0.0
+
+    metrics.observe("ingest_seconds", stats["seconds"], mode=mode)
+    metrics.inc("ingest_rows_total", stats["rows"], mode=mode)
+    metrics.inc("ingest_inserted_rows_total", stats["inserted"], mode=mode)
+
+    if transaction and stats["inserted"]:
+        notify_commit(table)
+
+    return stats
+
+
+def save_weather_data(weather_data, conn=None, mode="ignore"):
+    """
+    Save weather data to DuckDB
     Collects data from multiple lists, defined in weather_api & referencing the config file
+    Also takes a single dict, a Polars DataFrame or an Arrow table.
     """
-    if not weather_data:
+    if weather_data is None or len(weather_data) == 0:
         print("No data to save")
         return
-        
-    print(f"Saving {len(weather_data)} weather observations to database...")
 
-    # Convert the data to a Polars DF
-    df = pl.DataFrame([weather_data])
+    stats = bulk_insert(weather_data, conn, mode=mode)
 
-    # Connect to DB
-    conn = duckdb.connect(DB_PATH)
+    print(f"Stored {stats['inserted']} of {stats['rows']} weather observations in {stats['seconds']:.3f}s "
+          f"({stats['rows_per_sec']:,.0f} rows/sec)")
 
-    # Add collection timestamp
-    df = df.with_columns(pl.lit(datetime.now()).alias("collection_time"))
-
-    # Insert data into the table using DuckDB's from_arrow apability
-    ''' fix bc now using a list instead of df?
-        conn.execute(f"""
-                 Insert INTO {TABLE_NAME} 
-                 SELECT * from df
-                 """)
-    '''
-    for data in weather_data:
-         conn.execute("""
-         INSERT INTO weather_observations VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-         """, [
-             data["observation_time"], 
-             data["station_id"], 
-             data["longitude"], 
-             data["latitude"], 
-             data["neighborhood"], 
-             data["temp_f"], 
-             data["heat_index"], 
-             data["wind_chill"], 
-             data["dew_point"], 
-             data["humidity"], 
-             data["wind_degrees"], 
-             data["wind_mph"], 
-             data["wind_gust_mph"], 
-             data["pressure_hg"], 
-             data["precip_today_in"], 
-             data["precip_rate_in"], 
-             data["collection_time"]
-         ])
-    
-    conn.close
+    return stats
+
+
+def save_historical_data(historical_data, conn=None, mode="ignore"):
+    """Save observations returned by weather_api.get_historical_data"""
+    if historical_data is None or len(historical_data) == 0:
+        return
+
+    return bulk_insert(historical_data, conn, mode=mode)
+
+
+### dedup existing data
+
+def _rewrite_observations(conn, select_sql, layout=None):
+    """
+    Replace weather_observations with the rows of `select_sql`, keeping the key and view (inside a transaction)
+    The table keeps its layout unless `layout` names another; `select_sql` yields the columns of
+    the resulting layout, in OBSERVATION_SCHEMA order.
+    """
+    staging = f"{TABLE_NAME}_rewrite"
+
+    conn.execute(f"DROP TABLE IF EXISTS {staging}")
+    create_observations_table(conn, staging, layout or observation_layout(conn))
+    columns = ", ".join(observation_columns(conn, staging))
+    conn.execute(f"INSERT INTO {staging} ({columns}) {select_sql}")
+    conn.execute(f"DROP TABLE {TABLE_NAME}")
+    conn.execute(f"ALTER TABLE {staging} RENAME TO {TABLE_NAME}")
+    create_observations_view(conn)
+
+
+def compact_observations():
+    """
+    Rewrite weather_observations without duplicates and with the primary key
+    Keeps the most recently collected row per (station_id, observation_time), drops rows
+    missing either key column, then rebuilds the rollups. Returns {"before", "after", "removed"}.
+    """
+    initialize_db()
+    conn = connect()
+    columns = ", ".join(observation_columns(conn))
+
+    try:
+        before = conn.execute(f"SELECT COUNT(*) FROM {TABLE_NAME}").fetchone()[0]
+
+        conn.execute("BEGIN TRANSACTION")
+        try:
+            _rewrite_observations(conn, f"""
+                SELECT {columns} FROM {TABLE_NAME}
+                WHERE station_id IS NOT NULL AND observation_time IS NOT NULL
+                QUALIFY row_number() OVER (
+                    PARTITION BY station_id, observation_time ORDER BY collection_time DESC
+                ) = 1
+                ORDER BY {CLUSTER_ORDER}
+            """)
+            rebuild_rollups(conn)
+            rebuild_latest(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        after = conn.execute(f"SELECT COUNT(*) FROM {TABLE_NAME}").fetchone()[0]
+        conn.execute("CHECKPOINT")
+    finally:
+        conn.close()
+
+    print(f"Compacted {TABLE_NAME}: {before} -> {after} rows ({before - after} duplicates removed)")
+
+    return {"before": before, "after": after, "removed": before - after}
+
+
+### physical clustering
+
+def clustering_report(conn, order=CLUSTER_ORDER):
+    """
+    How far storage order has drifted from `order`
+    `unsorted_rows` counts everything from the first out-of-order row on: the tail appended
+    (or backfilled) since the last clustering, where row-group zonemaps no longer line up.
+    """
+    rows, breaks, unsorted = conn.execute(f"""
+        WITH ordered AS (
+            SELECT
+                row_number() OVER (ORDER BY rowid) AS pos,
+                ({order}) < lag(({order})) OVER (ORDER BY rowid) AS out_of_order
+            FROM {TABLE_NAME}
+        )
+        SELECT
+            COUNT(*),
+            COUNT(*) FILTER (WHERE out_of_order),
+            COALESCE(COUNT(*) - MIN(pos) FILTER (WHERE out_of_order) + 1, 0)
+        FROM ordered
+    """).fetchone()
+
+    row_groups = conn.execute(
+        f"SELECT COUNT(DISTINCT row_group_id) FROM pragma_storage_info('{TABLE_NAME}')"
+    ).fetchone()[0]
 
-    print(f"Data stored successfully!")
+    return {"rows": rows, "row_groups": row_groups, "order_breaks": breaks, "unsorted_rows": unsorted,
+            "unsorted_ratio": unsorted / rows if rows else 0.0}
+
+
+def cluster_observations(force=False, max_unsorted=CLUSTER_MAX_UNSORTED, order=CLUSTER_ORDER):
+    """
+    Rewrite weather_observations in CLUSTER_ORDER
+    Appends arrive in time order, but backfills and late data land at the end of the table and
+    widen the time range of every row group they touch. Sorting restores narrow row groups for
+    DuckDB's zonemaps. The rewrite is skipped while at most `max_unsorted` of the rows sit
+    outside the sorted prefix. Returns the report.
+    """
+    initialize_db()
+    conn = connect()
+    columns = ", ".join(observation_columns(conn))
+
+    try:
+        report = clustering_report(conn, order)
+        if not force and report["unsorted_ratio"] <= max_unsorted:
+            print(f"{TABLE_NAME} is clustered ({report['unsorted_rows']} of {report['rows']} rows unsorted)")
+            return report
+
+        start = time.perf_counter()
+        conn.execute("BEGIN TRANSACTION")
+        try:
+            _rewrite_observations(conn, f"SELECT {columns} FROM {TABLE_NAME} ORDER BY {order}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        conn.execute("CHECKPOINT")
+        report = dict(clustering_report(conn, order), seconds=time.perf_counter() - start)
+    finally:
+        conn.close()
+
+    print(f"Clustered {report['rows']} rows of {TABLE_NAME} by ({order}) in {report['seconds']:.1f}s")
+
+    return report
+
+
+### storage layout
+
+def storage_report(conn, tables=(TABLE_NAME, STATIONS_TABLE)):
+    """
+    Bytes per row of each table and of its columns, from the segments DuckDB wrote to disk
+    A segment runs to the next segment in its block (the last one to the block's end), so only
+    checkpointed data counts: CHECKPOINT first. Indexes aren't included.
+    Returns {table: {"rows", "bytes", "bytes_per_row", "columns": {column: (compression, bytes_per_row)}}}.
+    """
+    present = {row[0] for row in conn.execute(
+        "SELECT table_name FROM duckdb_tables() WHERE NOT temporary AND database_name = current_database()"
+    ).fetchall()}
+
+    # segments of every table, as tables can share a block
+    segments = " UNION ALL ".join(f"""
+        SELECT '{name}' AS table_name, column_name, compression, block_id, block_offset
+        FROM pragma_storage_info('{name}') WHERE persistent AND block_id >= 0
+    """ for name in sorted(present))
+    if not segments:
+        return {}
+
+    sized = conn.execute(f"""
+        WITH segments AS ({segments}),
+        sized AS (
+            SELECT
+                *,
+                coalesce(lead(block_offset) OVER (PARTITION BY block_id ORDER BY block_offset),
+                         (SELECT block_size FROM pragma_database_size() WHERE database_name = current_database()))
+                - block_offset AS bytes
+            FROM segments
+        )
+        SELECT table_name, column_name, string_agg(DISTINCT compression, '/' ORDER BY compression), SUM(bytes)
+        FROM sized
+        GROUP BY table_name, column_name
+    """).fetchall()
+
+    report = {}
+    for name in tables:
+        if name not in present:
+            continue
+        rows = conn.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+        columns = {column: (compression, size) for table, column, compression, size in sized if table == name}
+        total = sum(size for _, size in columns.values())
+        report[name] = {
+            "rows": rows,
+            "bytes": int(total),
+            "bytes_per_row": total / rows if rows else 0.0,
+            "columns": {column: (compression, size / rows if rows else 0.0)
+                        for column, (compression, size) in sorted(columns.items(), key=lambda item: -item[1][1])},
+        }
+
+    return report
+
+
+def migrate_storage(layout="compact"):
+    """
+    Rewrite weather_observations in `layout` ("compact" or "standard"), reporting bytes per row
+    before and after
+    Going compact, station attributes are copied into the stations table (archive included)
+    and dropped from the rows; going back, each row gets its station's current ones. Rows are
+    written in CLUSTER_ORDER, then the rollups and station_latest are rebuilt to match.
+    Returns {"layout", "before", "after"} with the storage_report of each side.
+    """
+    if layout not in STORAGE_LAYOUTS:
+        raise ValueError(f"Unknown storage layout '{layout}', expected one of {', '.join(STORAGE_LAYOUTS)}")
+
+    initialize_db()
+    conn = connect()
+
+    try:
+        conn.execute("CHECKPOINT")
+        before = storage_report(conn)
+
+        if observation_layout(conn) == layout:
+            print(f"{TABLE_NAME} already uses the {layout} layout")
+            return {"layout": layout, "before": before, "after": before}
+
+        start = time.perf_counter()
+        stored = observation_columns(conn)
+        target = [c for c in OBSERVATION_SCHEMA.names if layout == "standard" or c not in STATION_COLUMNS]
+        select_list = ", ".join(f"o.{c}" if c in stored else f"s.{c}" for c in target)
+
+        conn.execute("BEGIN TRANSACTION")
+        try:
+            # attributes still on the rows (hot and archived) are folded in before they're dropped
+            if STATION_COLUMNS[0] in stored:
+                refresh_stations(conn, OBSERVATIONS_VIEW)
+            _rewrite_observations(conn, f"""
+                SELECT {select_list}
+                FROM {TABLE_NAME} o
+                LEFT JOIN {STATIONS_TABLE} s ON o.station_id = s.station_id
+                ORDER BY {", ".join(f"o.{c.strip()}" for c in CLUSTER_ORDER.split(","))}
+            """, layout)
+            rebuild_rollups(conn)
+            rebuild_latest(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        conn.execute("CHECKPOINT")
+        after = storage_report(conn)
+    finally:
+        conn.close()
+
+    rows = after[TABLE_NAME]["rows"]
+    print(f"Rewrote {rows} rows of {TABLE_NAME} in the {layout} layout in {time.perf_counter() - start:.1f}s: "
+          f"{before[TABLE_NAME]['bytes_per_row']:.1f} -> {after[TABLE_NAME]['bytes_per_row']:.1f} bytes/row")
+    # DuckDB reuses the freed blocks for later writes but never shrinks the file
+    print("The database file keeps its size; freed blocks are reused by later writes")
+
+    return {"layout": layout, "before": before, "after": after}
 
 
 ### most recent records. n editable
@@ -152,12 +713,24 @@ def get_latest_records(n=5):
     """Retrieve the latest n records as a Polars DataFrame"""
     conn = duckdb.connect(DB_PATH)
     
+    # station_latest holds n distinct rows collected at or after its n-th newest collection_time,
+    # so the n newest rows overall can't be older: only the tail of the table is scanned
+    bound = execute(conn, "latest_records_bound", f"""
+    SELECT collection_time FROM {LATEST_TABLE}
+    ORDER BY collection_time DESC
+    LIMIT 1 OFFSET ?
+    """, [max(int(n) - 1, 0)]).fetchone()
+    
+    # fewer stations than n: no bound
+    where, params = ("WHERE collection_time >= ?", [bound[0]]) if bound else ("", [])
+    
     # Execute query and convert to Polars df
-    result = conn.execute(f"""
+    result = execute(conn, "latest_records", f"""
     SELECT * FROM {TABLE_NAME}
+    {where}
     ORDER BY collection_time DESC
-    LIMIT {n}
-    """)
+    LIMIT ?
+    """, params + [int(n)])
     
     result_df = pl.from_arrow(result.arrow())
     
@@ -169,29 +742,29 @@ def get_latest_records(n=5):
 ### analysis functions
 
 def analyze_weather_data(days=7):
-    """Analyze recent weather data using Polars"""
+    """Analyze recent weather data using Polars (reads the daily rollup, raw rows for today)"""
     conn = duckdb.connect(DB_PATH)
     
-    # Query recent data
-    query = f"""
-    SELECT * FROM weather_observations 
-    WHERE observation_time >= CURRENT_DATE - {days}
-    """
+    # Query recent data: whole days since CURRENT_DATE - days
+    start = datetime.combine(datetime.now().date() - timedelta(days=days), datetime.min.time())
+    sql, params = daily_stats_sql(start)
     
     # Execute query and convert to Polars DataFrame
-    result = conn.execute(query).arrow()
+    result = execute(conn, "analyze_weather_data", sql, params).arrow()
     df = pl.from_arrow(result)
+    conn.close()
     
-    # Calculate daily statistics
+    # Calculate daily statistics (means weighted by each row's observation count)
     daily_stats = (
-        df.group_by(pl.col("observation_time").dt.date().alias("date"))
+        df.group_by(pl.col("bucket").alias("date"))
         .agg(
-            pl.col("temp_f").mean().alias("avg_temp_f"),
-            pl.col("temp_f").max().alias("max_temp_f"),
-            pl.col("temp_f").min().alias("min_temp_f"),
-            pl.col("humidity").mean().alias("avg_humidity"),
-            pl.col("wind_mph").mean().alias("avg_wind_mph"),
-            pl.col("precip_total").sum().alias("total_precip_in")
+            (pl.col("temp_f_sum").sum() / pl.col("temp_f_count").sum()).alias("avg_temp_f"),
+            pl.col("temp_f_max").max().alias("max_temp_f"),
+            pl.col("temp_f_min").min().alias("min_temp_f"),
+            (pl.col("humidity_sum").sum() / pl.col("humidity_count").sum()).alias("avg_humidity"),
+            (pl.col("wind_mph_sum").sum() / pl.col("wind_mph_count").sum()).alias("avg_wind_mph"),
+            # precip_today_in is a running daily total, so the day's max is the day's total
+            pl.col("precip_today_in_max").max().alias("total_precip_in")
         )
         .sort("date")
     )
@@ -204,10 +777,10 @@ def analyze_weather_data_lazy(days=7):
     conn = duckdb.connect(DB_PATH)
     
     # Execute query and convert to Polars DataFrame
-    result = conn.execute(f"""
+    result = execute(conn, "analyze_weather_data_lazy", """
     SELECT * FROM weather_observations 
-    WHERE observation_time >= CURRENT_DATE - {days}
-    """).arrow()
+    WHERE observation_time >= CURRENT_DATE - CAST(? AS INTEGER)
+    """, [int(days)]).arrow()
     
     # Create lazy DataFrame
     df = pl.from_arrow(result).lazy()
@@ -0,0 +1,254 @@
+# events.py
+
+from datetime import datetime, timedelta
+from config import TABLE_NAME, OBSERVATIONS_VIEW, EVENTS_TABLE, EVENT_RULES, EVENT_GAP_MINUTES
+from rollups import ROLLUP_METRICS
+from rolling import parse_window, interval_sql
+from archive import table_exists, ensure_observations_view
+
+GAP = f"INTERVAL {int(EVENT_GAP_MINUTES)} MINUTE"
+
+
+### rules
+
+def _rules():
+    """EVENT_RULES as (name, metric, direction, threshold, window or None), checked"""
+    rules = []
+    for name, rule in EVENT_RULES.items():
+        direction = "above" if "above" in rule else "below"
+        if rule["metric"] not in ROLLUP_METRICS or direction not in rule:
+            raise ValueError(f"Invalid event rule '{name}': {rule}")
+        window = parse_window(rule["window"]) if rule.get("window") else None
+        rules.append((name, rule["metric"], direction, float(rule[direction]), window))
+    return rules
+
+
+def _lookback():
+    # how far before a batch the rate rules need to see
+    return max((window for *_, window in _rules() if window), default=timedelta(0))
+
+
+def _rule_matches(name, metric, direction, threshold, window):
+    """SELECT of the _event_rows (see _detect) inside their station's span that match one rule"""
+    op = ">" if direction == "above" else "<"
+    sign = 1 if direction == "above" else -1
+    columns = f"station_id, '{name}' AS rule, '{metric}' AS metric, '{direction}' AS direction, " \
+              f"{threshold!r} AS threshold, {sign} AS sign"
+
+    if window is None:
+        return f"""
+            SELECT {columns}, observation_time AS time, {metric} AS value
+            FROM _event_rows
+            WHERE observation_time >= lo AND {metric} {op} {threshold!r}
+        """
+
+    # change per hour since the oldest reading in the trailing window, once it spans half of it
+    preceding = interval_sql(window - timedelta(microseconds=1))
+    return f"""
+        SELECT {columns}, time, value
+        FROM (
+            SELECT
+                station_id, lo, observation_time AS time,
+                {metric} - first_value({metric}) OVER w AS change,
+                (epoch(observation_time) - epoch(first_value(observation_time) OVER w)) / 3600 AS hours,
+                change / NULLIF(hours, 0) AS value
+            FROM _event_rows
+            WHERE {metric} IS NOT NULL
+            WINDOW w AS (PARTITION BY station_id ORDER BY observation_time
+                         RANGE BETWEEN {preceding} PRECEDING AND CURRENT ROW)
+        )
+        WHERE time >= lo AND hours >= {window / timedelta(hours=1) / 2} AND value {op} {threshold!r}
+    """
+
+
+### table
+
+def _create_events_table(conn):
+    conn.execute(f"""
+        CREATE TABLE {EVENTS_TABLE} (
+            station_id VARCHAR,
+            rule VARCHAR,
+            metric VARCHAR,
+            direction VARCHAR,          -- above / below the threshold
+            threshold DOUBLE,
+            start_time TIMESTAMP,       -- first matching observation
+            end_time TIMESTAMP,         -- last matching observation
+            peak_time TIMESTAMP,
+            peak_value DOUBLE,          -- highest (above) or lowest (below) value seen
+            updated_at TIMESTAMP,
+            PRIMARY KEY (station_id, rule, start_time)
+        )
+    """)
+
+
+def initialize_events(conn):
+    """Create weather_events, detecting events in existing observations the first time"""
+    if table_exists(conn, EVENTS_TABLE):
+        return
+
+    if not table_exists(conn, TABLE_NAME):
+        _create_events_table(conn)
+        return
+
+    ensure_observations_view(conn)
+    rebuild_events(conn)
+
+
+### detection
+
+def _detect(conn, spans, source):
+    """
+    Evaluate every rule on the rows of `source` inside each station's span and fold the
+    matches into weather_events
+    spans: SELECT of (station_id, lo, hi). Matches of a rule less than EVENT_GAP_MINUTES apart
+    form one event; an event within that gap of a stored one (either side, or bridging two)
+    is merged into it, so re-ingesting or backfilling never duplicates events.
+    """
+    rules = _rules()
+    if not rules:
+        return
+
+    conn.execute(f"CREATE OR REPLACE TEMP TABLE _event_spans AS {spans}")
+    first, last = conn.execute("SELECT MIN(lo), MAX(hi) FROM _event_spans").fetchone()
+    if first is None:
+        conn.execute("DROP TABLE _event_spans")
+        return
+
+    lookback = _lookback()
+    metrics = sorted({metric for _, metric, *_ in rules})
+    matches = "\nUNION ALL\n".join(_rule_matches(*rule) for rule in rules)
+
+    # matches of each rule, grouped into episodes; the overall range is bound as constants so
+    # the scan reaches the zonemaps (a subquery bound doesn't)
+    conn.execute(f"""
+        CREATE OR REPLACE TEMP TABLE _event_new AS
+        WITH _event_rows AS MATERIALIZED (
+            SELECT o.station_id, o.observation_time, {", ".join(f"o.{m}" for m in metrics)}, s.lo
+            FROM {source} o
+            JOIN _event_spans s ON o.station_id = s.station_id
+            WHERE o.observation_time >= s.lo - {interval_sql(lookback)}
+              AND o.observation_time <= s.hi
+              AND o.observation_time >= ?
+              AND o.observation_time <= ?
+        ),
+        matches AS ({matches}),
+        flagged AS (
+            SELECT *, CASE WHEN time - lag(time) OVER (PARTITION BY station_id, rule ORDER BY time) > {GAP}
+                           THEN 1 ELSE 0 END AS breaks
+            FROM matches
+        ),
+        grouped AS (
+            SELECT *, SUM(breaks) OVER (PARTITION BY station_id, rule ORDER BY time
+                                        ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW) AS episode
+            FROM flagged
+        )
+        SELECT
+            station_id, rule,
+            any_value(metric) AS metric, any_value(direction) AS direction, any_value(threshold) AS threshold,
+            MIN(time) AS start_time, MAX(time) AS end_time,
+            arg_max(time, value * sign) AS peak_time, arg_max(value, value * sign) AS peak_value
+        FROM grouped
+        GROUP BY station_id, rule, episode
+    """, [first - lookback, last])
+
+    if not conn.execute("SELECT COUNT(*) FROM _event_new").fetchone()[0]:
+        conn.execute("DROP TABLE _event_spans")
+        conn.execute("DROP TABLE _event_new")
+        return
+
+    # new episodes and the stored events they touch, merged where within the gap of each other
+    conn.execute(f"""
+        CREATE OR REPLACE TEMP TABLE _event_touched AS
+        SELECT e.station_id, e.rule, e.start_time
+        FROM {EVENTS_TABLE} e
+        SEMI JOIN (
+            SELECT station_id, rule, MIN(start_time) AS lo, MAX(end_time) AS hi FROM _event_new GROUP BY ALL
+        ) n ON e.station_id = n.station_id AND e.rule = n.rule
+           AND e.end_time >= n.lo - {GAP} AND e.start_time <= n.hi + {GAP}
+    """)
+
+    conn.execute(f"""
+        CREATE OR REPLACE TEMP TABLE _event_merged AS
+        WITH candidates AS (
+            SELECT station_id, rule, metric, direction, threshold, start_time, end_time, peak_time, peak_value
+            FROM _event_new
+            UNION ALL
+            SELECT e.station_id, e.rule, e.metric, e.direction, e.threshold, e.start_time, e.end_time,
+                   e.peak_time, e.peak_value
+            FROM {EVENTS_TABLE} e
+            SEMI JOIN _event_touched t
+                ON e.station_id = t.station_id AND e.rule = t.rule AND e.start_time = t.start_time
+        ),
+        flagged AS (
+            SELECT *, CASE WHEN start_time > MAX(end_time) OVER (
+                               PARTITION BY station_id, rule ORDER BY start_time, end_time
+                               ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING) + {GAP}
+                           THEN 1 ELSE 0 END AS breaks
+            FROM candidates
+        ),
+        grouped AS (
+            SELECT *, SUM(breaks) OVER (PARTITION BY station_id, rule ORDER BY start_time, end_time
+                                        ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW) AS episode
+            FROM flagged
+        )
+        SELECT
+            station_id, rule,
+            any_value(metric) AS metric, any_value(direction) AS direction, any_value(threshold) AS threshold,
+            MIN(start_time) AS start_time, MAX(end_time) AS end_time,
+            arg_max(peak_time, CASE WHEN direction = 'below' THEN -peak_value ELSE peak_value END) AS peak_time,
+            arg_max(peak_value, CASE WHEN direction = 'below' THEN -peak_value ELSE peak_value END) AS peak_value,
+            ?::TIMESTAMP AS updated_at
+        FROM grouped
+        GROUP BY station_id, rule, episode
+    """, [datetime.now()])
+
+    # stored events absorbed into one starting earlier go; the rest are updated in place
+    # (deleted keys can't be re-inserted in the same transaction)
+    conn.execute(f"""
+        DELETE FROM {EVENTS_TABLE} e
+        USING _event_touched t
+        WHERE e.station_id = t.station_id AND e.rule = t.rule AND e.start_time = t.start_time
+          AND NOT EXISTS (
+              SELECT 1 FROM _event_merged m
+              WHERE m.station_id = t.station_id AND m.rule = t.rule AND m.start_time = t.start_time
+          )
+    """)
+    conn.execute(f"""
+        INSERT INTO {EVENTS_TABLE} SELECT * FROM _event_merged
+        ON CONFLICT (station_id, rule, start_time) DO UPDATE SET
+            metric = excluded.metric, direction = excluded.direction, threshold = excluded.threshold,
+            end_time = excluded.end_time, peak_time = excluded.peak_time, peak_value = excluded.peak_value,
+            updated_at = excluded.updated_at
+    """)
+
+    for name in ("_event_spans", "_event_new", "_event_touched", "_event_merged"):
+        conn.execute(f"DROP TABLE {name}")
+
+
+def refresh_events(conn, batch="_ingest_batch", source=TABLE_NAME):
+    """
+    Detect events in the time span a batch covers, per station
+    Only the batch's span (plus the longest rate window before it) is read, so the cost
+    follows the batch size, not the history. `source` is the unified view when the batch
+    reaches into archived days. Runs inside the caller's transaction. Events are only ever
+    extended or merged: replaced values that no longer cross a threshold don't shrink them.
+    Expects the table set up by initialize_events.
+    """
+    _detect(conn, f"""
+        SELECT station_id, MIN(observation_time) AS lo, MAX(observation_time) AS hi
+        FROM {batch}
+        WHERE station_id IS NOT NULL AND observation_time IS NOT NULL
+        GROUP BY station_id
+    """, source)
+
+
+def rebuild_events(conn):
+    """Detect events in every observation from scratch, archive included (e.g. after changing EVENT_RULES)"""
+    conn.execute(f"DROP TABLE IF EXISTS {EVENTS_TABLE}")
+    _create_events_table(conn)
+    _detect(conn, f"""
+        SELECT station_id, MIN(observation_time) AS lo, MAX(observation_time) AS hi
+        FROM {OBSERVATIONS_VIEW}
+        WHERE station_id IS NOT NULL AND observation_time IS NOT NULL
+        GROUP BY station_id
+    """, OBSERVATIONS_VIEW)
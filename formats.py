@@ -0,0 +1,184 @@
+# formats.py
+
+import io
+import json
+from datetime import datetime, date
+from decimal import Decimal
+import polars as pl
+import pyarrow as pa
+import pyarrow.parquet as pq
+from flask import Response, request, jsonify
+from flask.json.provider import DefaultJSONProvider
+
+# ?format= value -> mimetype; "json" keeps the original list-of-rows layout
+FORMATS = {
+    "json": "application/json",
+    "columns": "application/vnd.columnar+json",
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# formats that can be written batch by batch as DuckDB produces them
+STREAMING_FORMATS = ("arrow", "ndjson")
+
+ARROW_BATCH_ROWS = 64 * 1024
+
+
+def negotiate_format():
+    """Response format from ?format=, else the best Accept match (JSON rows by default)"""
+    requested = request.args.get("format")
+    if requested:
+        if requested not in FORMATS:
+            raise ValueError(f"Unknown format '{requested}', expected one of {', '.join(FORMATS)}")
+        return requested
+
+    best = request.accept_mimetypes.best_match(list(FORMATS.values()), default=FORMATS["json"])
+    return next(name for name, mimetype in FORMATS.items() if mimetype == best)
+
+
+### JSON values
+
+def json_default(value):
+    """
+    JSON form of the values json can't encode, shared by every JSON response and /api/stream
+    Stored times are naive local time: they go out as ISO 8601 with the local UTC offset, so
+    browsers read the same instant whichever endpoint a row came from.
+    """
+    if isinstance(value, datetime):
+        return value.astimezone().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        # compact-layout measurements
+        return float(value)
+    raise TypeError(f"Not JSON serializable: {type(value)}")
+
+
+class JSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider with json_default in front of its own fallbacks (UUIDs, dataclasses)"""
+
+    @staticmethod
+    def default(value):
+        try:
+            return json_default(value)
+        except TypeError:
+            return DefaultJSONProvider.default(value)
+
+
+### encoders (all take a pyarrow Table)
+
+def _literal(name):
+    return "'" + name.replace("'", "''") + "'"
+
+
+def _identifier(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def columnar_json(conn, table):
+    """
+    {"column": [values...], ...} rendered by DuckDB's JSON functions from the Arrow table,
+    so no Python object is created per row or per value
+    """
+    if table.num_columns == 0:
+        return "{}"
+
+    fields = ", ".join(
+        f"{_literal(name)}, COALESCE(list({_identifier(name)}), [])"
+        for name in table.column_names
+    )
+    conn.register("_response_table", table)
+    try:
+        return conn.execute(f"SELECT json_object({fields})::VARCHAR FROM _response_table").fetchone()[0]
+    finally:
+        conn.unregister("_response_table")
+
+
+def arrow_stream(schema, batches):
+    """Arrow IPC stream, yielded one record batch at a time"""
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    # end-of-stream marker written on close
+    yield sink.getvalue()
+
+
+def ndjson_stream(schema, batches):
+    """One JSON object per line, serialized per record batch by Polars"""
+    for batch in batches:
+        if batch.num_rows:
+            yield pl.from_arrow(pa.Table.from_batches([batch], schema)).write_ndjson()
+
+
+def encode_batches(fmt, schema, batches):
+    if fmt == "arrow":
+        return arrow_stream(schema, batches)
+    return ndjson_stream(schema, batches)
+
+
+def parquet_bytes(table):
+    sink = io.BytesIO()
+    pq.write_table(table, sink, compression="zstd")
+    return sink.getvalue()
+
+
+### response
+
+def _float_decimals(table):
+    # DECIMAL columns (compact storage layout) as floats: jsonify would render Decimals as strings
+    for i, field in enumerate(table.schema):
+        if pa.types.is_decimal(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(pa.float64()))
+    return table
+
+
+def table_response(conn, table, fmt, key="data", **meta):
+    """
+    Render a query result in the negotiated format
+    JSON formats wrap the data in the usual envelope under `key` with count/timestamp and any
+    `meta` fields; binary formats carry the row count in an X-Row-Count header.
+    """
+    if fmt == "json":
+        rows = _float_decimals(table).to_pylist()
+        return jsonify({key: rows, "count": len(rows), **meta, "timestamp": datetime.now().isoformat()})
+
+    if fmt == "columns":
+        envelope = json.dumps({"columns": table.column_names, "count": table.num_rows, **meta,
+                               "timestamp": datetime.now().isoformat()})
+        # splice DuckDB's JSON text into the envelope instead of parsing it back
+        body = f'{envelope[:-1]}, "{key}": {columnar_json(conn, table)}}}'
+        return Response(body, mimetype=FORMATS[fmt])
+
+    if fmt in STREAMING_FORMATS:
+        batches = table.to_batches(max_chunksize=ARROW_BATCH_ROWS)
+        response = Response(encode_batches(fmt, table.schema, batches), mimetype=FORMATS[fmt])
+    else:
+        response = Response(parquet_bytes(table), mimetype=FORMATS[fmt])
+
+    response.headers["X-Row-Count"] = str(table.num_rows)
+    if "next_cursor" in meta:
+        response.headers["X-Next-Cursor"] = meta["next_cursor"] or ""
+    return response
+
+
+def stream_response(cursor_factory, query, params, fmt):
+    """
+    Stream a query result as Arrow IPC or NDJSON while DuckDB produces it
+    The cursor stays checked out until the client has read the last batch, and at most one
+    record batch is held in memory. The first chunk is produced before the response starts,
+    so query errors still surface as a normal error response.
+    """
+    def generate():
+        with cursor_factory() as conn:
+            reader = conn.execute(query, params).fetch_record_batch(ARROW_BATCH_ROWS)
+            yield b""   # query is running: hand control back to the route
+            yield from encode_batches(fmt, reader.schema, reader)
+
+    chunks = generate()
+    next(chunks)
+    return Response(chunks, mimetype=FORMATS[fmt])
@@ -0,0 +1,148 @@
+# guardrails.py
+
+import json
+import threading
+from contextlib import contextmanager
+from config import (
+    TABLE_NAME, OBSERVATIONS_VIEW, HOURLY_TABLE, DAILY_TABLE, LATEST_TABLE, EVENTS_TABLE, STATIONS_TABLE,
+    CUSTOM_QUERY_TIMEOUT, CUSTOM_QUERY_MAX_ROWS
+)
+from connections import SANDBOX_CATALOG
+
+# relations a custom query may read
+ALLOWED_TABLES = {TABLE_NAME, OBSERVATIONS_VIEW, HOURLY_TABLE, DAILY_TABLE, LATEST_TABLE, EVENTS_TABLE, STATIONS_TABLE}
+ALLOWED_TABLE_FUNCTIONS = {"range", "generate_series", "unnest"}
+
+# physical operators a custom query may not plan
+REJECTED_OPERATORS = ("CROSS_PRODUCT",)
+
+
+class QueryRejected(Exception):
+    """A custom query failed a guardrail check before running"""
+
+
+### parse checks
+
+def _walk(node):
+    if isinstance(node, dict):
+        yield node
+        for value in node.values():
+            yield from _walk(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _walk(value)
+
+
+def parse_query(conn, query):
+    """Parse with DuckDB's own parser; only a single SELECT statement is accepted"""
+    tree = json.loads(conn.execute("SELECT json_serialize_sql(?::VARCHAR)", [query]).fetchone()[0])
+
+    if tree.get("error"):
+        # json_serialize_sql only serializes SELECT statements
+        raise QueryRejected(f"Only SELECT queries are allowed ({tree.get('error_message')})")
+    if len(tree["statements"]) != 1:
+        raise QueryRejected("Exactly one statement is allowed")
+
+    return tree
+
+
+def check_tables(tree):
+    """Every relation must be on the allow-list (CTE names excepted)"""
+    nodes = list(_walk(tree))
+    ctes = {entry["key"] for node in nodes if "cte_map" in node for entry in node["cte_map"]["map"]}
+
+    for node in nodes:
+        if node.get("type") == "BASE_TABLE":
+            name = node["table_name"]
+            if name in ctes and not node["schema_name"]:
+                continue
+            if node["catalog_name"] not in ("", SANDBOX_CATALOG) or node["schema_name"] not in ("", "main"):
+                raise QueryRejected(f"Table '{name}' is not allowed")
+            if name not in ALLOWED_TABLES:
+                raise QueryRejected(f"Table '{name}' is not allowed (allowed: {', '.join(sorted(ALLOWED_TABLES))})")
+
+        elif node.get("type") == "TABLE_FUNCTION":
+            name = node["function"].get("function_name")
+            if name not in ALLOWED_TABLE_FUNCTIONS:
+                raise QueryRejected(f"Table function '{name}' is not allowed")
+
+
+### plan checks
+
+def _constant(value):
+    if value is None:
+        return {"class": "CONSTANT", "type": "VALUE_CONSTANT", "alias": "",
+                "value": {"type": {"id": "NULL", "type_info": None}, "is_null": True}}
+
+    if isinstance(value, bool):
+        type_id = "BOOLEAN"
+    elif isinstance(value, int):
+        type_id = "BIGINT"
+    elif isinstance(value, float):
+        type_id = "DOUBLE"
+    else:
+        type_id, value = "VARCHAR", value if isinstance(value, str) else json.dumps(value)
+
+    return {"class": "CONSTANT", "type": "VALUE_CONSTANT", "alias": "",
+            "value": {"type": {"id": type_id, "type_info": None}, "is_null": False, "value": value}}
+
+
+def _bind_parameters(node, params):
+    # EXPLAIN can't take prepared parameters: put the values into the tree as constants
+    if isinstance(node, list):
+        return [_bind_parameters(value, params) for value in node]
+    if not isinstance(node, dict):
+        return node
+    if node.get("class") == "PARAMETER":
+        return _constant(params[int(node["identifier"]) - 1])
+    return {key: _bind_parameters(value, params) for key, value in node.items()}
+
+
+def explain(conn, tree, params):
+    """Physical plan text of a parsed query with its parameters bound"""
+    bound = json.dumps(_bind_parameters(tree, list(params)))
+    sql = conn.execute("SELECT json_deserialize_sql(?::JSON)", [bound]).fetchone()[0]
+    return "\n".join(row[1] for row in conn.execute(f"EXPLAIN {sql}").fetchall())
+
+
+def check_plan(plan):
+    for operator in REJECTED_OPERATORS:
+        if operator in plan:
+            raise QueryRejected(f"Query plan contains a {operator}; add a join condition")
+
+
+def check_query(conn, query, params=()):
+    """All pre-execution checks; raises QueryRejected"""
+    tree = parse_query(conn, query)
+    check_tables(tree)
+    try:
+        check_plan(explain(conn, tree, params))
+    except IndexError:
+        raise QueryRejected("Not enough parameters for the query")
+
+
+### execution limits
+
+def cap_rows(query, max_rows=CUSTOM_QUERY_MAX_ROWS):
+    return f"SELECT * FROM ({query.strip().rstrip(';')}) AS capped LIMIT {int(max_rows)}"
+
+
+@contextmanager
+def time_limit(conn, seconds=CUSTOM_QUERY_TIMEOUT):
+    """Interrupt whatever `conn` is running once `seconds` have passed"""
+    timer = threading.Timer(seconds, conn.interrupt)
+    timer.daemon = True
+    timer.start()
+    try:
+        yield conn
+    finally:
+        timer.cancel()
+
+
+def bounded_cursor(cursor_factory, seconds=CUSTOM_QUERY_TIMEOUT):
+    """Cursor factory whose cursors are interrupted after `seconds` (streams included)"""
+    @contextmanager
+    def factory():
+        with cursor_factory() as conn, time_limit(conn, seconds):
+            yield conn
+    return factory
@@ -0,0 +1,142 @@
+# http_client.py
+
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
+from config import (
+    FETCH_WORKERS, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT,
+    HTTP_MAX_RETRIES, HTTP_BACKOFF_BASE, HTTP_BACKOFF_MAX
+)
+from rate_limit import get_bucket
+import metrics
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+### shared session: connection pool + keep-alive
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Return the process-wide requests session, creating it on first use"""
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(FETCH_WORKERS, 4))
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update({"Accept-Encoding": "gzip", "Connection": "keep-alive"})
+            _session = session
+
+    return _session
+
+
+def close_session():
+    """Close pooled connections (the next get() opens a fresh session)"""
+    global _session
+
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+### latency metrics, per endpoint
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _record(url, seconds, status):
+    parts = urlsplit(url)
+    key = f"{parts.netloc}{parts.path}"
+
+    metrics.observe("wu_request_seconds", seconds, endpoint=parts.path)
+    if status is None or status >= 400:
+        metrics.inc("wu_request_errors_total", endpoint=parts.path)
+
+    with _stats_lock:
+        s = _stats.setdefault(key, {"count": 0, "errors": 0, "retries": 0,
+                                    "total_s": 0.0, "max_s": 0.0, "last_s": 0.0})
+        s["count"] += 1
+        s["total_s"] += seconds
+        s["max_s"] = max(s["max_s"], seconds)
+        s["last_s"] = seconds
+        if status is None or status >= 400:
+            s["errors"] += 1
+
+
+def _record_retry(url):
+    parts = urlsplit(url)
+    metrics.inc("wu_request_retries_total", endpoint=parts.path)
+    with _stats_lock:
+        s = _stats.get(f"{parts.netloc}{parts.path}")
+        if s:
+            s["retries"] += 1
+
+
+def get_latency_stats():
+    """Snapshot of request latency per endpoint (count, errors, retries, avg/max/last seconds)"""
+    with _stats_lock:
+        snapshot = {}
+        for key, s in _stats.items():
+            snapshot[key] = dict(s, avg_s=s["total_s"] / s["count"] if s["count"] else 0.0)
+
+    return snapshot
+
+
+### GET with timeout + retry
+
+def _backoff(attempt, response=None):
+    """Full-jitter exponential backoff, honouring Retry-After when the server sends one"""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), HTTP_BACKOFF_MAX)
+
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt))
+
+
+def get(url, params=None, timeout=None, retries=None):
+    """
+    GET through the shared session
+    Each attempt waits on the host's token bucket. 429/5xx responses and connection errors are
+    retried with jittered exponential backoff; the final failure raises a RequestException.
+    """
+    session = get_session()
+    timeout = timeout or (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+    retries = HTTP_MAX_RETRIES if retries is None else retries
+    bucket = get_bucket(url)
+
+    attempt = 0
+    while True:
+        bucket.acquire()
+        start = time.perf_counter()
+        try:
+            response = session.get(url, params=params, timeout=timeout)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            _record(url, time.perf_counter() - start, None)
+            if attempt >= retries:
+                raise
+            _record_retry(url)
+            time.sleep(_backoff(attempt))
+            attempt += 1
+            continue
+
+        _record(url, time.perf_counter() - start, response.status_code)
+
+        if response.status_code in RETRY_STATUSES and attempt < retries:
+            _record_retry(url)
+            time.sleep(_backoff(attempt, response))
+            attempt += 1
+            continue
+
+        response.raise_for_status() # raise exception for HTTP errors
+        return response
@@ -0,0 +1,65 @@
+# latest.py
+
+from config import TABLE_NAME, LATEST_TABLE, OBSERVATIONS_VIEW
+from archive import table_exists
+
+
+def _create_latest_table(conn):
+    # same columns as the observations table, keyed on station_id alone
+    columns = conn.execute(f"DESCRIBE {TABLE_NAME}").fetchall()
+    conn.execute(f"""
+        CREATE TABLE {LATEST_TABLE} (
+            {", ".join(f"{name} {type_}" for name, type_, *_ in columns)},
+            PRIMARY KEY (station_id)
+        )
+    """)
+
+
+def _latest_rows(source):
+    return f"""
+        SELECT * FROM {source}
+        WHERE station_id IS NOT NULL AND observation_time IS NOT NULL
+        QUALIFY row_number() OVER (
+            PARTITION BY station_id ORDER BY observation_time DESC, collection_time DESC
+        ) = 1
+    """
+
+
+def initialize_latest(conn):
+    """Create station_latest, filling it from existing observations the first time"""
+    if table_exists(conn, LATEST_TABLE) or not table_exists(conn, TABLE_NAME):
+        return
+
+    rebuild_latest(conn)
+
+
+def refresh_latest(conn, batch="_ingest_batch", mode="ignore"):
+    """
+    Fold a batch into station_latest: a station's row is replaced when the batch holds a newer
+    observation (or, with mode="replace", a new version of the same one). Runs inside the
+    caller's transaction, so readers never see the table behind the observations. Expects
+    the table set up by initialize_latest.
+    """
+    # column names from an empty result: DESCRIBE or a catalog query costs ~10 ms inside a write transaction
+    columns = [d[0] for d in conn.execute(f"SELECT * FROM {LATEST_TABLE} LIMIT 0").description]
+    updates = ", ".join(f"{c} = excluded.{c}" for c in columns if c != "station_id")
+    newer = ">=" if mode == "replace" else ">"
+
+    conn.execute(f"""
+        INSERT INTO {LATEST_TABLE} ({", ".join(columns)})
+        SELECT {", ".join(columns)} FROM ({_latest_rows(batch)})
+        ON CONFLICT (station_id) DO UPDATE SET {updates}
+        WHERE excluded.observation_time {newer} {LATEST_TABLE}.observation_time
+    """)
+
+
+def rebuild_latest(conn):
+    """Recompute station_latest from every observation, archive included"""
+    conn.execute(f"DROP TABLE IF EXISTS {LATEST_TABLE}")
+    _create_latest_table(conn)
+
+    columns = ", ".join(row[0] for row in conn.execute(f"DESCRIBE {LATEST_TABLE}").fetchall())
+    conn.execute(f"""
+        INSERT INTO {LATEST_TABLE}
+        SELECT {columns} FROM ({_latest_rows(OBSERVATIONS_VIEW)})
+    """)
@@ -0,0 +1,161 @@
+# live.py
+
+import json
+import queue
+import threading
+from datetime import datetime
+from api_cache import data_version
+from formats import json_default
+from queries import execute
+from stations import STATION_COLUMNS
+from config import LATEST_TABLE, STATIONS_TABLE, STREAM_POLL_INTERVAL, STREAM_HEARTBEAT, STREAM_CLIENT_QUEUE
+
+STREAM_COLUMNS = [
+    "observation_time", "station_id", "neighborhood", "latitude", "longitude",
+    "temp_f", "humidity", "wind_mph", "wind_gust_mph", "pressure_hg",
+    "precip_today_in", "precip_rate_in", "collection_time",
+]
+
+
+def format_event(event, payload):
+    """One Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(payload, default=json_default)}\n\n"
+
+
+class Broadcaster:
+    """
+    Fan-out of new observations to every open /api/stream client
+    A single watcher thread notices commits (commit hook in this process, database file
+    changes from other writers), reads the newest row per station once, and hands the same
+    pre-rendered message to each subscriber queue. Clients that fall behind are dropped.
+    """
+
+    def __init__(self, cursor_factory, poll_interval=STREAM_POLL_INTERVAL):
+        self.cursor_factory = cursor_factory
+        self.poll_interval = poll_interval
+
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+        self.latest = {}            # station_id -> last published observation
+        self._watermark = None      # newest collection_time seen
+        self._version = None
+
+    ### watcher
+
+    def _read_new(self):
+        """Latest observation of each station collected since the watermark (one row per station)"""
+        where = "WHERE l.collection_time > ?" if self._watermark else ""
+        params = [self._watermark] if self._watermark else []
+        columns = ", ".join(f"s.{c}" if c in STATION_COLUMNS else f"l.{c}" for c in STREAM_COLUMNS)
+
+        with self.cursor_factory() as conn:
+            cursor = execute(conn, "stream_latest", f"""
+                SELECT {columns}
+                FROM {LATEST_TABLE} l
+                LEFT JOIN {STATIONS_TABLE} s ON l.station_id = s.station_id
+                {where}
+            """, params)
+            rows = [dict(zip(STREAM_COLUMNS, row)) for row in cursor.fetchall()]
+
+        return rows
+
+    def _check(self):
+        version = data_version()
+        if version == self._version:
+            return
+        self._version = version
+
+        updated = []
+        for row in self._read_new():
+            if self._watermark is None or row["collection_time"] > self._watermark:
+                self._watermark = row["collection_time"]
+
+            previous = self.latest.get(row["station_id"])
+            if previous is None or row["observation_time"] > previous["observation_time"]:
+                self.latest[row["station_id"]] = row
+                updated.append(row)
+
+        if not updated:
+            return
+
+        messages = [format_event("observation", row) for row in updated]
+        messages.append(format_event("batch", {
+            "stations": [row["station_id"] for row in updated],
+            "timestamp": datetime.now(),
+        }))
+        self.publish("".join(messages))
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                self._check()
+            except Exception as e:
+                # database busy or missing: try again on the next tick
+                print(f"Stream watcher: {e}")
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stream-watcher", daemon=True)
+                self._thread.start()
+                self._wake.set()
+
+    def notify(self, batch=None):
+        """Commit hook: check for new rows now instead of on the next poll"""
+        self._wake.set()
+
+    ### subscribers
+
+    def publish(self, message):
+        with self._lock:
+            subscribers = list(self._subscribers)
+
+        for q in subscribers:
+            try:
+                q.put_nowait(message)
+            except queue.Full:
+                # too slow to keep up; end its stream and let the browser reconnect
+                self.unsubscribe(q)
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    pass
+                q.put_nowait(None)
+
+    def subscribe(self):
+        q = queue.Queue(maxsize=STREAM_CLIENT_QUEUE)
+        with self._lock:
+            self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def stream(self):
+        """Generator for one client: snapshot of the latest rows, then live updates"""
+        self.start()
+        q = self.subscribe()
+
+        try:
+            yield "retry: 5000\n\n"
+            for row in list(self.latest.values()):
+                yield format_event("observation", row)
+
+            while True:
+                try:
+                    message = q.get(timeout=STREAM_HEARTBEAT)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+
+                if message is None:
+                    return
+                yield message
+        finally:
+            self.unsubscribe(q)
@@ -2,8 +2,13 @@
 
 import argparse
 from weather_collector import collect_and_store_weather
-from db_utils import initialize_db, get_latest_records
+from db_utils import (
+    initialize_db, get_latest_records, compact_observations, cluster_observations, connect,
+    migrate_storage, storage_report, STORAGE_LAYOUTS
+)
+from events import rebuild_events
 from scheduler_orig import main as run_scheduler
+from archive import archive_observations
 
 ### show the records
 
@@ -24,6 +29,21 @@ def display_latest_records(count):
         print("No records found in the database.")
 
 
+### storage
+
+def display_storage_report(report):
+    """Print bytes per row of each table, and per column for weather_observations"""
+    for table, stats in report.items():
+        if table != "weather_observations":
+            # a handful of rows in a partly used block: bytes per row says nothing here
+            print(f"\n{table}: {stats['rows']:,} rows, {stats['bytes']:,} bytes")
+            continue
+
+        print(f"\n{table}: {stats['rows']:,} rows, {stats['bytes']:,} bytes, {stats['bytes_per_row']:.2f} bytes/row")
+        for column, (compression, per_row) in stats["columns"].items():
+            print(f"  {column:<18} {per_row:6.2f}  {compression}")
+
+
 ### here's how to run the thing 
 
 if __name__ == "__main__":
@@ -32,6 +52,13 @@ if __name__ == "__main__":
     parser.add_argument("--view", type=int, metavar="N", help="View the latest N records")
     parser.add_argument("--start", action="store_true", help="Start the scheduler")
     parser.add_argument("--export", type=str, metavar="FILE", help="Export the latest 100 records to CSV file")
+    parser.add_argument("--compact", action="store_true", help="Remove duplicate observations and add the table key")
+    parser.add_argument("--cluster", action="store_true", help="Rewrite observations in (observation_time, station_id) order if they have drifted")
+    parser.add_argument("--force", action="store_true", help="With --cluster: rewrite even if the table is still clustered")
+    parser.add_argument("--archive", type=int, nargs="?", const=-1, metavar="DAYS", help="Move observations older than DAYS (default ARCHIVE_AFTER_DAYS) to Parquet")
+    parser.add_argument("--rebuild-events", action="store_true", help="Re-detect weather events in all observations (after changing EVENT_RULES)")
+    parser.add_argument("--migrate-storage", nargs="?", const="compact", choices=STORAGE_LAYOUTS, metavar="LAYOUT", help="Rewrite observations in the compact (default) or standard storage layout")
+    parser.add_argument("--storage-report", action="store_true", help="Show bytes per row of the stored tables")
 
     args = parser.parse_args()
 
@@ -53,10 +80,50 @@ if __name__ == "__main__":
         else:
             print("No data to export")
 
+    if args.compact:
+        compact_observations()
+
+    if args.cluster:
+        cluster_observations(force=args.force)
+
+    if args.archive is not None:
+        if args.archive < 0:
+            archive_observations()
+        else:
+            archive_observations(args.archive)
+
+    if args.rebuild_events:
+        conn = connect()
+        try:
+            conn.execute("BEGIN TRANSACTION")
+            rebuild_events(conn)
+            conn.execute("COMMIT")
+            print(f"Detected {conn.execute('SELECT COUNT(*) FROM weather_events').fetchone()[0]} weather events")
+        finally:
+            conn.close()
+
+    if args.migrate_storage:
+        result = migrate_storage(args.migrate_storage)
+        print("\nBefore:")
+        display_storage_report(result["before"])
+        print("\nAfter:")
+        display_storage_report(result["after"])
+
+    if args.storage_report:
+        initialize_db()
+        conn = connect()
+        try:
+            # only checkpointed segments are measured
+            conn.execute("CHECKPOINT")
+            display_storage_report(storage_report(conn))
+        finally:
+            conn.close()
+
     if args.start:
         run_scheduler()
 
     # if no args, show help
-    if not (args.collect or args.view or args.start or args.export):
+    if not (args.collect or args.view or args.start or args.export or args.compact or args.cluster or args.archive is not None
+            or args.rebuild_events or args.migrate_storage or args.storage_report):
         parser.print_help()
 
@@ -0,0 +1,311 @@
+# metrics.py
+
+import bisect
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from config import PROFILE_DIR
+
+PREFIX = "weather_"
+
+# upper bounds (seconds) of the latency buckets; p50/p95/p99 are interpolated within them
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# every metric the code records: name -> (type, help)
+METRICS = {
+    "wu_request_seconds": ("histogram", "Weather Underground API request time per attempt, by endpoint"),
+    "wu_request_errors_total": ("counter", "API requests that failed or returned an error status, by endpoint"),
+    "wu_request_retries_total": ("counter", "API requests retried after an error, by endpoint"),
+    "fetch_failures_total": ("counter", "Station fetches that returned no data, by kind"),
+    "parse_seconds": ("histogram", "Time to parse an observations payload, by kind"),
+    "parsed_rows_total": ("counter", "Observations parsed from API payloads, by kind"),
+    "db_connect_seconds": ("histogram", "Time to open the database, by mode"),
+    "ingest_seconds": ("histogram", "bulk_insert time (rows, rollups, station_latest and events), by mode"),
+    "ingest_rows_total": ("counter", "Rows handed to bulk_insert, by mode"),
+    "ingest_inserted_rows_total": ("counter", "Rows bulk_insert actually stored, by mode"),
+    "ingest_spooled_rows_total": ("counter", "Rows written to the ingest spool instead of the database, by reason"),
+    "ingest_dropped_batches_total": ("counter", "Ingest batches that could not be stored or spooled, by reason"),
+    "collection_seconds": ("histogram", "One station's collection run (fetch and hand-off to the writer)"),
+    "http_request_seconds": ("histogram", "Flask request time until the response is returned, by endpoint and status"),
+    "sql_query_seconds": ("histogram", "Named SQL query time (EXECUTE, not fetching), by query"),
+    "sql_query_errors_total": ("counter", "Named SQL queries that raised, by query"),
+}
+
+
+class Histogram:
+    """Bucketed distribution of observed values (Prometheus-style cumulative buckets on output)"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS, counts=None, total=0.0, count=0, maximum=0.0):
+        self.buckets = tuple(buckets)
+        self.counts = list(counts) if counts else [0] * (len(self.buckets) + 1)    # last: above every bound
+        self.sum = total
+        self.count = count
+        self.max = maximum
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Estimate by linear interpolation inside the bucket holding the q-th value"""
+        if not self.count:
+            return 0.0
+
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                if i == len(self.buckets):
+                    return self.max
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = min(self.buckets[i], self.max)
+                return lower + (upper - lower) * max(rank - seen, 0) / n
+            seen += n
+        return self.max
+
+    def state(self):
+        return {"buckets": self.buckets, "counts": list(self.counts), "sum": self.sum, "count": self.count, "max": self.max}
+
+
+class Registry:
+    """Thread-safe counters and histograms keyed by metric name and labels"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+
+    @staticmethod
+    def _key(name, labels):
+        if name not in METRICS:
+            raise KeyError(f"Unknown metric: {name}")
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def state(self):
+        """Raw copy of every series, JSON-serializable (see dump/load)"""
+        with self._lock:
+            return {
+                "histograms": [[name, dict(labels), h.state()] for (name, labels), h in self._histograms.items()],
+                "counters": [[name, dict(labels), value] for (name, labels), value in self._counters.items()],
+            }
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+
+registry = Registry()
+
+
+### recording
+
+def observe(name, value, **labels):
+    registry.observe(name, value, **labels)
+
+
+def inc(name, amount=1, **labels):
+    registry.inc(name, amount, **labels)
+
+
+@contextmanager
+def timer(name, **labels):
+    """Observe the duration of a `with` block (also when it raises)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe(name, time.perf_counter() - start, **labels)
+
+
+### output
+
+def snapshot(state=None):
+    """Histograms as count/sum/max/p50/p95/p99 and counters as values, per metric and labels"""
+    state = state or registry.state()
+    result = {}
+
+    for name, labels, h in state["histograms"]:
+        histogram = Histogram(h["buckets"], h["counts"], h["sum"], h["count"], h["max"])
+        result.setdefault(name, []).append(dict(
+            labels=labels, count=histogram.count, sum=histogram.sum, max=histogram.max,
+            p50=histogram.quantile(0.50), p95=histogram.quantile(0.95), p99=histogram.quantile(0.99),
+        ))
+
+    for name, labels, value in state["counters"]:
+        result.setdefault(name, []).append(dict(labels=labels, value=value))
+
+    return result
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(sources):
+    """
+    Prometheus text exposition (format 0.0.4) of several registries' state
+    sources: {process name: state}, each series gets a process label so one scrape can
+    carry the API's own metrics and the collector's exported ones.
+    """
+    families = {}
+    for process, state in sources.items():
+        for name, labels, h in state["histograms"]:
+            families.setdefault(name, []).append(("histogram", dict(labels, process=process), h))
+        for name, labels, value in state["counters"]:
+            families.setdefault(name, []).append(("counter", dict(labels, process=process), value))
+
+    lines = []
+    for name in sorted(families):
+        kind, help_text = METRICS.get(name, (families[name][0][0], ""))
+        lines.append(f"# HELP {PREFIX}{name} {help_text}")
+        lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+        for kind, labels, value in families[name]:
+            if kind == "counter":
+                lines.append(f"{PREFIX}{name}{_labels(labels)} {_number(value)}")
+                continue
+
+            cumulative = 0
+            for bound, n in zip(list(value["buckets"]) + ["+Inf"], value["counts"]):
+                cumulative += n
+                le = bound if bound == "+Inf" else _number(float(bound))
+                lines.append(f"{PREFIX}{name}_bucket{_labels(dict(labels, le=le))} {cumulative}")
+            lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {_number(float(value['sum']))}")
+            lines.append(f"{PREFIX}{name}_count{_labels(labels)} {value['count']}")
+
+    return "\n".join(lines) + "\n"
+
+
+### export from another process (the collector) for /api/metrics to pick up
+
+def dump(path):
+    """Write this process's metrics state to `path` atomically"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp = f"{path}.tmp"
+    with open(temp, "w") as f:
+        json.dump(registry.state(), f)
+    os.replace(temp, path)
+
+
+def load(path):
+    """State written by dump(), or None if there is none"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class Exporter:
+    """Background thread calling dump(path) every `interval` seconds (and once on stop)"""
+
+    def __init__(self, path, interval):
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                dump(self.path)
+            except OSError as e:
+                print(f"Metrics export to {self.path} failed: {e}")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="metrics-export", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        dump(self.path)
+
+
+### opt-in profiling of a single request
+
+_profile = threading.local()
+PROFILE_MODES = ("cprofile", "sql")
+
+
+def start_profile(mode):
+    """Profile what this thread runs until stop_profile(): cProfile, or the profiled plan of each named query"""
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode '{mode}', expected one of {', '.join(PROFILE_MODES)}")
+
+    _profile.mode = mode
+    _profile.plans = []
+    _profile.profiler = None
+    if mode == "cprofile":
+        _profile.profiler = cProfile.Profile()
+        _profile.profiler.enable()
+
+
+def profiling_sql():
+    """True while the current thread is in a sql-mode profile (checked by queries.execute)"""
+    return getattr(_profile, "mode", None) == "sql"
+
+
+def add_query_plan(name, plan):
+    _profile.plans.append((name, plan))
+
+
+def stop_profile(label):
+    """End this thread's profile and write it under PROFILE_DIR; returns the file path (None if not profiling)"""
+    mode = getattr(_profile, "mode", None)
+    if mode is None:
+        return None
+    _profile.mode = None
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stem = os.path.join(PROFILE_DIR, f"{datetime.now():%Y%m%d-%H%M%S-%f}-{label}")
+
+    if mode == "cprofile":
+        profiler = _profile.profiler
+        profiler.disable()
+        profiler.dump_stats(f"{stem}.prof")     # for snakeviz / pstats
+        path = f"{stem}.txt"
+        with open(path, "w") as f:
+            pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(40)
+    else:
+        path = f"{stem}-sql.txt"
+        with open(path, "w") as f:
+            for name, plan in _profile.plans:
+                f.write(f"-- {name}\n{plan}\n\n")
+
+    return path
@@ -0,0 +1,51 @@
+# pagination.py
+
+import base64
+import json
+from datetime import datetime
+
+# pages run newest first over the table key, so a page boundary never splits or repeats rows
+KEYSET_ORDER = "observation_time DESC, station_id DESC"
+
+
+def encode_cursor(observation_time, station_id):
+    """Opaque token for the position after (observation_time, station_id)"""
+    raw = json.dumps([observation_time.isoformat(), station_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        observation_time, station_id = json.loads(raw)
+        return datetime.fromisoformat(observation_time), station_id
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {token}") from e
+
+
+def keyset_filter(token):
+    """WHERE condition + params selecting the rows after a cursor (None: first page)"""
+    if not token:
+        return "TRUE", []
+
+    observation_time, station_id = decode_cursor(token)
+    condition = "(observation_time < ? OR (observation_time = ? AND station_id < ?))"
+    return condition, [observation_time, observation_time, station_id]
+
+
+def window_start(token, window):
+    """
+    Lower time bound for a page that most likely lies within `window` (a timedelta) before
+    the cursor, or before now on the first page. Lets zonemaps skip older row groups.
+    """
+    reference = decode_cursor(token)[0] if token else datetime.now()
+    return reference - window
+
+
+def next_cursor(table, limit):
+    """Cursor for the page after `table` (an Arrow result in KEYSET_ORDER), None on the last page"""
+    if table.num_rows < limit or table.num_rows == 0:
+        return None
+
+    last = table.slice(table.num_rows - 1).to_pylist()[0]
+    return encode_cursor(last["observation_time"], last["station_id"])
@@ -0,0 +1,158 @@
+# parsing.py
+
+import io
+import time
+from datetime import datetime
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.json as pj
+from db_utils import OBSERVATION_SCHEMA
+import metrics
+
+
+### payload layout: column -> (field, quantity); quantity None means a top-level field,
+### otherwise the field sits in the unit block and is converted to the imperial units we store
+
+CURRENT_FIELDS = {
+    "observation_time": ("obsTimeLocal", None),
+    "station_id": ("stationID", None),
+    "longitude": ("lon", None),
+    "latitude": ("lat", None),
+    "neighborhood": ("neighborhood", None),
+    "temp_f": ("temp", "temperature"),
+    "heat_index": ("heatIndex", "temperature"),
+    "wind_chill": ("windChill", "temperature"),
+    "dew_point": ("dewpt", "temperature"),
+    "humidity": ("humidity", None),
+    "wind_degrees": ("winddir", None),
+    "wind_mph": ("windSpeed", "speed"),
+    "wind_gust_mph": ("windGust", "speed"),
+    "pressure_hg": ("pressure", "pressure"),
+    "precip_today_in": ("precipTotal", "precipitation"),
+    "precip_rate_in": ("precipRate", "precipitation"),
+}
+
+# history/all and observations/all/1day return the same per-interval summaries
+HISTORY_FIELDS = {
+    "observation_time": ("obsTimeLocal", None),
+    "station_id": ("stationID", None),
+    "longitude": ("lon", None),
+    "latitude": ("lat", None),
+    "temp_f": ("tempAvg", "temperature"),
+    "heat_index": ("heatindexAvg", "temperature"),
+    "wind_chill": ("windchillAvg", "temperature"),
+    "dew_point": ("dewptAvg", "temperature"),
+    "humidity": ("humidityAvg", None),
+    "wind_degrees": ("winddirAvg", None),
+    "wind_mph": ("windspeedAvg", "speed"),
+    "wind_gust_mph": ("windgustAvg", "speed"),
+    "pressure_hg": ("pressureMax", "pressure"),
+    "precip_today_in": ("precipTotal", "precipitation"),
+    "precip_rate_in": ("precipRate", "precipitation"),
+}
+
+PAYLOAD_FIELDS = {"current": CURRENT_FIELDS, "history": HISTORY_FIELDS, "1day": HISTORY_FIELDS}
+
+# `units` request parameter -> name of the unit block in each observation
+UNIT_BLOCKS = {"e": "imperial", "m": "metric", "h": "uk_hybrid"}
+
+# (scale, offset) taking each unit system to imperial; missing entries are already imperial
+TO_IMPERIAL = {
+    "m": {
+        "temperature": (1.8, 32.0),         # °C
+        "speed": (0.621371, 0.0),           # km/h
+        "pressure": (0.0295300, 0.0),       # hPa
+        "precipitation": (1 / 25.4, 0.0),   # mm, mm/h
+    },
+    "h": {
+        "temperature": (1.8, 32.0),         # °C
+        "pressure": (0.0295300, 0.0),       # hPa
+        "precipitation": (1 / 25.4, 0.0),   # mm, mm/h (wind stays in mph)
+    },
+}
+
+_TEXT_FIELDS = {"obsTimeLocal", "stationID", "neighborhood"}
+
+
+def observation_type(kind="history", units="e"):
+    """Arrow struct of the fields read from one observation (everything else is skipped)"""
+    fields = PAYLOAD_FIELDS[kind]
+    top = [pa.field(name, pa.string() if name in _TEXT_FIELDS else pa.float64())
+           for name, quantity in fields.values() if quantity is None]
+    block = [pa.field(name, pa.float64()) for name, quantity in fields.values() if quantity is not None]
+    return pa.struct(top + [pa.field(UNIT_BLOCKS[units], pa.struct(block))])
+
+
+def _observations_array(payload, value_type):
+    if isinstance(payload, (bytes, str)):
+        # whole response straight into Arrow: JSON decoding and type conversion run in C++
+        body = payload.encode() if isinstance(payload, str) else payload
+        options = pj.ParseOptions(
+            explicit_schema=pa.schema([pa.field("observations", pa.list_(value_type))]),
+            unexpected_field_behavior="ignore",
+            newlines_in_values=True,
+        )
+        table = pj.read_json(io.BytesIO(body), parse_options=options)
+        return pc.list_flatten(table["observations"].combine_chunks())
+
+    # already decoded: the response dict, or its observations list
+    if isinstance(payload, dict):
+        payload = payload.get("observations") or []
+    return pa.array(payload, type=value_type)
+
+
+def _convert(values, quantity, units):
+    scale, offset = TO_IMPERIAL.get(units, {}).get(quantity, (1.0, 0.0))
+    if scale != 1.0:
+        values = pc.multiply(values, scale)
+    if offset:
+        values = pc.add(values, offset)
+    return values
+
+
+def parse_observations(payload, kind="history", units="e", station_id=None, collection_time=None):
+    """
+    Turn a Weather Underground observations payload into an Arrow table laid out like
+    weather_observations, keeping every observation in it
+    payload: raw response body (bytes/str), the decoded response dict or its observations list.
+    kind: "current", "history" or "1day"; units: the `units` the request was made with
+    (e, m or h), converted to the imperial units stored. station_id fills rows that lack one.
+    """
+    if units not in UNIT_BLOCKS:
+        raise ValueError(f"Unknown units: {units} (expected one of {', '.join(UNIT_BLOCKS)})")
+
+    start = time.perf_counter()
+    fields = PAYLOAD_FIELDS[kind]
+    observations = _observations_array(payload, observation_type(kind, units))
+    block = pc.struct_field(observations, UNIT_BLOCKS[units])
+    rows = len(observations)
+
+    columns = []
+    for target in OBSERVATION_SCHEMA:
+        if target.name == "collection_time":
+            column = pa.repeat(pa.scalar(collection_time or datetime.now(), type=target.type), rows)
+        elif target.name not in fields:
+            column = pa.nulls(rows, type=target.type)
+        else:
+            name, quantity = fields[target.name]
+            if quantity is None:
+                column = pc.struct_field(observations, name)
+            else:
+                column = _convert(pc.struct_field(block, name), quantity, units)
+
+            if pa.types.is_integer(target.type):
+                column = pc.round(column)
+            column = column.cast(target.type)
+
+            if target.name == "station_id" and station_id:
+                column = column.fill_null(station_id)
+        columns.append(column)
+
+    table = pa.Table.from_arrays(columns, schema=OBSERVATION_SCHEMA)
+
+    # an observation without a timestamp can't be keyed
+    table = table.filter(pc.is_valid(table["observation_time"]))
+
+    metrics.observe("parse_seconds", time.perf_counter() - start, kind=kind)
+    metrics.inc("parsed_rows_total", table.num_rows, kind=kind)
+    return table
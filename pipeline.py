@@ -0,0 +1,270 @@
+# pipeline.py
+
+import json
+import os
+import queue
+import threading
+import time
+import duckdb
+import polars as pl
+import pyarrow as pa
+from config import (
+    INGEST_QUEUE_SIZE, INGEST_BATCH_ROWS, INGEST_BATCH_WAIT, INGEST_PUT_TIMEOUT,
+    INGEST_RETRY_INTERVAL, SPOOL_PATH
+)
+from db_utils import to_arrow, bulk_insert
+import metrics
+
+# write errors that mean "try again later" (file locked by another process, write conflict, disk)
+TRANSIENT_ERRORS = (duckdb.IOException, duckdb.TransactionException, OSError)
+
+
+### spool: append-only NDJSON holding batches the database could not take
+
+class Spool:
+    """
+    Append-only NDJSON file of observations waiting for the database
+    Replay renames the file first, so new appends go to a fresh file while it is read;
+    a replay that fails part way leaves the renamed file to be picked up by the next one.
+    In the default "ignore" ingest mode a row replayed twice is simply skipped the second time.
+    """
+
+    def __init__(self, path=SPOOL_PATH):
+        self.path = path
+        self.replay_path = f"{path}.replay"
+        self.rejected_path = f"{path}.rejected"
+        self._lock = threading.Lock()
+
+    def _append(self, path, table):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._lock, open(path, "ab") as f:
+            pl.from_arrow(table).write_ndjson(f)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def append(self, table):
+        self._append(self.path, table)
+
+    def reject(self, table):
+        """Set rows aside that the database refused outright (kept for inspection)"""
+        self._append(self.rejected_path, table)
+
+    def pending(self):
+        return os.path.exists(self.replay_path) or os.path.exists(self.path)
+
+    def _read(self, path, batch_rows):
+        rows = []
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    # torn last line from a crash mid-append
+                    print(f"Skipping unreadable spool line in {path}")
+                    continue
+                if len(rows) >= batch_rows:
+                    yield to_arrow(rows)
+                    rows = []
+        if rows:
+            yield to_arrow(rows)
+
+    def replay(self, write, batch_rows=INGEST_BATCH_ROWS):
+        """Feed every spooled row to write(table); returns rows replayed, raises if a write fails"""
+        replayed = 0
+        with self._lock:
+            if not os.path.exists(self.replay_path) and os.path.exists(self.path):
+                os.replace(self.path, self.replay_path)
+
+        if os.path.exists(self.replay_path):
+            for table in self._read(self.replay_path, batch_rows):
+                write(table)
+                replayed += table.num_rows
+            os.remove(self.replay_path)
+
+        return replayed
+
+
+### pipeline
+
+class IngestPipeline:
+    """
+    Fetchers put() parsed observations on a bounded queue; one writer thread drains it
+    Batches arriving within `batch_wait` seconds are combined (up to `batch_rows` rows) into
+    one bulk_insert, so a slow API never holds up writes and a burst costs one transaction.
+    When the database is unavailable (locked by the API or adhoc.py, write conflict) the
+    batch goes to the spool instead, and the spool is replayed once a write succeeds again
+    (tried at most every `retry_interval` seconds). A full queue blocks put() for up to
+    `put_timeout` seconds, then spills straight to the spool, so records are never dropped.
+    `write_lock` serializes the writer with other writers in the process (e.g. gap fills).
+    """
+
+    def __init__(self, spool=None, mode="ignore", write_lock=None, queue_size=INGEST_QUEUE_SIZE,
+                 batch_rows=INGEST_BATCH_ROWS, batch_wait=INGEST_BATCH_WAIT,
+                 put_timeout=INGEST_PUT_TIMEOUT, retry_interval=INGEST_RETRY_INTERVAL,
+                 write=bulk_insert):
+        self.spool = spool or Spool()
+        self.mode = mode
+        self.write_lock = write_lock or threading.Lock()
+        self.batch_rows = batch_rows
+        self.batch_wait = batch_wait
+        self.put_timeout = put_timeout
+        self.retry_interval = retry_interval
+        self._write = write
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._closing = threading.Event()
+        self._next_attempt = 0.0    # monotonic time before which the database is not retried
+
+        self.stats = {"queued": 0, "batches": 0, "written": 0, "inserted": 0,
+                      "spooled": 0, "replayed": 0, "rejected": 0, "write_errors": 0}
+
+    ### producers
+
+    def put(self, weather_data):
+        """Queue observations (dict, list of dicts, DataFrame or Arrow table) for writing"""
+        if weather_data is None or len(weather_data) == 0:
+            return
+
+        # normalize in the caller's thread: malformed input fails here, not in the writer
+        table = to_arrow(weather_data)
+        try:
+            self._queue.put(table, timeout=self.put_timeout)
+            self.stats["queued"] += table.num_rows
+        except queue.Full:
+            print(f"Ingest queue full, spooling {table.num_rows} rows")
+            self._spool(table, "queue_full")
+
+    ### writer
+
+    def _next_batch(self):
+        """Block for the first table, then gather more until batch_rows or batch_wait is reached"""
+        try:
+            first = self._queue.get(timeout=self.retry_interval)
+        except queue.Empty:
+            return None
+        if first is None:     # close() was called
+            return None
+
+        tables = [first]
+        rows = first.num_rows
+        deadline = time.monotonic() + self.batch_wait
+        while rows < self.batch_rows:
+            remaining = deadline - time.monotonic()
+            try:
+                table = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if table is None:
+                break
+            tables.append(table)
+            rows += table.num_rows
+
+        return pa.concat_tables(tables)
+
+    def _spool(self, table, reason="unavailable"):
+        self.spool.append(table)
+        self.stats["spooled"] += table.num_rows
+        metrics.inc("ingest_spooled_rows_total", table.num_rows, reason=reason)
+
+    def _insert(self, table):
+        with self.write_lock:
+            result = self._write(table, mode=self.mode)
+        self.stats["inserted"] += result["inserted"]
+        return result
+
+    def _available(self):
+        return time.monotonic() >= self._next_attempt
+
+    def _unavailable(self, error):
+        self.stats["write_errors"] += 1
+        self._next_attempt = time.monotonic() + self.retry_interval
+        print(f"Database unavailable ({error}), spooling and retrying in {self.retry_interval:g}s")
+
+    def _reject(self, table, error):
+        # the batch itself is bad: retrying can't help, keep it out of the spool
+        self.stats["rejected"] += table.num_rows
+        metrics.inc("ingest_dropped_batches_total", reason="rejected")
+        print(f"Rejected batch of {table.num_rows} rows: {error}")
+        self.spool.reject(table)
+
+    def _replay_batch(self, table):
+        try:
+            self._insert(table)
+        except TRANSIENT_ERRORS:
+            raise
+        except duckdb.Error as e:
+            self._reject(table, e)
+
+    def _replay(self):
+        try:
+            replayed = self.spool.replay(self._replay_batch, self.batch_rows)
+        except TRANSIENT_ERRORS as e:
+            self._unavailable(e)
+            return False
+
+        if replayed:
+            self.stats["replayed"] += replayed
+            print(f"Replayed {replayed} spooled observations")
+        return True
+
+    def _handle(self, table):
+        # spooled rows go in first, so the database sees observations in arrival order
+        if not self._available() or (self.spool.pending() and not self._replay()):
+            self._spool(table)
+            return
+
+        try:
+            self._insert(table)
+            self.stats["batches"] += 1
+            self.stats["written"] += table.num_rows
+        except TRANSIENT_ERRORS as e:
+            self._unavailable(e)
+            self._spool(table)
+        except duckdb.Error as e:
+            self._reject(table, e)
+
+    def _run(self):
+        if self.spool.pending():
+            self._replay()
+
+        while True:
+            table = self._next_batch()
+            if table is not None:
+                try:
+                    self._handle(table)
+                except Exception as e:
+                    # e.g. the spool itself is unwritable: keep the writer alive for later batches
+                    print(f"Ingest writer lost a batch of {table.num_rows} rows: {e}")
+                    metrics.inc("ingest_dropped_batches_total", reason="lost")
+
+            if self._closing.is_set() and self._queue.empty():
+                return
+            if table is None and self.spool.pending() and self._available():
+                # idle: bring spooled rows in without waiting for the next batch
+                self._replay()
+
+    ### lifecycle
+
+    def start(self):
+        """Start the writer thread (replays anything spooled by an earlier run first)"""
+        if self._thread is None:
+            self._closing.clear()
+            self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self):
+        """Write everything queued, then stop the writer thread"""
+        if self._thread is None:
+            return
+        self._closing.set()
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,93 @@
+# queries.py
+
+import os
+import tempfile
+import threading
+import time
+import metrics
+
+
+def _analyzed_plan(conn, sql, params):
+    """Run the query once under DuckDB's profiler; returns the plan with per-operator timings"""
+    fd, path = tempfile.mkstemp(suffix=".txt")
+    os.close(fd)
+    try:
+        # EXPLAIN ANALYZE takes no ? parameters: profile the bound query instead
+        conn.execute("SET enable_profiling = 'query_tree'")
+        conn.execute(f"SET profiling_output = '{path}'")
+        try:
+            conn.execute(sql, params).fetchall()
+        finally:
+            conn.execute("RESET enable_profiling")
+            conn.execute("RESET profiling_output")
+
+        with open(path) as f:
+            return f.read()
+    finally:
+        os.remove(path)
+
+
+class QueryRegistry:
+    """
+    Named, parameterized statements with timings per name
+    The SQL text of a statement is fixed; values only ever travel as ? parameters bound by
+    the driver, so any DuckDB parameter type (Decimal, bytes, lists, time...) works and no
+    value is rendered into SQL. One name may cover several SQL variants (e.g. with/without
+    a station filter).
+    DuckDB 0.9 has no way to bind driver parameters into EXECUTE, so every call is prepared
+    and planned again; there is no plan reuse across calls.
+    """
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _record(self, name, seconds, failed):
+        metrics.observe("sql_query_seconds", seconds, query=name)
+        if failed:
+            metrics.inc("sql_query_errors_total", query=name)
+
+        with self._lock:
+            s = self._stats.setdefault(name, {"count": 0, "errors": 0,
+                                              "total_s": 0.0, "max_s": 0.0, "last_s": 0.0})
+            s["count"] += 1
+            s["errors"] += failed
+            s["total_s"] += seconds
+            s["max_s"] = max(s["max_s"], seconds)
+            s["last_s"] = seconds
+
+    def execute(self, conn, name, sql, params=()):
+        """Run `sql` as statement `name` on `conn` with `params` bound; returns the connection like conn.execute"""
+        params = list(params)
+
+        start = time.perf_counter()
+        failed = True
+        try:
+            if metrics.profiling_sql():
+                # profiled request: run it once more under the profiler, left out of the timings
+                profiled = time.perf_counter()
+                metrics.add_query_plan(name, _analyzed_plan(conn, sql, params))
+                start += time.perf_counter() - profiled
+
+            result = conn.execute(sql, params)
+            failed = False
+            return result
+        finally:
+            self._record(name, time.perf_counter() - start, failed)
+
+    def stats(self):
+        """Snapshot of timings per query name (count, errors, avg/max/last seconds)"""
+        with self._lock:
+            return {name: dict(s, avg_s=s["total_s"] / s["count"] if s["count"] else 0.0)
+                    for name, s in self._stats.items()}
+
+
+registry = QueryRegistry()
+
+
+def execute(conn, name, sql, params=()):
+    return registry.execute(conn, name, sql, params)
+
+
+def get_query_stats():
+    return registry.stats()
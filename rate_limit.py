@@ -0,0 +1,60 @@
+# rate_limit.py
+
+import threading
+import time
+from urllib.parse import urlsplit
+from config import API_RATE_LIMIT, API_RATE_BURST
+
+
+### token bucket
+
+class TokenBucket:
+    """
+    Thread-safe token bucket
+    Refills at `rate` tokens per second up to `capacity`; acquire() blocks until a token is free
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = now
+
+    def acquire(self, tokens=1):
+        """Block until `tokens` are available, return seconds spent waiting"""
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill(time.monotonic())
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                wait = (tokens - self.tokens) / self.rate
+
+            time.sleep(wait)
+            waited += wait
+
+
+### one bucket per host
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(url, rate=None, capacity=None):
+    """Return the shared bucket for the host in `url`, creating it on first use"""
+    host = urlsplit(url).netloc
+
+    with _buckets_lock:
+        bucket = _buckets.get(host)
+        if bucket is None:
+            bucket = TokenBucket(rate or API_RATE_LIMIT, capacity or API_RATE_BURST)
+            _buckets[host] = bucket
+
+    return bucket
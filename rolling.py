@@ -0,0 +1,253 @@
+# rolling.py
+
+import re
+from datetime import datetime, timedelta
+from config import (
+    TABLE_NAME, HOURLY_TABLE, DAILY_TABLE,
+    ROLLING_RAW_MAX_SPAN, ROLLING_MAX_POINTS, PRESSURE_FALL_RATE
+)
+from rollups import ROLLUP_METRICS
+
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+
+# output steps a long series is thinned to, finest first
+STEPS = [timedelta(minutes=5), timedelta(minutes=15), timedelta(minutes=30), HOUR, 3 * HOUR,
+         6 * HOUR, 12 * HOUR, DAY, 7 * DAY, 30 * DAY]
+
+_UNITS = {"m": timedelta(minutes=1), "h": HOUR, "d": DAY, "w": 7 * DAY}
+
+
+### windows
+
+def parse_window(text):
+    """'90m', '1h', '24h', '7d', '2w' -> timedelta"""
+    match = re.fullmatch(r"\s*(\d+)\s*([mhdw])\s*", str(text).lower())
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"Invalid window '{text}', expected e.g. 90m, 1h, 24h, 7d or 2w")
+    return int(match.group(1)) * _UNITS[match.group(2)]
+
+
+def format_window(window):
+    for unit, size in (("d", DAY), ("h", HOUR)):
+        if window % size == timedelta(0):
+            return f"{window // size}{unit}"
+    return f"{window // _UNITS['m']}m"
+
+
+def interval_sql(delta):
+    """timedelta -> exact DuckDB INTERVAL literal"""
+    return f"INTERVAL '{delta // timedelta(microseconds=1)} microseconds'"
+
+
+def _resolution(window, start, end):
+    """Raw rows for short spans and sub-hour windows, the hourly rollup for everything else"""
+    if window < HOUR or window % HOUR or end - start <= timedelta(days=ROLLING_RAW_MAX_SPAN):
+        return "raw"
+    return "hourly"
+
+
+def _step(step, start, end, finest):
+    """Requested (or automatic) output step; None keeps every point"""
+    if step is not None:
+        step = parse_window(step) if isinstance(step, str) else step
+    else:
+        wanted = (end - start) / ROLLING_MAX_POINTS
+        if wanted < STEPS[0]:
+            return None
+        step = next((s for s in STEPS if s >= wanted), STEPS[-1])
+    return step if step > finest else None
+
+
+def _thin(step, order="time DESC"):
+    # one row per station and step: the last one, unless `order` picks another
+    if step is None:
+        return ""
+    return f"""
+        QUALIFY row_number() OVER (
+            PARTITION BY station_id, time_bucket({interval_sql(step)}, time) ORDER BY {order}
+        ) = 1"""
+
+
+def _source_rows(resolution, columns, source, start, end, warmup, station_id):
+    """
+    Sorted-by-(station, time) input for the window functions, reaching `warmup` before start so
+    the first output rows see a full window. Hourly buckets are labelled with the hour's end,
+    so a row at time T covers data up to T in both resolutions.
+    columns: (raw expression, hourly expression) pairs, selected in order as c0, c1, ...
+    """
+    station_filter = " AND station_id = ?" if station_id else ""
+    station_param = [station_id] if station_id else []
+    select = ", ".join(f"{pair[resolution == 'hourly']} AS c{i}" for i, pair in enumerate(columns))
+
+    if resolution == "raw":
+        sql = f"""
+            SELECT station_id, observation_time AS time, {select}
+            FROM {source}
+            WHERE observation_time > ? AND observation_time <= ?{station_filter}
+        """
+        return sql, [start - warmup, end] + station_param
+
+    sql = f"""
+        SELECT station_id, bucket + INTERVAL 1 HOUR AS time, {select}
+        FROM {HOURLY_TABLE}
+        WHERE bucket >= ? AND bucket < ?{station_filter}
+    """
+    return sql, [start - warmup, end] + station_param
+
+
+def _frame(window, resolution):
+    # trailing (T - window, T]; an hourly row already spans the hour before its label
+    preceding = window - (HOUR if resolution == "hourly" else timedelta(microseconds=1))
+    return f"PARTITION BY station_id ORDER BY time RANGE BETWEEN {interval_sql(preceding)} PRECEDING AND CURRENT ROW"
+
+
+### readers
+
+def rolling_stats_sql(metric, window, start, end=None, station_id=None, step=None, source=TABLE_NAME):
+    """
+    SQL + params + meta for per-station rolling mean/min/max/std/count of `metric` over a
+    trailing `window` ('1h', '24h', '7d', ...), one row per station and time in [start, end]
+    Spans up to ROLLING_RAW_MAX_SPAN days (and sub-hour windows) are computed over raw rows
+    in `source`, longer ones over the hourly rollup, whose sums, sums of squares and counts
+    give the same mean and std as the raw rows. Series longer than ROLLING_MAX_POINTS per
+    station are thinned to the last row of each `step`.
+    """
+    if metric not in ROLLUP_METRICS:
+        raise ValueError(f"Unknown metric '{metric}', expected one of {', '.join(ROLLUP_METRICS)}")
+
+    window = parse_window(window) if isinstance(window, str) else window
+    end = end or datetime.now()
+    resolution = _resolution(window, start, end)
+    step = _step(step, start, end, HOUR if resolution == "hourly" else timedelta(0))
+
+    rows, params = _source_rows(resolution, [
+        (metric, f"{metric}_sum"),
+        (f"{metric} * {metric}", f"{metric}_sumsq"),
+        (f"CAST({metric} IS NOT NULL AS BIGINT)", f"{metric}_count"),
+        (metric, f"{metric}_min"),
+        (metric, f"{metric}_max"),
+    ], source, start, end, window, station_id)
+
+    sql = f"""
+        WITH source AS ({rows}),
+        windowed AS (
+            SELECT
+                station_id,
+                time,
+                SUM(c0) OVER w AS s,
+                SUM(c1) OVER w AS ss,
+                SUM(c2) OVER w AS n,
+                MIN(c3) OVER w AS lo,
+                MAX(c4) OVER w AS hi
+            FROM source
+            WINDOW w AS ({_frame(window, resolution)})
+        )
+        SELECT
+            station_id,
+            time,
+            s / NULLIF(n, 0) AS mean,
+            lo AS min,
+            hi AS max,
+            sqrt(greatest((ss - s * s / n) / NULLIF(n - 1, 0), 0)) AS std,
+            CAST(n AS BIGINT) AS count
+        FROM windowed
+        WHERE time >= ?{_thin(step)}
+        ORDER BY station_id, time
+    """
+    meta = {"metric": metric, "window": format_window(window), "resolution": resolution,
+            "step": format_window(step) if step else None}
+    return sql, params + [start], meta
+
+
+def pressure_tendency_sql(window, start, end=None, station_id=None, step=None, source=TABLE_NAME):
+    """
+    SQL + params + meta for the pressure change over a trailing `window` per station and time
+    change is the latest pressure minus the oldest one in the window, rate_per_hour divides it
+    by the time between them. falling_fast flags a fall of PRESSURE_FALL_RATE inHg/hour or more
+    over at least half the window (the classic storm signal). When thinned, each step keeps
+    its steepest fall so storms survive downsampling.
+    """
+    window = parse_window(window) if isinstance(window, str) else window
+    end = end or datetime.now()
+    resolution = _resolution(window, start, end)
+    step = _step(step, start, end, HOUR if resolution == "hourly" else timedelta(0))
+
+    rows, params = _source_rows(resolution, [("pressure_hg", "pressure_hg_mean")],
+                                source, start, end, window, station_id)
+
+    sql = f"""
+        WITH source AS (SELECT * FROM ({rows}) WHERE c0 IS NOT NULL),
+        windowed AS (
+            SELECT
+                station_id,
+                time,
+                c0 AS pressure,
+                c0 - first_value(c0) OVER w AS change,
+                (epoch(time) - epoch(first_value(time) OVER w)) / 3600 AS elapsed_hours
+            FROM source
+            WINDOW w AS ({_frame(window, resolution)})
+        )
+        SELECT
+            station_id,
+            time,
+            pressure,
+            change,
+            change / NULLIF(elapsed_hours, 0) AS rate_per_hour,
+            elapsed_hours,
+            coalesce(change / NULLIF(elapsed_hours, 0) <= -{PRESSURE_FALL_RATE}
+                     AND elapsed_hours >= {window / HOUR / 2}, FALSE) AS falling_fast
+        FROM windowed
+        WHERE time >= ?{_thin(step, "rate_per_hour ASC NULLS LAST, time DESC")}
+        ORDER BY station_id, time
+    """
+    meta = {"window": format_window(window), "resolution": resolution,
+            "step": format_window(step) if step else None, "fall_rate_threshold": PRESSURE_FALL_RATE}
+    return sql, params + [start], meta
+
+
+def cumulative_precipitation_sql(start, end=None, station_id=None, window="7d", step=None):
+    """
+    SQL + params + meta for daily precipitation per station: the day's total, the running
+    total since `start` and the total over a trailing `window` of whole days
+    The stations report precipitation accumulated since midnight, so a day's total is its
+    maximum, read from the daily rollup.
+    """
+    window = parse_window(window) if isinstance(window, str) else window
+    if window % DAY:
+        raise ValueError(f"Precipitation windows are whole days, got '{format_window(window)}'")
+
+    end = end or datetime.now()
+    step = _step(step, start, end, DAY)
+    station_filter = " AND station_id = ?" if station_id else ""
+    station_param = [station_id] if station_id else []
+
+    sql = f"""
+        WITH days AS (
+            SELECT station_id, CAST(bucket AS TIMESTAMP) AS time, coalesce(precip_today_in_max, 0) AS total
+            FROM {DAILY_TABLE}
+            WHERE bucket > ? AND bucket <= ?{station_filter}
+        ),
+        windowed AS (
+            SELECT
+                station_id,
+                time,
+                total,
+                SUM(CASE WHEN time >= ? THEN total ELSE 0 END) OVER (
+                    PARTITION BY station_id ORDER BY time ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
+                ) AS cumulative,
+                SUM(total) OVER (
+                    PARTITION BY station_id ORDER BY time RANGE BETWEEN {interval_sql(window - DAY)} PRECEDING AND CURRENT ROW
+                ) AS window_total
+            FROM days
+        )
+        SELECT station_id, time, total, cumulative, window_total
+        FROM windowed
+        WHERE time >= ?{_thin(step)}
+        ORDER BY station_id, time
+    """
+    first_day = datetime.combine(start.date(), datetime.min.time())
+    params = [(first_day - window).date(), end.date()] + station_param + [first_day, first_day]
+    meta = {"window": format_window(window), "resolution": "daily",
+            "step": format_window(step) if step else None}
+    return sql, params, meta
@@ -0,0 +1,232 @@
+# rollups.py
+
+from datetime import datetime, time, timedelta
+from config import TABLE_NAME, HOURLY_TABLE, DAILY_TABLE, OBSERVATIONS_VIEW
+from archive import table_exists, ensure_observations_view
+
+# metrics carried in the rollups; each gets _mean, _min, _max, _sum, _sumsq, _count columns
+# (_sumsq lets rolling.py derive exact standard deviations from buckets)
+ROLLUP_METRICS = [
+    "temp_f", "heat_index", "wind_chill", "dew_point",
+    "humidity", "wind_mph", "wind_gust_mph", "pressure_hg",
+    "precip_today_in", "precip_rate_in",
+]
+ROLLUP_STATS = ("mean", "min", "max", "sum", "sumsq", "count")
+
+
+### tables
+
+def _metric_columns():
+    columns = []
+    for m in ROLLUP_METRICS:
+        columns += [f"{m}_mean DOUBLE", f"{m}_min DOUBLE", f"{m}_max DOUBLE",
+                    f"{m}_sum DOUBLE", f"{m}_sumsq DOUBLE", f"{m}_count BIGINT"]
+    return ",\n                ".join(columns)
+
+
+def _has_column(conn, table, column):
+    result = conn.execute("SELECT COUNT(*) FROM duckdb_columns() WHERE table_name = ? AND column_name = ?",
+                          [table, column]).fetchone()
+    return result[0] > 0
+
+
+def _create_rollup_table(conn, name, bucket_type):
+    conn.execute(f"""
+        CREATE TABLE {name} (
+            station_id VARCHAR,
+            bucket {bucket_type},
+            observations BIGINT,
+            {_metric_columns()},
+            PRIMARY KEY (station_id, bucket)
+        )
+    """)
+
+
+def initialize_rollups(conn):
+    """Create the hourly/daily rollup tables, building them from raw data the first time"""
+    if table_exists(conn, HOURLY_TABLE) and table_exists(conn, DAILY_TABLE):
+        if _has_column(conn, HOURLY_TABLE, f"{ROLLUP_METRICS[0]}_sumsq"):
+            return
+        # built before the _sumsq columns: rebuilt once in the current layout below
+
+    elif not table_exists(conn, TABLE_NAME):
+        _create_rollup_table(conn, HOURLY_TABLE, "TIMESTAMP")
+        _create_rollup_table(conn, DAILY_TABLE, "DATE")
+        return
+
+    ensure_observations_view(conn)
+    rebuild_rollups(conn)
+
+
+### aggregation SQL
+
+def _rollup_columns():
+    return ", ".join(f"{m}_{s}" for m in ROLLUP_METRICS for s in ROLLUP_STATS)
+
+
+def _raw_aggregates():
+    aggs = []
+    for m in ROLLUP_METRICS:
+        aggs += [f"AVG({m}) AS {m}_mean", f"MIN({m}) AS {m}_min", f"MAX({m}) AS {m}_max",
+                 f"SUM({m}) AS {m}_sum", f"SUM({m} * {m}) AS {m}_sumsq", f"COUNT({m}) AS {m}_count"]
+    return ",\n            ".join(aggs)
+
+
+def _rollup_aggregates():
+    # combine finer buckets: weighted mean from sums and counts
+    aggs = []
+    for m in ROLLUP_METRICS:
+        aggs += [f"SUM({m}_sum) / NULLIF(SUM({m}_count), 0) AS {m}_mean",
+                 f"MIN({m}_min) AS {m}_min", f"MAX({m}_max) AS {m}_max",
+                 f"SUM({m}_sum) AS {m}_sum", f"SUM({m}_sumsq) AS {m}_sumsq", f"SUM({m}_count) AS {m}_count"]
+    return ",\n            ".join(aggs)
+
+
+def _upsert(name):
+    updates = ["observations = excluded.observations"]
+    for m in ROLLUP_METRICS:
+        updates += [f"{m}_{s} = excluded.{m}_{s}" for s in ROLLUP_STATS]
+    return f"ON CONFLICT (station_id, bucket) DO UPDATE SET {', '.join(updates)}"
+
+
+### maintenance
+
+def refresh_rollups(conn, batch="_ingest_batch", source=TABLE_NAME):
+    """
+    Recompute the hourly and daily buckets touched by a batch
+    `batch` names a view/table holding the ingested rows (db_utils registers _ingest_batch).
+    Only the affected buckets are re-aggregated from raw data, so the cost follows the batch
+    size, not the history. `source` is the unified view when the batch reaches into archived
+    days. Runs inside the caller's transaction, on tables set up by initialize_rollups.
+    """
+    conn.execute(f"""
+        CREATE OR REPLACE TEMP TABLE _rollup_hours AS
+        SELECT DISTINCT station_id, date_trunc('hour', observation_time) AS bucket
+        FROM {batch}
+        WHERE station_id IS NOT NULL AND observation_time IS NOT NULL
+    """)
+    first, last = conn.execute("SELECT MIN(bucket), MAX(bucket) FROM _rollup_hours").fetchone()
+    if first is None:
+        conn.execute("DROP TABLE _rollup_hours")
+        return
+
+    # the batch's range as plain constants, so the scans reach the zonemaps (a subquery bound doesn't);
+    # plain joins on the distinct bucket lists, as DuckDB 0.9 keeps table filters out of SEMI JOIN scans
+    conn.execute(f"""
+        INSERT INTO {HOURLY_TABLE}
+        SELECT
+            o.station_id,
+            date_trunc('hour', o.observation_time) AS bucket,
+            COUNT(*) AS observations,
+            {_raw_aggregates()}
+        FROM {source} o
+        JOIN _rollup_hours h
+            ON o.station_id = h.station_id AND date_trunc('hour', o.observation_time) = h.bucket
+        WHERE o.observation_time >= ? AND o.observation_time < ?
+        GROUP BY ALL
+        {_upsert(HOURLY_TABLE)}
+    """, [first, last + timedelta(hours=1)])
+
+    conn.execute(f"""
+        INSERT INTO {DAILY_TABLE}
+        SELECT
+            r.station_id,
+            CAST(r.bucket AS DATE) AS bucket,
+            SUM(r.observations) AS observations,
+            {_rollup_aggregates()}
+        FROM {HOURLY_TABLE} r
+        JOIN (SELECT DISTINCT station_id, CAST(bucket AS DATE) AS day FROM _rollup_hours) d
+            ON r.station_id = d.station_id AND CAST(r.bucket AS DATE) = d.day
+        WHERE r.bucket >= ? AND r.bucket < ?
+        GROUP BY ALL
+        {_upsert(DAILY_TABLE)}
+    """, [datetime.combine(first.date(), time.min), datetime.combine(last.date() + timedelta(days=1), time.min)])
+
+    conn.execute("DROP TABLE _rollup_hours")
+
+
+def rebuild_rollups(conn):
+    """Recompute both rollups from scratch, archive included (after a compaction or on an existing database)"""
+    # recreate rather than DELETE: DuckDB rejects re-inserting deleted keys in the same transaction
+    conn.execute(f"DROP TABLE IF EXISTS {HOURLY_TABLE}")
+    conn.execute(f"DROP TABLE IF EXISTS {DAILY_TABLE}")
+    _create_rollup_table(conn, HOURLY_TABLE, "TIMESTAMP")
+    _create_rollup_table(conn, DAILY_TABLE, "DATE")
+
+    conn.execute(f"""
+        INSERT INTO {HOURLY_TABLE}
+        SELECT
+            station_id,
+            date_trunc('hour', observation_time) AS bucket,
+            COUNT(*) AS observations,
+            {_raw_aggregates()}
+        FROM {OBSERVATIONS_VIEW}
+        WHERE station_id IS NOT NULL AND observation_time IS NOT NULL
+        GROUP BY ALL
+    """)
+
+    conn.execute(f"""
+        INSERT INTO {DAILY_TABLE}
+        SELECT
+            station_id,
+            CAST(bucket AS DATE) AS bucket,
+            SUM(observations) AS observations,
+            {_rollup_aggregates()}
+        FROM {HOURLY_TABLE}
+        GROUP BY ALL
+    """)
+
+
+### readers
+
+def daily_stats_sql(start, end=None, station_id=None, source=TABLE_NAME):
+    """
+    SQL + params with one row per (station_id, day) in [start, end), rollup column layout
+    Whole days inside the window are read from the daily rollup; the partial days at the
+    edges are aggregated from raw rows in `source`. end is exclusive, so back-to-back windows
+    never count a row twice; end=None leaves the window open (up to now).
+    """
+    first_full = start.date() if start.time() == time.min else start.date() + timedelta(days=1)
+    last_full = (end or datetime.now()).date()    # exclusive: the end day is partial
+
+    station_filter = " AND station_id = ?" if station_id else ""
+    station_param = [station_id] if station_id else []
+    day_columns = "station_id, CAST(observation_time AS DATE) AS bucket, COUNT(*) AS observations"
+    end_filter = " AND observation_time < ?" if end else ""
+    end_param = [end] if end else []
+
+    if first_full >= last_full:
+        # window shorter than a day: raw rows only
+        sql = f"""
+            SELECT {day_columns}, {_raw_aggregates()}
+            FROM {source}
+            WHERE observation_time >= ?{end_filter}{station_filter}
+            GROUP BY ALL
+        """
+        return sql, [start] + end_param + station_param
+
+    sql = f"""
+        SELECT station_id, bucket, observations, {_rollup_columns()}
+        FROM {DAILY_TABLE}
+        WHERE bucket >= ? AND bucket < ?{station_filter}
+
+        UNION ALL
+
+        SELECT {day_columns}, {_raw_aggregates()}
+        FROM {source}
+        WHERE observation_time >= ? AND observation_time < ?{station_filter}
+        GROUP BY ALL
+
+        UNION ALL
+
+        SELECT {day_columns}, {_raw_aggregates()}
+        FROM {source}
+        WHERE observation_time >= ?{end_filter}{station_filter}
+        GROUP BY ALL
+    """
+    # one plain range per edge (not an OR) so the time filter reaches the zonemaps
+    params = ([first_full, last_full] + station_param
+              + [start, datetime.combine(first_full, time.min)] + station_param
+              + [datetime.combine(last_full, time.min)] + end_param + station_param)
+
+    return sql, params
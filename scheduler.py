@@ -1,31 +1,221 @@
 # scheduler.py
 
-import scheduler
+import heapq
+import queue
+import random
+import threading
 import time
-from datetime import datetime
-from weather_collector import collect_and_store_weather
-from db_utils import initialize_db
-from config import COLLECTION_INTERVAL
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from config import (
+    COLLECTION_INTERVAL, COLLECTION_TIME, COLLECTION_STAGGER, COLLECTION_JITTER,
+    COLLECTION_GAP_TOLERANCE, FETCH_WORKERS, LATEST_TABLE, COLLECTOR_METRICS_PATH, METRICS_EXPORT_INTERVAL
+)
+from db_utils import initialize_db, connect
+from weather_api import STATIONS, get_current_conditions
+from backfill import run_backfill
+from pipeline import IngestPipeline
+import metrics
 
-def main():
-    """Initialize db and schedule data collection"""
-    print(f"Initializing weather data collection service at {datetime.now()}")
+UNIT_SECONDS = {"seconds": 1, "minutes": 60, "hours": 3600}
 
-    initialize_db()
 
-    # collect immediately on startup
-    print("Collecting initial weather data...")
-    collect_and_store_weather()
+def interval_seconds():
+    """COLLECTION_INTERVAL in seconds"""
+    return COLLECTION_INTERVAL * UNIT_SECONDS[COLLECTION_TIME]
+
+
+class CollectionScheduler:
+    """
+    Collects each station on a fixed cadence
+    Deadlines come from the monotonic clock and advance by exactly one interval, so run time
+    and wall-clock changes never shift the cadence. Stations are staggered across `stagger`
+    seconds (plus up to `jitter` seconds per run) to spread API calls out. A station whose
+    previous run is still going is skipped rather than run twice. Skipped, failed and missed
+    intervals (e.g. the process was stopped or the machine slept) are queued as gap fills for
+    the history backfill, which runs on its own thread.
+    Collected records go to an IngestPipeline (or `save`, if given), so a slow or locked
+    database never holds up the next fetch.
+    """
+
+    def __init__(self, station_ids=None, interval=None, stagger=COLLECTION_STAGGER, jitter=COLLECTION_JITTER,
+                 collect=get_current_conditions, save=None, backfill=run_backfill):
+        if station_ids is None:
+            station_ids = [station["id"] for station in STATIONS if station["id"]]
+        self.station_ids = list(station_ids)
+        self.interval = interval or interval_seconds()
+        self.stagger = min(stagger, self.interval)
+        self.jitter = jitter
+
+        self._write_lock = threading.Lock()
+        self.pipeline = None if save else IngestPipeline(write_lock=self._write_lock)
+
+        self.collect = collect
+        self.save = save or self.pipeline.put
+        self.backfill = backfill
+
+        self._heap = []                 # (due, nominal deadline, index, station_id)
+        self._running = {}              # station_id -> future of its current run
+        self._stop = threading.Event()
+        self._gaps = queue.Queue()
+        self._pending_gaps = set()      # (station_id, day) already queued
+        self._gap_lock = threading.Lock()
+
+        self.stats = {"runs": 0, "queued": 0, "failed": 0, "overlaps": 0, "missed": 0, "gap_fills": 0}
+
+    ### gap fills
+
+    def queue_gap(self, station_id, since):
+        """Backfill `station_id` from the day of `since` through today"""
+        day, today = since.date(), datetime.now().date()
+        with self._gap_lock:
+            days = []
+            while day <= today:
+                if (station_id, day) not in self._pending_gaps:
+                    self._pending_gaps.add((station_id, day))
+                    days.append(day)
+                day += timedelta(days=1)
+
+        if days:
+            print(f"Queued gap fill for {station_id}: {days[0]} to {days[-1]}")
+            self._gaps.put((station_id, days[0], days[-1]))
+
+    def _gap_worker(self):
+        while True:
+            item = self._gaps.get()
+            if item is None:
+                return
+
+            station_id, start, end = item
+            with self._gap_lock:
+                self._pending_gaps.difference_update((station_id, start + timedelta(days=d))
+                                                     for d in range((end - start).days + 1))
+            try:
+                # backfill and collection update the same rollup rows: the backfill takes the
+                # write lock around each of its writes (not while it fetches)
+                self.backfill(start, end, station_ids=[station_id], write_lock=self._write_lock)
+                self.stats["gap_fills"] += 1
+            except Exception as e:
+                print(f"Gap fill for {station_id} {start} to {end} failed: {e}")
+
+    def check_startup_gaps(self):
+        """Queue gap fills for stations whose newest observation is more than one interval old"""
+        conn = connect()
+        try:
+            latest = dict(conn.execute(f"SELECT station_id, observation_time FROM {LATEST_TABLE}").fetchall())
+        finally:
+            conn.close()
+
+        cutoff = datetime.now() - timedelta(seconds=self.interval * COLLECTION_GAP_TOLERANCE)
+        for station_id in self.station_ids:
+            last = latest.get(station_id)
+            if last is not None and last < cutoff:
+                self.queue_gap(station_id, last)
+
+    ### collection
+
+    def _collect(self, station_id):
+        with metrics.timer("collection_seconds"):
+            self._collect_station(station_id)
+
+    def _collect_station(self, station_id):
+        try:
+            data = self.collect(station_id)
+            if not data:
+                raise RuntimeError("no data returned")
 
-    # schedule regular collection
-    schedule.every(COLLECTION_INTERVAL).minutes.do(collect_and_store_weather())
+            self.save(data)
+            self.stats["queued"] += 1
+        except Exception as e:
+            # the sample is lost; the history endpoint still has it
+            self.stats["failed"] += 1
+            print(f"Collection for {station_id} failed: {e}")
+            self.queue_gap(station_id, datetime.now())
 
-    print(f"Scheduled to collect data every {COLLECTION_INTERVAL} minutes")
+    def _dispatch(self, pool, station_id):
+        previous = self._running.get(station_id)
+        if previous is not None and not previous.done():
+            self.stats["overlaps"] += 1
+            print(f"Previous run for {station_id} still in progress, skipping this interval")
+            self.queue_gap(station_id, datetime.now())
+            return
+
+        self.stats["runs"] += 1
+        self._running[station_id] = pool.submit(self._collect, station_id)
+
+    ### main loop
+
+    def _schedule(self, nominal, index, station_id):
+        due = nominal + random.uniform(0, self.jitter)
+        heapq.heappush(self._heap, (due, nominal, index, station_id))
+
+    def run(self):
+        """Collect until stop() is called (the first run of each station starts right away)"""
+        if not self.station_ids:
+            print("No stations configured")
+            return
+
+        print(f"Collecting {len(self.station_ids)} stations every {self.interval:g}s, "
+              f"staggered over {self.stagger:g}s")
+
+        self.check_startup_gaps()
+        if self.pipeline:
+            self.pipeline.start()
+        # this process's metrics, for /api/metrics in the API process
+        exporter = metrics.Exporter(COLLECTOR_METRICS_PATH, METRICS_EXPORT_INTERVAL).start()
+        gap_thread = threading.Thread(target=self._gap_worker, name="gap-fill", daemon=True)
+        gap_thread.start()
+
+        start = time.monotonic()
+        for index, station_id in enumerate(self.station_ids):
+            self._schedule(start + self.stagger * index / len(self.station_ids), index, station_id)
+
+        try:
+            with ThreadPoolExecutor(max_workers=min(FETCH_WORKERS, len(self.station_ids)),
+                                    thread_name_prefix="collect") as pool:
+                while not self._stop.is_set():
+                    due, nominal, index, station_id = self._heap[0]
+                    wait = due - time.monotonic()
+                    if wait > 0:
+                        self._stop.wait(wait)
+                        continue
+
+                    heapq.heappop(self._heap)
+                    self._dispatch(pool, station_id)
+
+                    # woke up more than a whole interval late: those runs can't happen any more
+                    missed = int((time.monotonic() - nominal) // self.interval)
+                    if missed:
+                        self.stats["missed"] += missed
+                        print(f"Missed {missed} interval(s) for {station_id}")
+                        self.queue_gap(station_id, datetime.now() - timedelta(seconds=missed * self.interval))
+
+                    self._schedule(nominal + (missed + 1) * self.interval, index, station_id)
+        finally:
+            # write what was collected, even on Ctrl-C
+            if self.pipeline:
+                self.pipeline.close()
+            exporter.stop()
+
+        self._gaps.put(None)
+        gap_thread.join()
+
+    def stop(self):
+        self._stop.set()
+
+
+def main():
+    """Initialize db and run the collection scheduler"""
+    print(f"Initializing weather data collection service at {datetime.now()}")
+
+    initialize_db()
 
-    # keep 'er going
-    while True:
-        schedule.run_pending()
-        time.sleep(1) #seconds
+    scheduler = CollectionScheduler()
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        scheduler.stop()
+        print(f"Stopped. {scheduler.stats}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
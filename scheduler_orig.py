@@ -1,13 +1,13 @@
 # scheduler.py
 
-import schedule
-import time
 import argparse
 from datetime import datetime, timedelta
 import os
 from weather_api import get_current_conditions, get_current_conditions_multiple
 from db_utils import initialize_db, save_weather_data
-from config import COLLECTION_INTERVAL, COLLECTION_TIME
+from backfill import run_backfill
+from pipeline import IngestPipeline
+from scheduler import CollectionScheduler
 
 def collect_weather_data():
     """Collect weather data and save to database"""
@@ -34,6 +34,8 @@ def collect_weather_data_multiple():
     """
     Save weather data to DuckDB using Polars
     Collects data from multiple lists, defined in weather_api & referencing the config file
+    Each station's record goes to the ingest pipeline as soon as it is fetched; records the
+    database can't take right now (e.g. locked by the API) are spooled and replayed later.
     """
     
     print(f"Collecting weather data at {datetime.now()}")
@@ -41,15 +43,13 @@ def collect_weather_data_multiple():
     # Initialize db connection
     conn = initialize_db()
 
-    # Get current weather
-    weather_data = get_current_conditions_multiple()
+    # Get current weather, writing in the background
+    with IngestPipeline() as pipeline:
+        weather_data = get_current_conditions_multiple(sink=pipeline.put)
 
     if weather_data:
         print("Connection successful!")# Current temperature:", weather_data["temp_f"], "°F")
-        print("Saving...")
-        # save to db
-        save_weather_data(weather_data)
-        print("Weather data saved successfully!")
+        print(f"Weather data saved: {pipeline.stats}")
     else:
         print("Failed to collect weather data")
 
@@ -63,32 +63,12 @@ def collect_historical_data(start_date, end_date):
     Args:
         start_date (datetime): Start date
         end_date (datetime): End date
+
+    Runs the resumable backfill: days already checkpointed are skipped.
     """
     print(f"Collecting historical data from {start_date} to {end_date}")
-    
-    # Initialize database connection
-    conn = initialize_db()
-    
-    current_date = start_date
-    while current_date <= end_date:
-        date_str = current_date.strftime("%Y%m%d")
-        print(f"Collecting data for {date_str}")
-        
-        # Get historical data
-        historical_data = get_historical_data(date_str)
-        
-        if historical_data:
-            # Save data to database
-            save_historical_data(historical_data, conn)
-            print(f"Historical data for {date_str} saved successfully!")
-        else:
-            print(f"Failed to collect historical data for {date_str}")
-        
-        # Move to next day
-        current_date = current_date + timedelta(days=1)
-        
-        # Add a delay to avoid API rate limits
-        time.sleep(2)
+
+    return run_backfill(start_date, end_date)
 
 def main():
     """Main function to set up and run the scheduler"""
@@ -108,20 +88,14 @@ def main():
         collect_historical_data(start_date, end_date)
         return
 
-    # Run 1x at startup
-    collect_weather_data_multiple()
-    print("First run complete. Schedule starting.")
-
-    # schedule to run
-    schedule.every(COLLECTION_INTERVAL).minutes.do(collect_weather_data_multiple)
-
-    # continue running
-    n = 0
-    while True:
-        schedule.run_pending()
-        time.sleep(600) # checking every 5 minutes
-        n = n + 5
-        print(f"Collecting every {COLLECTION_INTERVAL} {COLLECTION_TIME}. Elapsed minutes: {n}")
+    # fixed-cadence collection per station; missed intervals are backfilled
+    initialize_db()
+    scheduler = CollectionScheduler()
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        scheduler.stop()
+        print(f"Stopped. {scheduler.stats}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,140 @@
+# series.py
+
+from datetime import datetime, timedelta
+from config import TABLE_NAME, HOURLY_TABLE, DAILY_TABLE, SERIES_DEFAULT_POINTS, SERIES_MAX_POINTS
+from rollups import ROLLUP_METRICS
+
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+SERIES_METHODS = ("bucket", "lttb")
+
+
+def _plan(start, end, points):
+    """
+    Resolution to read and bucket width for `points` buckets over [start, end)
+    Buckets of an hour or more are built from the hourly rollup, of a day or more from the
+    daily one, with the width rounded up to whole hours/days (so at most `points` buckets).
+    Returns (resolution, origin, width).
+    """
+    width = max((end - start) / points, timedelta(seconds=1))
+
+    if width >= DAY:
+        resolution, unit = "daily", DAY
+        origin = datetime.combine(start.date(), datetime.min.time())
+    elif width >= HOUR:
+        resolution, unit = "hourly", HOUR
+        origin = start.replace(minute=0, second=0, microsecond=0)
+    else:
+        resolution, unit = "raw", timedelta(microseconds=1)
+        origin = start
+
+    # the width covers [origin, end): measured from `start`, flooring the origin would add a bucket
+    width = max(-((origin - end) // (points * unit)) * unit, timedelta(seconds=1))
+    return resolution, origin, width
+
+
+def _rows(resolution, metric, source, origin, end, station_id):
+    """station_id, time and the sum, min, max and count of `metric` (s, lo, hi, n) per raw row or rollup bucket"""
+    station_filter = " AND station_id = ?" if station_id else ""
+    station_param = [station_id] if station_id else []
+
+    if resolution == "raw":
+        sql = f"""
+            SELECT station_id, observation_time AS time,
+                   {metric} AS s, {metric} AS lo, {metric} AS hi, CAST({metric} IS NOT NULL AS BIGINT) AS n
+            FROM {source}
+            WHERE observation_time >= ? AND observation_time < ?{station_filter}
+        """
+        return sql, [origin, end] + station_param
+
+    table = HOURLY_TABLE if resolution == "hourly" else DAILY_TABLE
+    sql = f"""
+        SELECT station_id, CAST(bucket AS TIMESTAMP) AS time,
+               {metric}_sum AS s, {metric}_min AS lo, {metric}_max AS hi, {metric}_count AS n
+        FROM {table}
+        WHERE bucket >= ? AND bucket < ?{station_filter}
+    """
+    bounds = [origin, end] if resolution == "hourly" else [origin.date(), end.date() + DAY]
+    return sql, bounds + station_param
+
+
+def series_sql(metric, start, end=None, points=SERIES_DEFAULT_POINTS, station_id=None, method="bucket",
+               source=TABLE_NAME):
+    """
+    SQL + params + meta for a chart series of `metric` per station over [start, end), at most
+    `points` rows per station whatever the range
+    method="bucket": equal time buckets with mean/min/max/count, so spikes stay visible as the
+    min/max band. method="lttb": Largest-Triangle-Three-Buckets, keeping the actual rows that
+    best preserve the line's shape (time, value). Each row is scored against the averages of
+    the neighbouring buckets rather than the previously selected row, so the selection runs as
+    one set-based query. Long ranges read the hourly/daily rollups (LTTB then works on their means).
+    """
+    if metric not in ROLLUP_METRICS:
+        raise ValueError(f"Unknown metric '{metric}', expected one of {', '.join(ROLLUP_METRICS)}")
+    if method not in SERIES_METHODS:
+        raise ValueError(f"Unknown method '{method}', expected one of {', '.join(SERIES_METHODS)}")
+
+    end = end or datetime.now()
+    if end <= start:
+        raise ValueError("end must be after start")
+    points = min(max(int(points), 3), SERIES_MAX_POINTS)
+
+    resolution, origin, width = _plan(start, end, points)
+    rows, params = _rows(resolution, metric, source, origin, end, station_id)
+    meta = {"metric": metric, "method": method, "resolution": resolution, "points": points}
+
+    if method == "bucket":
+        sql = f"""
+            SELECT
+                station_id,
+                ?::TIMESTAMP + to_microseconds(CAST(slot * ? AS BIGINT)) AS time,
+                SUM(s) / NULLIF(SUM(n), 0) AS mean,
+                MIN(lo) AS min,
+                MAX(hi) AS max,
+                CAST(SUM(n) AS BIGINT) AS count
+            FROM (
+                SELECT *, (epoch_us(time) - ?) // ? AS slot FROM ({rows})
+            )
+            GROUP BY station_id, slot
+            ORDER BY station_id, time
+        """
+        width_us = width // timedelta(microseconds=1)
+        origin_us = (origin - datetime(1970, 1, 1)) // timedelta(microseconds=1)
+        meta["bucket_seconds"] = width.total_seconds()
+        return sql, [origin, width_us, origin_us, width_us] + params, meta
+
+    # LTTB: first and last row kept, the rest split into points - 2 buckets of equal row counts
+    sql = f"""
+        WITH source AS (
+            SELECT station_id, time, s / NULLIF(n, 0) AS value FROM ({rows}) WHERE n > 0
+        ),
+        indexed AS (
+            SELECT *, epoch_us(time) / 1e6 AS x,
+                   CASE
+                       WHEN count(*) OVER p <= {points} THEN row_number() OVER p
+                       WHEN row_number() OVER p = 1 THEN -1
+                       WHEN row_number() OVER p = count(*) OVER p THEN {points} - 2
+                       ELSE floor((row_number() OVER p - 2) * ({points} - 2) / (count(*) OVER p - 2))
+                   END AS slot
+            FROM source
+            WINDOW p AS (PARTITION BY station_id ORDER BY time
+                         ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING)
+        ),
+        anchors AS (
+            SELECT
+                station_id, slot,
+                lag(ax) OVER b AS px, lag(av) OVER b AS pv,
+                lead(ax) OVER b AS nx, lead(av) OVER b AS nv
+            FROM (SELECT station_id, slot, AVG(x) AS ax, AVG(value) AS av FROM indexed GROUP BY ALL)
+            WINDOW b AS (PARTITION BY station_id ORDER BY slot)
+        )
+        SELECT i.station_id, i.time, i.value
+        FROM indexed i
+        JOIN anchors a ON a.station_id = i.station_id AND a.slot = i.slot
+        QUALIFY row_number() OVER (
+            PARTITION BY i.station_id, i.slot
+            ORDER BY abs((a.px - a.nx) * (i.value - a.pv) - (a.px - i.x) * (a.nv - a.pv)) DESC NULLS LAST, i.time
+        ) = 1
+        ORDER BY i.station_id, i.time
+    """
+    return sql, params, meta
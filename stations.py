@@ -0,0 +1,73 @@
+# stations.py
+
+from config import TABLE_NAME, OBSERVATIONS_VIEW, STATIONS_TABLE
+from archive import table_exists, ensure_observations_view
+
+# per-station attributes kept once here instead of on every observation (compact layout)
+STATION_COLUMNS = ("neighborhood", "latitude", "longitude")
+
+
+def _has_columns(conn, name):
+    # True if `name` carries the station columns (the standard observations layout)
+    result = conn.execute("""
+        SELECT COUNT(*) FROM duckdb_columns() WHERE table_name = ? AND column_name = ?
+    """, [name, STATION_COLUMNS[0]]).fetchone()
+    return result[0] > 0
+
+
+def _create_stations_table(conn):
+    conn.execute(f"""
+        CREATE TABLE {STATIONS_TABLE} (
+            station_id VARCHAR PRIMARY KEY,
+            neighborhood VARCHAR,
+            latitude FLOAT,
+            longitude FLOAT,
+            last_observation TIMESTAMP      -- newest observation these values were taken from
+        )
+    """)
+
+
+def _station_rows(source):
+    # newest non-null value of each attribute per station
+    latest = ", ".join(
+        f"arg_max({c}, observation_time) FILTER (WHERE {c} IS NOT NULL) AS {c}" for c in STATION_COLUMNS
+    )
+    return f"""
+        SELECT station_id, {latest}, MAX(observation_time) AS last_observation
+        FROM {source}
+        WHERE station_id IS NOT NULL AND observation_time IS NOT NULL
+        GROUP BY station_id
+    """
+
+
+def initialize_stations(conn):
+    """Create the stations table, filling it from existing observations the first time"""
+    if table_exists(conn, STATIONS_TABLE):
+        return
+
+    _create_stations_table(conn)
+    if not (table_exists(conn, TABLE_NAME) and _has_columns(conn, TABLE_NAME)):
+        return
+
+    ensure_observations_view(conn)
+    refresh_stations(conn, OBSERVATIONS_VIEW)
+
+
+def refresh_stations(conn, batch="_ingest_batch"):
+    """
+    Fold the station attributes of a batch into the stations table
+    Values from observations newer than the stored ones replace them; a missing value (history
+    payloads carry no neighborhood) never clears one. Runs inside the caller's transaction, on
+    the table set up by initialize_stations.
+    """
+    updates = ", ".join(f"""
+        {c} = CASE WHEN excluded.last_observation >= {STATIONS_TABLE}.last_observation
+                   THEN coalesce(excluded.{c}, {STATIONS_TABLE}.{c})
+                   ELSE coalesce({STATIONS_TABLE}.{c}, excluded.{c}) END""" for c in STATION_COLUMNS)
+
+    conn.execute(f"""
+        INSERT INTO {STATIONS_TABLE}
+        SELECT * FROM ({_station_rows(batch)})
+        ON CONFLICT (station_id) DO UPDATE SET {updates},
+            last_observation = greatest(excluded.last_observation, {STATIONS_TABLE}.last_observation)
+    """)
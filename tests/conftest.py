@@ -0,0 +1,80 @@
+# conftest.py
+
+import os
+import sys
+from datetime import datetime, timedelta
+import pytest
+
+# the modules live flat in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Scratch directory as the working directory (DB_PATH, ARCHIVE_PATH and SPOOL_PATH are relative)"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def db(workdir):
+    """Writer connection to a freshly initialized database"""
+    from db_utils import initialize_db, connect
+
+    initialize_db()
+    conn = connect()
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def make_rows():
+    """
+    make_rows(station_ids, start, count, step=timedelta(minutes=10), offset=0) -> observation dicts
+    Values are multiples of 1/4, so sums are exact and rollups compare equal whatever the
+    aggregation order.
+    """
+    def make(station_ids, start, count, step=timedelta(minutes=10), offset=0):
+        rows = []
+        for i in range(count):
+            for n, station_id in enumerate(station_ids):
+                k = i + offset + n
+                rows.append({
+                    "station_id": station_id,
+                    "observation_time": start + i * step,
+                    "neighborhood": f"Area {station_id}",
+                    "latitude": 47.5,
+                    "longitude": -122.25,
+                    "temp_f": 40 + (k % 17) * 0.25,
+                    "humidity": 50 + (k % 9) * 0.5,
+                    "wind_mph": (k % 5) * 0.75,
+                    "pressure_hg": 30 + (k % 3) * 0.25,
+                    "precip_today_in": (k % 4) * 0.25,
+                })
+        return rows
+    return make
+
+
+@pytest.fixture
+def midnight():
+    """Today 00:00, so tests can lay out whole days relative to now"""
+    return datetime.combine(datetime.now().date(), datetime.min.time())
+
+
+@pytest.fixture
+def api(workdir):
+    """
+    Flask test client on a freshly initialized database
+    Fill it with bulk_insert(rows) (its own short writer connection) before the first request:
+    the API's read-only handles can't share the process with an open writer.
+    """
+    from db_utils import initialize_db
+    import app
+
+    initialize_db()
+    app.cache.invalidate()
+    yield app.app.test_client()
+
+    # handles point at this test's file: the next test reopens in its own directory
+    app.db.close()
+    app.custom_db.close()
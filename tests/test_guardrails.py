@@ -0,0 +1,137 @@
+# test_guardrails.py
+
+import time
+import duckdb
+import pytest
+from config import TABLE_NAME, HOURLY_TABLE, STATIONS_TABLE
+from db_utils import bulk_insert
+from guardrails import QueryRejected, check_query, cap_rows, time_limit, bounded_cursor
+
+HEAVY_QUERY = "SELECT COUNT(*) FROM range(100000000000) t WHERE hash(range) % 7 = 3"
+
+
+### rejections
+
+@pytest.mark.parametrize("query", [
+    f"DELETE FROM {TABLE_NAME}",
+    f"DROP TABLE {TABLE_NAME}",
+    f"INSERT INTO {TABLE_NAME} (station_id) VALUES ('X')",
+    f"UPDATE {TABLE_NAME} SET temp_f = 0",
+    f"COPY {TABLE_NAME} TO 'out.csv'",
+    "ATTACH 'other.duckdb' AS other",
+    "PRAGMA database_list",
+    "SET threads = 64",
+    "not sql at all",
+])
+def test_only_select_is_allowed(db, query):
+    with pytest.raises(QueryRejected, match="Only SELECT"):
+        check_query(db, query)
+
+
+def test_one_statement_only(db):
+    with pytest.raises(QueryRejected, match="Exactly one statement"):
+        check_query(db, f"SELECT 1; SELECT * FROM {TABLE_NAME}")
+
+
+@pytest.mark.parametrize("query, message", [
+    ("SELECT * FROM backfill_checkpoints", "Table 'backfill_checkpoints'"),
+    ("SELECT * FROM information_schema.tables", "Table 'tables'"),
+    (f"SELECT * FROM system.main.{TABLE_NAME}", f"Table '{TABLE_NAME}'"),
+    ("SELECT * FROM duckdb_tables()", "Table function 'duckdb_tables'"),
+    ("SELECT * FROM read_csv_auto('/etc/passwd')", "Table function 'read_csv_auto'"),
+    ("SELECT * FROM read_parquet('data/archive/*/*/*/*.parquet')", "Table function 'read_parquet'"),
+    # hidden inside a subquery, a CTE or a join
+    (f"SELECT * FROM {TABLE_NAME} WHERE station_id IN (SELECT station_id FROM backfill_checkpoints)",
+     "Table 'backfill_checkpoints'"),
+    ("WITH t AS (SELECT * FROM duckdb_settings()) SELECT * FROM t", "Table function 'duckdb_settings'"),
+    (f"SELECT * FROM {TABLE_NAME} o JOIN read_json_auto('x.json') j USING (station_id)",
+     "Table function 'read_json_auto'"),
+])
+def test_tables_outside_the_allow_list(db, query, message):
+    with pytest.raises(QueryRejected, match=message):
+        check_query(db, query)
+
+
+def test_cross_products(db):
+    with pytest.raises(QueryRejected, match="CROSS_PRODUCT"):
+        check_query(db, f"SELECT * FROM {TABLE_NAME} a, {TABLE_NAME} b")
+    with pytest.raises(QueryRejected, match="CROSS_PRODUCT"):
+        check_query(db, f"SELECT * FROM {TABLE_NAME} CROSS JOIN {HOURLY_TABLE}")
+
+
+def test_missing_parameters(db):
+    query = f"SELECT * FROM {TABLE_NAME} WHERE station_id = ? AND temp_f > ?"
+    with pytest.raises(QueryRejected, match="Not enough parameters"):
+        check_query(db, query, ["KWA1"])
+    check_query(db, query, ["KWA1", 50.5])
+
+
+@pytest.mark.parametrize("query", [
+    f"SELECT * FROM {TABLE_NAME} WHERE temp_f > 80;",
+    f"SELECT o.*, s.neighborhood FROM {TABLE_NAME} o JOIN {STATIONS_TABLE} s USING (station_id)",
+    f"WITH hot AS (SELECT * FROM {TABLE_NAME} WHERE temp_f > 80) SELECT COUNT(*) FROM hot",
+    f"SELECT * FROM main.{HOURLY_TABLE}",
+    "SELECT * FROM range(10)",
+])
+def test_allowed_queries_pass(db, query):
+    check_query(db, query)
+
+
+### limits
+
+def test_cap_rows():
+    conn = duckdb.connect()
+    assert len(conn.execute(cap_rows("SELECT * FROM range(100);", 7)).fetchall()) == 7
+    assert len(conn.execute(cap_rows("SELECT * FROM range(3)", 7)).fetchall()) == 3
+
+
+def test_time_limit_interrupts():
+    conn = duckdb.connect()
+    start = time.perf_counter()
+    with pytest.raises(duckdb.InterruptException):
+        with time_limit(conn, 0.2):
+            conn.execute(HEAVY_QUERY).fetchall()
+    assert time.perf_counter() - start < 5
+
+    # the connection is usable afterwards, and a quick query isn't interrupted
+    with time_limit(conn, 0.2):
+        assert conn.execute("SELECT 42").fetchone() == (42,)
+    time.sleep(0.3)
+    assert conn.execute("SELECT 1").fetchone() == (1,)
+
+
+### API
+
+def test_custom_rejections(api, make_rows, midnight):
+    bulk_insert(make_rows(["KWA1"], midnight, 1))
+
+    response = api.post("/api/custom", json={"query": f"DELETE FROM {TABLE_NAME}"})
+    assert response.status_code == 403
+    assert response.get_json()["status"] == "ERROR"
+
+    response = api.post("/api/custom", json={"query": "SELECT * FROM duckdb_settings()"})
+    assert response.status_code == 403
+
+    response = api.post("/api/custom", json={"query": f"SELECT * FROM {TABLE_NAME} WHERE station_id = ?"})
+    assert response.status_code == 403
+
+    assert api.post("/api/custom", json={"params": []}).status_code == 400
+
+    response = api.post("/api/custom", json={"query": f"SELECT station_id, temp_f FROM {TABLE_NAME}"})
+    assert response.status_code == 200
+    assert response.get_json()["count"] == 1
+
+
+def test_custom_timeout(api, make_rows, midnight, monkeypatch):
+    import app
+
+    bulk_insert(make_rows(["KWA1"], midnight, 1))
+    monkeypatch.setattr(app, "custom_cursor", bounded_cursor(app.custom_db.cursor, 0.2))
+
+    response = api.post("/api/custom", json={"query": HEAVY_QUERY})
+    assert response.status_code == 504
+    assert "cancelled" in response.get_json()["error"]
+
+    # the next query on the same cursor runs normally
+    response = api.post("/api/custom", json={"query": f"SELECT COUNT(*) AS n FROM {TABLE_NAME}"})
+    assert response.get_json()["data"] == [{"n": 1}]
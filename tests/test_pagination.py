@@ -0,0 +1,132 @@
+# test_pagination.py
+
+from datetime import datetime, timedelta
+import pyarrow as pa
+import pytest
+from config import TABLE_NAME
+from db_utils import bulk_insert
+from pagination import KEYSET_ORDER, encode_cursor, decode_cursor, keyset_filter, next_cursor
+
+STATIONS = ["KWA1", "KWA2", "KWA3"]
+
+
+### cursors
+
+def test_cursor_round_trip():
+    time = datetime(2024, 3, 1, 12, 30, 15, 123456)
+    token = encode_cursor(time, "KWA1")
+    assert "=" not in token
+    assert decode_cursor(token) == (time, "KWA1")
+
+
+@pytest.mark.parametrize("token", ["garbage", "!!!", encode_cursor(datetime(2024, 1, 1), "KWA1")[:-3],
+                                   "WyJub3QgYSB0aW1lIiwgIktXQTEiXQ", "WzFd"])
+def test_invalid_cursor_is_a_value_error(token):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        keyset_filter(token)
+
+
+def test_first_page_has_no_filter():
+    assert keyset_filter(None) == ("TRUE", [])
+    assert keyset_filter("") == ("TRUE", [])
+
+
+def test_next_cursor_only_for_full_pages():
+    time = datetime(2024, 3, 1)
+    page = pa.table({"observation_time": [time, time], "station_id": ["KWA2", "KWA1"]})
+    assert next_cursor(page, 2) == encode_cursor(time, "KWA1")
+    assert next_cursor(page, 3) is None
+    assert next_cursor(page.slice(0, 0), 0) is None
+
+
+### paging over the table
+
+def _pages(conn, limit):
+    """Every page of the observations table, as lists of (observation_time, station_id)"""
+    pages, token = [], None
+    while True:
+        condition, params = keyset_filter(token)
+        page = conn.execute(f"""
+            SELECT observation_time, station_id FROM {TABLE_NAME}
+            WHERE {condition}
+            ORDER BY {KEYSET_ORDER}
+            LIMIT ?
+        """, params + [limit]).fetch_arrow_table()
+        pages.append(list(zip(*page.to_pydict().values())))
+        token = next_cursor(page, limit)
+        if token is None:
+            return pages
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 4, 7, 30, 100])
+def test_pages_cover_every_row_once(db, make_rows, midnight, limit):
+    # every time is shared by all stations, so page boundaries fall inside ties
+    bulk_insert(make_rows(STATIONS, midnight - timedelta(hours=1), 10, step=timedelta(minutes=5)), conn=db)
+    everything = db.execute(f"SELECT observation_time, station_id FROM {TABLE_NAME} ORDER BY {KEYSET_ORDER}").fetchall()
+
+    pages = _pages(db, limit)
+    assert [row for page in pages for row in page] == everything
+    assert all(len(page) == limit for page in pages[:-1])
+    # a total that divides evenly ends on an empty page rather than a cursor to nowhere
+    assert len(pages[-1]) == len(everything) % limit
+
+
+def test_rows_added_behind_the_cursor_do_not_shift_pages(db, make_rows, midnight):
+    start = midnight - timedelta(hours=1)
+    bulk_insert(make_rows(STATIONS, start, 4, step=timedelta(minutes=5)), conn=db)
+
+    condition, params = keyset_filter(None)
+    first = db.execute(f"SELECT observation_time, station_id FROM {TABLE_NAME} WHERE {condition} "
+                       f"ORDER BY {KEYSET_ORDER} LIMIT 5", params).fetchall()
+    token = encode_cursor(*first[-1])
+
+    # newer rows arrive between two page requests
+    bulk_insert(make_rows(STATIONS, start + timedelta(hours=2), 3), conn=db)
+
+    condition, params = keyset_filter(token)
+    rest = db.execute(f"SELECT observation_time, station_id FROM {TABLE_NAME} WHERE {condition} "
+                      f"ORDER BY {KEYSET_ORDER}", params).fetchall()
+    assert not set(first) & set(rest)
+    assert len(first) + len(rest) == 4 * len(STATIONS)
+
+
+### API
+
+def test_recent_pages(api, make_rows):
+    bulk_insert(make_rows(STATIONS, datetime.now() - timedelta(hours=2), 5, step=timedelta(minutes=10)))
+
+    seen, token = [], None
+    while True:
+        query = {"limit": 4, **({"cursor": token} if token else {})}
+        body = api.get("/api/recent", query_string=query).get_json()
+        seen += [(row["observation_time"], row["station_id"]) for row in body["data"]]
+        token = body["next_cursor"]
+        if token is None:
+            break
+
+    assert len(seen) == len(set(seen)) == 5 * len(STATIONS)
+    assert seen == sorted(seen, reverse=True)
+
+
+def test_recent_rejects_a_bad_cursor(api, make_rows, midnight):
+    bulk_insert(make_rows(STATIONS, midnight, 1))
+
+    response = api.get("/api/recent", query_string={"cursor": "garbage"})
+    assert response.status_code == 400
+    assert "Invalid cursor" in response.get_json()["error"]
+
+
+def test_custom_query_pages(api, make_rows, midnight):
+    bulk_insert(make_rows(STATIONS, midnight - timedelta(hours=1), 3, step=timedelta(minutes=5)))
+    query = f"SELECT observation_time, station_id, temp_f FROM {TABLE_NAME} WHERE station_id <> ?"
+
+    rows, token = [], None
+    while True:
+        body = api.post("/api/custom", json={"query": query, "params": ["KWA3"], "page_size": 2,
+                                             **({"cursor": token} if token else {})}).get_json()
+        rows += [(row["observation_time"], row["station_id"]) for row in body["data"]]
+        token = body["next_cursor"]
+        if token is None:
+            break
+
+    assert len(rows) == len(set(rows)) == 3 * 2
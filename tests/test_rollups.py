@@ -0,0 +1,141 @@
+# test_rollups.py
+
+from datetime import timedelta
+from config import TABLE_NAME, HOURLY_TABLE, DAILY_TABLE, LATEST_TABLE, OBSERVATIONS_VIEW
+from db_utils import bulk_insert
+from rollups import rebuild_rollups, daily_stats_sql
+from latest import rebuild_latest
+from archive import archive_observations, archive_cutoff
+
+STATIONS = ["KWA1", "KWA2", "KWA3"]
+
+
+def _snapshot(conn):
+    """Rollups and latest as sorted row lists"""
+    return {table: sorted(conn.execute(f"SELECT * FROM {table}").fetchall(), key=lambda row: (row[0], row[1]))
+            for table in (HOURLY_TABLE, DAILY_TABLE, LATEST_TABLE)}
+
+
+def _assert_matches_rebuild(conn):
+    incremental = _snapshot(conn)
+    rebuild_rollups(conn)
+    rebuild_latest(conn)
+    rebuilt = _snapshot(conn)
+
+    for table in rebuilt:
+        assert incremental[table] == rebuilt[table], table
+
+
+def _observations(conn, source=OBSERVATIONS_VIEW):
+    return conn.execute(f"SELECT COUNT(*) FROM {source}").fetchone()[0]
+
+
+### incremental vs rebuild
+
+def test_late_and_replaced_batches_match_rebuild(db, make_rows, midnight):
+    start = midnight - timedelta(days=2)
+    bulk_insert(make_rows(STATIONS, start, 200), conn=db)
+
+    # late rows inside hours and days that already have rollups
+    bulk_insert(make_rows(STATIONS, start + timedelta(minutes=5), 100), conn=db)
+    # re-ingest of a slice with other values
+    stats = bulk_insert(make_rows(STATIONS, start + timedelta(hours=10), 30, offset=7), conn=db, mode="replace")
+    assert stats["inserted"] == 30 * len(STATIONS)
+    # re-ingest without replace is a no-op
+    assert bulk_insert(make_rows(STATIONS, start, 50, offset=3), conn=db)["inserted"] == 0
+
+    assert db.execute(f"SELECT SUM(observations) FROM {DAILY_TABLE}").fetchone()[0] == _observations(db)
+    _assert_matches_rebuild(db)
+
+
+def test_latest_keeps_the_newest_observation(db, make_rows, midnight):
+    newest = midnight - timedelta(hours=1)
+    bulk_insert(make_rows(["KWA1"], newest, 1), conn=db)
+
+    # an older row arriving later doesn't replace it
+    bulk_insert(make_rows(["KWA1"], newest - timedelta(hours=5), 1, offset=4), conn=db)
+    assert db.execute(f"SELECT observation_time FROM {LATEST_TABLE}").fetchall() == [(newest,)]
+
+    # a replaced version of the same observation does
+    row = make_rows(["KWA1"], newest, 1, offset=5)
+    bulk_insert(row, conn=db, mode="replace")
+    assert db.execute(f"SELECT temp_f FROM {LATEST_TABLE}").fetchone()[0] == row[0]["temp_f"]
+
+    _assert_matches_rebuild(db)
+
+
+### archive
+
+def test_rollups_cover_archived_days(db, make_rows, midnight):
+    start = midnight - timedelta(days=6)
+    bulk_insert(make_rows(STATIONS, start, 24 * 5, step=timedelta(hours=1)), conn=db)
+    total = _observations(db)
+    before = _snapshot(db)
+
+    moved = archive_observations(days=3)
+    assert moved > 0
+    assert archive_cutoff(db) == midnight - timedelta(days=3)
+    assert _observations(db, TABLE_NAME) == total - moved
+    assert _observations(db) == total
+
+    # archiving moves rows, it doesn't change what they add up to
+    assert _snapshot(db) == before
+    _assert_matches_rebuild(db)
+
+
+def test_reingest_into_archived_days(db, make_rows, midnight):
+    start = midnight - timedelta(days=6)
+    rows = make_rows(STATIONS, start, 24 * 5, step=timedelta(hours=1))
+    bulk_insert(rows, conn=db)
+    archive_observations(days=3)
+    total = _observations(db)
+
+    # archived rows are never written again, in either mode
+    archived = [row for row in rows if row["observation_time"] < midnight - timedelta(days=3)]
+    assert bulk_insert(archived, conn=db)["inserted"] == 0
+    assert bulk_insert(archived, conn=db, mode="replace")["inserted"] == 0
+
+    # new rows between archived ones land in the hot table and in the archived days' rollups
+    late = make_rows(STATIONS, start + timedelta(minutes=30), 24, step=timedelta(hours=1), offset=2)
+    assert bulk_insert(late, conn=db)["inserted"] == len(late)
+    assert _observations(db) == total + len(late)
+    assert db.execute(f"SELECT SUM(observations) FROM {DAILY_TABLE}").fetchone()[0] == total + len(late)
+
+    _assert_matches_rebuild(db)
+
+
+### readers
+
+def test_daily_stats_end_is_exclusive(db, make_rows, midnight):
+    start = midnight - timedelta(days=4)
+    # hourly rows, midnight included, plus a partial day before the first whole one
+    bulk_insert(make_rows(STATIONS, start - timedelta(hours=6), 24 * 4 + 6, step=timedelta(hours=1)), conn=db)
+
+    def observations(start, end):
+        sql, params = daily_stats_sql(start, end)
+        return db.execute(f"SELECT COALESCE(SUM(observations), 0) FROM ({sql})", params).fetchone()[0]
+
+    split = midnight - timedelta(days=2)
+    whole = observations(start - timedelta(hours=3), midnight)
+    assert whole == 3 * (24 * 4 + 3)
+    # back-to-back windows, split at midnight and mid-day, count every row once
+    assert observations(start - timedelta(hours=3), split) + observations(split, midnight) == whole
+    noon = split + timedelta(hours=12)
+    assert observations(start - timedelta(hours=3), noon) + observations(noon, midnight) == whole
+    # a window shorter than a day
+    assert observations(split, split + timedelta(hours=1)) == len(STATIONS)
+
+
+### API
+
+def test_summary(api, make_rows, midnight):
+    bulk_insert(make_rows(STATIONS, midnight - timedelta(days=2), 48, step=timedelta(hours=1)))
+
+    body = api.get("/api/summary", query_string={"days": 3, "station_id": "KWA1"}).get_json()
+    assert body["summary"]["station_id"] == "KWA1"
+    assert body["summary"]["days_covered"] == 2
+
+    for query in ({"days": "a week"}, {"days": "1.5"}):
+        response = api.get("/api/summary", query_string=query)
+        assert response.status_code == 400
+        assert response.get_json()["status"] == "ERROR"
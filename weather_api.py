@@ -2,9 +2,12 @@
 
 import requests
 import os
-import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from datetime import datetime
+from config import CURRENT_URL, HISTORY_URL, FETCH_WORKERS, API_UNITS
+from parsing import parse_observations
+import http_client
+import metrics
 
 # load env variables
 load_dotenv()
@@ -27,76 +30,117 @@ STATIONS = [
 # currently built to handle multiple stations, or ID as entered when UDF called
 def get_current_conditions(station_id):
     """Fetch current weather from PWS through weather underground API"""
-    base_url = f"https://api.weather.com/v2/pws/observations/current"
+    base_url = CURRENT_URL
     
     # for single station replace "stationId": STATION_ID
     params = {
         "stationId": station_id,
         "format": "json",
-        "units": "e",
+        "units": API_UNITS,
         "apiKey": API_KEY
     }
 
     try:
-        response = requests.get(base_url, params=params)
-        response.raise_for_status() # raise exception for HTTP errors
-
-        data = response.json()
-
-        # Extract relevant details
-        observation = data.get("observations", [{}])[0]
+        # pooled session: rate limit, timeouts and retries handled there
+        response = http_client.get(base_url, params=params)
 
         # Format the data for DB
-        weather_data = {
-            "observation_time": datetime.fromisoformat(observation.get("obsTimeLocal")),
-            "station_id": observation.get("stationID"),
-            "longitude": observation.get("lon"),
-            "latitude": observation.get("lat"),
-            "neighborhood": observation.get("neighborhood"),
-            "temp_f": observation.get("imperial", {}).get("temp"),
-            "heat_index": observation.get("imperial", {}).get("heatIndex"),
-            "wind_chill": observation.get("imperial", {}).get("windChill"),
-            "dew_point": observation.get("imperial", {}).get("dewpt"),
-            "humidity": observation.get("humidity"),
-            "wind_degrees": observation.get("winddir"),
-            "wind_mph": observation.get("imperial", {}).get("windSpeed"),
-            "wind_gust_mph": observation.get("imperial", {}).get("windGust"),
-            "pressure_hg": observation.get("imperial", {}).get("pressure"),
-            "precip_today_in": observation.get("imperial", {}).get("precipTotal"),
-            "precip_rate_in": observation.get("imperial", {}).get("precipRate"),
-            "collection_time": datetime.now().isoformat()
-        }
-
-        return weather_data
+        observations = parse_observations(response.content, kind="current", units=API_UNITS,
+                                          station_id=station_id)
+        if observations.num_rows == 0:
+            print(f"No current observation for {station_id}")
+            metrics.inc("fetch_failures_total", kind="current")
+            return None
+
+        return observations.to_pylist()[0]
     
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, ValueError) as e:
         print(f"Error fetching weather data: {e}")
+        metrics.inc("fetch_failures_total", kind="current")
+        return None
+
+
+### history: one station, one day
+
+def get_historical_data(station_id, date_str):
+    """
+    Fetch every observation recorded by a station on one day (date_str as YYYYMMDD)
+    Returns an Arrow table laid out like weather_observations (no rows for a day without
+    data) or None if the request failed
+    """
+    params = {
+        "stationId": station_id,
+        "format": "json",
+        "units": API_UNITS,
+        "date": date_str,
+        "apiKey": API_KEY
+    }
+
+    try:
+        response = http_client.get(HISTORY_URL, params=params)
+
+        # days without data come back as 204 / empty body
+        if response.status_code == 204 or not response.content:
+            return parse_observations([], station_id=station_id)
+
+        # the whole observations array in one columnar pass
+        return parse_observations(response.content, kind="history", units=API_UNITS, station_id=station_id)
+
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"Error fetching history for {station_id} on {date_str}: {e}")
+        metrics.inc("fetch_failures_total", kind="history")
         return None
 
 
 ### update to utilize multiple stations
 
-def get_current_conditions_multiple():
-    """Fetch current conditions for all configured stations"""
-    weather_data = []
-    
+def _fetch_station(station):
+    """Fetch one configured station, logging the outcome"""
+    print(f"Fetching data for station {station['id']} ({station['name']})...")
+    data = get_current_conditions(station["id"])
+
+    if data:
+        print(f"  Success: {data['temp_f']}°F at {data['neighborhood']}")
+    else:
+        print(f"  Failed to retrieve data for station {station['id']}")
+
+    return data
+
+
+def get_current_conditions_multiple(concurrent=True, max_workers=None, sink=None):
+    """
+    Fetch current conditions for all configured stations
+    Requests run on a bounded thread pool, paced by the per-host token bucket.
+    Results keep the order of STATIONS; concurrent=False fetches one at a time.
+    sink(data), e.g. IngestPipeline.put, receives each station's result as soon as it arrives.
+    """
+    stations = []
     for station in STATIONS:
         if not station["id"]:
             print(f"Skipping station '{station['name']}' - no ID configured")
             continue
-            
-        print(f"Fetching data for station {station['id']} ({station['name']})...")
-        data = get_current_conditions(station["id"])
-        
+        stations.append(station)
+
+    if not stations:
+        return []
+
+    def fetch_and_sink(station):
+        data = _fetch_station(station)
         if data:
-            weather_data.append(data)
-            print(f"  Success: {data['temp_f']}°F at {data['neighborhood']}")
-        else:
-            print(f"  Failed to retrieve data for station {station['id']}")
-        
-        # Add a short delay to avoid rate limiting
-        time.sleep(1)
-    
+            sink(data)
+        return data
+
+    fetch = _fetch_station if sink is None else fetch_and_sink
+
+    if concurrent:
+        workers = min(max_workers or FETCH_WORKERS, len(stations))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="wu-fetch") as pool:
+            results = list(pool.map(fetch, stations))
+    else:
+        results = [fetch(station) for station in stations]
+
+    weather_data = [data for data in results if data]
+
     return weather_data
 
 # testing to ensure it works
@@ -1,62 +1,40 @@
 # weather_collector.py
 
 import requests
-import datetime
-import polars as pl
-from config import API_KEY, STATION_ID, BASE_URL
+import http_client
+from config import API_KEY, STATION_ID, BASE_URL, API_UNITS
 from db_utils import save_weather_data
+from parsing import parse_observations
+import metrics
 
 
 ### getting the weather
 def fetch_weather_data():
-    """ get yesterday's data from weather underground API"""
+    """ get the last day's observations from weather underground API, every row as an Arrow table"""
     params = {
         "stationId": STATION_ID,
         "format": "json",
-        "units": "e",
+        "units": API_UNITS,
         "apiKey": API_KEY
     }
 
     try:
-        response = requests.get(BASE_URL, params=params)
-        response.raise_for_status() # exception if occurs
+        response = http_client.get(BASE_URL, params=params)
 
-        data = response.json()
-
-        observation = data.get("observations", [{}])[0]
-
-        # extract data, format for DB
-        weather_data = {
-                "observation_time":     observation.get("obsTimeLocal"),
-                "station_id":           observation.get("stationID"),
-                "longitude":            observation.get("lon"),
-                "latitude":             observation.get("lat"),
-                "temp_f":               observation.get("imperial", {}).get("tempAvg"),
-                "heat_index":           observation.get("imperial", {}).get("heatindexAvg"),
-                "wind_chill":           observation.get("imperial", {}).get("windchillAvg"),
-                "dew_point":            observation.get("imperial", {}).get("dewptAvg"),
-                "humidity":             observation.get("humidityAvg"),
-                "wind_degrees":         observation.get("winddirAvg"),
-                "wind_mph":             observation.get("imperial", {}).get("windspeedAvg"),
-                "wind_gust_mph":        observation.get("imperial", {}).get("windgustAvg"),
-                "pressure_hg":          observation.get("imperial", {}).get("pressureMax"),
-                "precip_total":         observation.get("imperial", {}).get("precipTotal"),
-                "precip_rate":          observation.get("imperial", {}).get("precipRate"),
-                "collection_time":      datetime.datetime.now().isoformat()
-        }
-
-        return weather_data
+        # all ~288 observations of the day, parsed in one columnar pass
+        return parse_observations(response.content, kind="1day", units=API_UNITS, station_id=STATION_ID)
     
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, ValueError) as e:
         print(f"Error fetching weather data: {e}")
+        metrics.inc("fetch_failures_total", kind="1day")
         return None
     
 def collect_and_store_weather():
     """Collect weather data and store it in the db"""
     weather_data = fetch_weather_data()
 
-    if weather_data:
+    if weather_data is not None and weather_data.num_rows:
         save_weather_data(weather_data)
-        print(weather_data)
+        print(f"Collected {weather_data.num_rows} observations from {STATION_ID}")
     else:
         print("No data collected due to an error.")
\ No newline at end of file